@@ -0,0 +1,93 @@
+"""
+Параллельная обработка апдейтов QR-Находка
+
+1. Проверка порядка: PerUserUpdateProcessor получает пачку апдейтов от
+   нескольких пользователей вперемешку, обработчик спит случайное время —
+   у каждого пользователя апдейты должны завершиться в порядке прихода,
+   а разные пользователи — обрабатываться одновременно.
+2. Масштабирование: тот же сценарий, что в benchmarks.fake_telegram, при
+   задержке Bot API --api-latency и разном числе одновременно
+   обрабатываемых апдейтов. На одном ядре рост идёт примерно до 16: дальше
+   процессор съедают накладные расходы пула соединений httpx, а не ожидание
+   Bot API.
+
+Запуск: python -m benchmarks.bench_concurrency [--levels 1,4,16,64] [--api-latency MS]
+Код возврата 1 — порядок нарушен.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import sys
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from bot.processor import PerUserUpdateProcessor
+from benchmarks.fake_telegram import add_arguments, run_load
+
+
+def _update(update_id: int, user_id: int) -> Update:
+    message = Message(
+        message_id=update_id, date=datetime.now(),
+        chat=Chat(user_id, Chat.PRIVATE), from_user=User(user_id, False, f'User{user_id}'),
+    )
+    return Update(update_id=update_id, message=message)
+
+
+async def check_ordering(users: int = 20, per_user: int = 25, concurrency: int = 8) -> tuple:
+    """Вернуть (нарушений порядка, максимум одновременных обработок, оставшихся блокировок)."""
+    processor = PerUserUpdateProcessor(concurrency)
+    done      = {user: [] for user in range(users)}
+    running   = 0
+    peak      = 0
+
+    async def handle(user: int, seq: int):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(random.uniform(0, 0.003))
+        done[user].append(seq)
+        running -= 1
+
+    # Пользователи перемешаны, номера внутри пользователя идут по возрастанию.
+    updates = [(user, seq) for seq in range(per_user) for user in random.sample(range(users), users)]
+    tasks   = [
+        asyncio.create_task(processor.process_update(_update(i, user), handle(user, seq)))
+        for i, (user, seq) in enumerate(updates)
+    ]
+    await asyncio.gather(*tasks)
+
+    violations = sum(seqs != sorted(seqs) for seqs in done.values())
+    return violations, peak, processor.active_users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    parser.add_argument('--levels', default='1,4,16,64', help='значения --update-concurrency')
+    parser.set_defaults(api_latency=20.0, updates=1000, concurrency=64)
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    violations, peak, leftover = asyncio.run(check_ordering())
+    print(f"порядок: нарушений {violations}, одновременно до {peak}, блокировок осталось {leftover}")
+
+    print(f"\nBot API +{args.api_latency:.0f} ms, {args.updates} апдейтов, {args.concurrency} соединений")
+    print(f"{'параллельно':>12} {'апд/с':>8} {'p50, ms':>9} {'p99, ms':>9}")
+    for level in (int(x) for x in args.levels.split(',')):
+        args.update_concurrency = level
+        result    = run_load(args)
+        latencies = sorted(result['latencies'])
+        print(
+            f"{level:>12} {len(latencies) / result['elapsed']:>8.0f} "
+            f"{latencies[len(latencies) // 2] * 1000:>9.1f} "
+            f"{latencies[int(len(latencies) * 0.99)] * 1000:>9.1f}"
+        )
+
+    if violations or leftover:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Бенчмарк задержки обработчиков при конкурентных апдейтах
+
+Подаёт сканирования (found_handler) и /myitems в bot.handlers с заданной
+частотой и печатает p50/p99 задержки от прихода апдейта до ответа, а также
+p99 задержки event loop. Режим --blocking вызывает синхронный Database прямо
+в event loop — так работали обработчики раньше. На tmpfs запись почти
+бесплатна; чтобы увидеть влияние fsync, укажите --db-dir на реальном диске
+и DB_SYNCHRONOUS=FULL.
+
+Запуск: python -m benchmarks.bench_handlers [--updates N] [--rate N] [--db-dir DIR] [--blocking]
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import bot.handlers as handlers
+from database.async_db import AsyncDatabase
+from database.models import Database
+
+
+class _BlockingDatabase:
+    """Awaitable-обёртка, выполняющая запросы прямо в event loop."""
+
+    def __init__(self, db: Database):
+        self.sync = db
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return attr(*args, **kwargs)
+        return call
+
+    def close(self):
+        self.sync.close()
+
+
+async def _noop(*args, **kwargs):
+    return SimpleNamespace(photo=[], message_id=1)
+
+
+def _fake_update(user_id: int):
+    user = SimpleNamespace(
+        id=user_id, username=f'user{user_id}', full_name=f'User {user_id}', first_name='User'
+    )
+    message = SimpleNamespace(reply_text=_noop, reply_photo=_noop, edit_text=_noop, chat_id=user_id)
+    return SimpleNamespace(effective_user=user, message=message, callback_query=None)
+
+
+def _fake_context(args=None):
+    return SimpleNamespace(
+        args=args or [],
+        user_data={},
+        bot=SimpleNamespace(send_message=_noop, send_photo=_noop),
+    )
+
+
+async def _run(updates: int, rate: float, qr_ids: list) -> tuple:
+    """Открытая нагрузка: апдейты приходят с частотой rate, независимо от обработки."""
+    latencies = []
+    loop_lag  = []
+    done      = asyncio.Event()
+
+    async def heartbeat():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            loop_lag.append(time.perf_counter() - start - 0.001)
+
+    async def one(i: int, arrived: float):
+        user_id = 1000 + i
+        if i % 2:
+            qr_id = qr_ids[i % len(qr_ids)]
+            await handlers.found_handler(_fake_update(user_id), _fake_context(), qr_id)
+        else:
+            await handlers.myitems_handler(_fake_update(1 + i % len(qr_ids)), _fake_context())
+        latencies.append(time.perf_counter() - arrived)
+
+    await handlers.notifier.start(SimpleNamespace(send_message=_noop))
+    beat  = asyncio.create_task(heartbeat())
+    tasks = []
+    start = time.perf_counter()
+    for i in range(updates):
+        arrival = start + i / rate
+        delay   = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(i, arrival)))
+    await asyncio.gather(*tasks)
+    done.set()
+    await beat
+    await handlers.notifier.stop()
+    return latencies, loop_lag
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--updates',     type=int, default=2000)
+    parser.add_argument('--rate',        type=float, default=1000, help='апдейтов в секунду')
+    parser.add_argument('--owners',      type=int, default=50)
+    parser.add_argument('--db-dir',      default=None)
+    parser.add_argument('--blocking',    action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.db_dir) as tmp:
+        sync_db = Database(Path(tmp) / 'bench.db')
+        qr_ids  = []
+        for owner in range(1, args.owners + 1):
+            sync_db.create_user(owner, f'owner{owner}', f'Owner {owner}')
+            qr_ids.append(sync_db.create_item(owner)['qr_id'])
+
+        handlers.db = _BlockingDatabase(sync_db) if args.blocking else AsyncDatabase(sync_db)
+        latencies, loop_lag = asyncio.run(_run(args.updates, args.rate, qr_ids))
+        handlers.db.close()
+
+    mode = 'blocking' if args.blocking else 'async'
+    print(
+        f"{mode}: rate={args.rate:.0f}/s  "
+        f"p50={statistics.median(latencies) * 1000:.1f} ms  "
+        f"p99={_percentile(latencies, 0.99) * 1000:.1f} ms  "
+        f"loop lag p99={_percentile(loop_lag, 0.99) * 1000:.1f} ms"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Микро-бенчмарк: пул соединений против нового соединения на каждый запрос
+
+Запуск: python -m benchmarks.bench_pool [--iterations N] [--threads N]
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from database.models import Database
+
+
+def _workload(db: Database, user_id: int, qr_id: str):
+    db.user_exists(user_id)
+    db.get_item_by_qr(qr_id)
+    db.get_active_subscription(user_id)
+
+
+def _run(db: Database, iterations: int, threads: int, qr_id: str) -> float:
+    start = time.perf_counter()
+    if threads <= 1:
+        for i in range(iterations):
+            _workload(db, 1, qr_id)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda _: _workload(db, 1, qr_id), range(iterations)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--threads',    type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'bench.db'
+        seed = Database(path, pool_size=0)
+        seed.create_user(1, 'bench', 'Bench User')
+        seed.create_subscription(1, 'month_1', 30)
+        qr_id = seed.create_item(1)['qr_id']
+
+        for threads in (1, args.threads):
+            per_call = _run(Database(path, pool_size=0), args.iterations, threads, qr_id)
+            pooled_db = Database(path, pool_size=max(threads, 1))
+            pooled   = _run(pooled_db, args.iterations, threads, qr_id)
+            pooled_db.close()
+            print(
+                f"threads={threads:<2} per-call: {args.iterations / per_call:8.0f} ops/s   "
+                f"pool: {args.iterations / pooled:8.0f} ops/s   x{per_call / pooled:.1f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
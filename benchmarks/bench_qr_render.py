@@ -0,0 +1,47 @@
+"""
+Бенчмарк пропускной способности QRRenderer: коды в секунду от числа процессов
+
+Кэш отключён, каждый URL уникален — измеряется чистый рендер.
+
+Запуск: python -m benchmarks.bench_qr_render [--codes N] [--max-workers N]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from utils.qr_render import QRRenderer, render_png
+
+
+async def _render_all(renderer: QRRenderer, urls: list) -> float:
+    start = time.perf_counter()
+    await renderer.render_many(urls)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--codes',       type=int, default=400)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    urls = [f"https://t.me/QR_FinderBot?start=found_QRB{i:06d}" for i in range(args.codes)]
+
+    start = time.perf_counter()
+    for url in urls:
+        render_png(url)
+    inline = time.perf_counter() - start
+    print(f"inline      : {args.codes / inline:7.0f} codes/s")
+
+    workers = 1
+    while workers <= args.max_workers:
+        renderer = QRRenderer(workers=workers)
+        renderer.start()
+        elapsed = asyncio.run(_render_all(renderer, urls))
+        renderer.close()
+        print(f"workers={workers:<4}: {args.codes / elapsed:7.0f} codes/s")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Нагрузочный тест страницы сканирования (web/server.py)
+
+Запускает веб-сервер на временной базе в отдельных процессах (--workers),
+открывает --concurrency keep-alive соединений и шлёт смесь запросов:
+сканы действующих QR, сканы несуществующих кодов, /api/item, /qr/ и
+главную страницу со статистикой. Клиенты просят gzip и, с вероятностью
+--revalidate, присылают If-None-Match с уже полученным ETag — как браузер
+при повторном скане или CDN при перепроверке. Печатает запросы в секунду,
+p50/p99 задержки по маршрутам и объём полученных тел. На одном ядре клиент и сервер делят процессор —
+для честных цифр запускайте на машине с несколькими ядрами.
+
+Запуск: python -m benchmarks.bench_web [--requests N] [--concurrency N] [--workers N] [--items N]
+        [--revalidate 0..1]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import re
+import socket
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from database.models import Database
+from database.qr_ids import encode
+from web.server import run_web_server
+
+# Маршрут -> вес в смеси.
+MIX = {
+    'found':         60,
+    'found unknown': 20,
+    'api/item':      10,
+    'qr redirect':   5,
+    'index':         3,
+    'api/stats':     2,
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def build_requests(count: int, qr_ids: list, seed: int = 1) -> list:
+    rng    = random.Random(seed)
+    names  = list(MIX)
+    result = []
+    for _ in range(count):
+        name  = rng.choices(names, [MIX[n] for n in names])[0]
+        qr_id = rng.choice(qr_ids)
+        path  = {
+            'found':         f'/found/{qr_id}',
+            'found unknown': f'/found/{encode(10 ** 6 + rng.randrange(10 ** 6))}',
+            'api/item':      f'/api/item/{qr_id}',
+            'qr redirect':   f'/qr/{qr_id}',
+            'index':         '/',
+            'api/stats':     '/api/stats',
+        }[name]
+        result.append((name, path))
+    return result
+
+
+async def fetch_all(port: int, requests: list, concurrency: int, revalidate: float = 0.0) -> tuple:
+    """Выполнить запросы по concurrency keep-alive соединениям."""
+    queue     = asyncio.Queue()
+    latencies = defaultdict(list)
+    statuses  = Counter()
+    etags     = {}
+    received  = 0
+    rng       = random.Random(2)
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def client():
+        nonlocal received
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            while not queue.empty():
+                name, path = queue.get_nowait()
+                extra = ''
+                if path in etags and rng.random() < revalidate:
+                    extra = f"If-None-Match: {etags[path]}\r\n"
+                start = time.perf_counter()
+                writer.write(
+                    f"GET {path} HTTP/1.1\r\nHost: localhost\r\n"
+                    f"Accept-Encoding: gzip\r\n{extra}\r\n".encode()
+                )
+                await writer.drain()
+                head   = await reader.readuntil(b'\r\n\r\n')
+                length = re.search(rb'Content-Length: (\d+)', head)
+                length = int(length.group(1)) if length else 0
+                await reader.readexactly(length)
+                latencies[name].append(time.perf_counter() - start)
+                statuses[int(head[9:12])] += 1
+                received += length
+                etag = re.search(rb'ETag: ("[^"]+")', head)
+                if etag:
+                    etags[path] = etag.group(1).decode()
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, statuses, received
+
+
+async def _wait_ready(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def _percentile(values: list, q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests',    type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers',     type=int, default=1)
+    parser.add_argument('--items',       type=int, default=5000)
+    parser.add_argument('--revalidate',  type=float, default=0.5,
+                        help='доля повторных запросов с If-None-Match')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'web.db'
+        sync_db = Database(db_path)
+        sync_db.create_user(1, 'owner', 'Owner')
+        qr_ids = sync_db.create_items_bulk(1, args.items)
+        sync_db.close()
+
+        port   = _free_port()
+        server = multiprocessing.Process(
+            target=run_web_server, args=('127.0.0.1', port, args.workers, db_path)
+        )
+        server.start()
+        try:
+            asyncio.run(_wait_ready(port))
+            requests = build_requests(args.requests, qr_ids)
+            elapsed, latencies, statuses, received = asyncio.run(
+                fetch_all(port, requests, args.concurrency, args.revalidate)
+            )
+        finally:
+            server.terminate()
+            server.join()
+
+    print(
+        f"\n{args.requests} запросов за {elapsed:.2f} с — {args.requests / elapsed:.0f} запр/с "
+        f"({args.workers} процессов, {args.concurrency} соединений)"
+    )
+    print(f"{'маршрут':<15} {'запросов':>8} {'p50, ms':>9} {'p99, ms':>9}")
+    for name in MIX:
+        values = sorted(latencies[name])
+        print(
+            f"{name:<15} {len(values):>8} {_percentile(values, 0.5) * 1000:>9.2f} "
+            f"{_percentile(values, 0.99) * 1000:>9.2f}"
+        )
+    print(f"статусы: {dict(statuses)}, тел получено: {received // 1024} КиБ")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Регрессионная проверка планов запросов горячих методов Database
+
+Вызывает каждый горячий метод на временной базе, перехватывает выполненные
+SQL-запросы и прогоняет их через EXPLAIN QUERY PLAN. Завершается с кодом 1,
+если хоть один запрос читает таблицу полным проходом (SCAN).
+
+Запуск: python -m benchmarks.check_query_plans
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+from database.models import Database
+
+
+def _hot_calls(db: Database, qr_id: str) -> dict:
+    return {
+        'user_exists':             lambda: db.user_exists(1),
+        'get_user':                lambda: db.get_user(1),
+        'get_active_subscription': lambda: db.get_active_subscription(1),
+        'mark_qr_used':            lambda: db.mark_qr_used(1),
+        'get_user_items':          lambda: db.get_user_items(1),
+        'get_item_by_qr':          lambda: db.get_item_by_qr(qr_id),
+        'lookup_qr':               lambda: db.lookup_qr(qr_id),
+        'create_finding':          lambda: db.create_finding(qr_id, 1, 2, 'Finder'),
+        'resolve_scan':            lambda: db.resolve_scan(qr_id, 2, 'Finder'),
+        'get_user_dashboard':      lambda: db.get_user_dashboard(1),
+        'get_user_history':        lambda: db.get_user_history(1),
+        'get_user_findings/owner': lambda: db.get_user_findings(1, as_owner=True),
+        'get_user_findings/finder': lambda: db.get_user_findings(2, as_owner=False),
+        'delete_item':             lambda: db.delete_item(qr_id, 1),
+    }
+
+
+def check(db: Database, qr_id: str) -> list:
+    """Вернуть список (метод, запрос, строка плана) для запросов со SCAN."""
+    failures = []
+    with db.connection() as conn:
+        for name, call in _hot_calls(db, qr_id).items():
+            statements = []
+            conn.set_trace_callback(statements.append)
+            try:
+                call()
+            finally:
+                conn.set_trace_callback(None)
+
+            for sql in statements:
+                head = sql.lstrip().split(None, 1)[0].upper()
+                if head not in ('SELECT', 'UPDATE', 'DELETE', 'INSERT'):
+                    continue
+                for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}'):
+                    detail = row['detail']
+                    if detail.startswith('SCAN'):
+                        failures.append((name, ' '.join(sql.split()), detail))
+    return failures
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'plans.db', pool_size=1, cache_enabled=False)
+        db.create_user(1, 'owner', 'Owner')
+        db.create_user(2, 'finder', 'Finder')
+        db.create_subscription(1, 'month_1', 30)
+        qr_id = db.create_item(1)['qr_id']
+
+        failures = check(db, qr_id)
+        db.close()
+
+    for name, sql, detail in failures:
+        print(f"FAIL {name}: {detail}\n     {sql}")
+    if failures:
+        return 1
+    print("OK: горячие запросы используют индексы")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Проверка числа обращений к базе на один апдейт
+
+Прогоняет основные обработчики на временной базе и считает, сколько раз
+каждый из них обратился к Database (один вызов метода — одна поездка в
+поток базы; ответы из кэша, как и в AsyncDatabase, не считаются). Перед
+каждым сценарием кэши очищаются: бюджет — для холодного пути, а не для
+того, что прогрел предыдущий сценарий. Индекс сканирований заново
+загружается, как при старте бота (warm_scan_index в main.py).
+Завершается с кодом 1, если обработчик превысил бюджет.
+
+Запуск: python -m benchmarks.count_handler_queries
+"""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import bot.handlers as handlers
+from benchmarks.bench_handlers import _fake_context, _fake_update, _noop
+from database.models import Database, to_ts
+from database.qr_ids import encode
+from utils.cache import MISS
+
+# Обработчик -> допустимое число обращений к базе.
+#
+# /start — одна запись даже для известного пользователя: create_user
+# (INSERT OR IGNORE) идёт пакетом через очередь записи, а предварительная
+# проверка user_exists добавила бы новичкам вторую поездку.
+#
+# /additem — 2: чтение подписки и create_item (с подпиской в кэше — 1).
+# Слить их в одну запись нельзя без транзакции записи на каждый ответ
+# «сначала купите» и «QR уже создан»; последний читает список QR
+# отдельно (ещё +1).
+#
+# cb:send_qr без file_id — 2: get_item_by_qr и set_qr_file_id после
+# загрузки картинки. cb:do_delete — 2: delete_item и get_user_dashboard
+# для обновлённого списка.
+BUDGETS = {
+    '/start':          1,
+    '/start found_':   1,
+    'found malformed': 0,
+    'found unissued':  0,
+    '/buy':            1,
+    '/myitems':        1,
+    '/additem':        2,
+    '/history':        1,
+    'cb:packages':     1,
+    'cb:my_items':     1,
+    'cb:paid':         1,
+    'cb:send_qr':      1,
+    'cb:send_qr new':  2,
+    'cb:do_delete':    2,
+}
+
+
+class _CountingDatabase:
+    """Awaitable-обёртка над Database, считающая вызовы методов."""
+
+    def __init__(self, db: Database):
+        self.sync  = db
+        self.calls = []
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            if name in self.sync.CACHED_READS:
+                cached = self.sync.peek_cached(name, *args, **kwargs)
+                if cached is not MISS:
+                    return cached
+            self.calls.append(name)
+            return attr(*args, **kwargs)
+        return call
+
+
+def _fake_query(user_id: int, data: str):
+    update = _fake_update(user_id)
+    update.callback_query = SimpleNamespace(
+        from_user=update.effective_user, data=data, message=update.message, answer=_noop
+    )
+    return update
+
+
+async def _uploaded(*args, **kwargs):
+    # Telegram вернул file_id загруженной картинки.
+    return SimpleNamespace(photo=[SimpleNamespace(file_id='uploaded-file-id')], message_id=1)
+
+
+def _upload_context():
+    context = _fake_context()
+    context.bot.send_photo = _uploaded
+    return context
+
+
+def _cold(db: Database):
+    for cache in (db.users_cache, db.subscriptions_cache, db.stats_cache,
+                  db.scan_index.known, db.scan_index.unknown):
+        cache.clear()
+    db.warm_scan_index()
+
+
+def _scenarios(owner: int, finder: int, qr_id: str, new_qr_id: str) -> dict:
+    return {
+        '/start':          lambda: handlers.start_handler(_fake_update(owner), _fake_context()),
+        '/start found_':   lambda: handlers.start_handler(_fake_update(finder), _fake_context([f'found_{qr_id}'])),
+        'found malformed': lambda: handlers.found_handler(_fake_update(finder), _fake_context(), 'QRZZZZZZZ'),
+        'found unissued':  lambda: handlers.found_handler(_fake_update(finder), _fake_context(), encode(10 ** 6)),
+        '/buy':            lambda: handlers.buy_handler(_fake_update(owner), _fake_context()),
+        '/myitems':        lambda: handlers.myitems_handler(_fake_update(owner), _fake_context()),
+        '/additem':        lambda: handlers.additem_handler(_fake_update(owner), _fake_context()),
+        '/history':        lambda: handlers.history_handler(_fake_update(owner), _fake_context()),
+        'cb:packages':     lambda: handlers.button_handler(_fake_query(owner, 'packages'), _fake_context()),
+        'cb:my_items':     lambda: handlers.button_handler(_fake_query(owner, 'my_items'), _fake_context()),
+        'cb:paid':         lambda: handlers.button_handler(_fake_query(owner, 'paid:month_1'), _fake_context()),
+        'cb:send_qr':      lambda: handlers.button_handler(_fake_query(owner, f'send_qr:{qr_id}'), _fake_context()),
+        'cb:send_qr new':  lambda: handlers.button_handler(_fake_query(owner, f'send_qr:{new_qr_id}'), _upload_context()),
+        'cb:do_delete':    lambda: handlers.button_handler(_fake_query(owner, f'do_delete:{new_qr_id}'), _fake_context()),
+    }
+
+
+async def _count(counting: _CountingDatabase, scenarios: dict) -> dict:
+    result = {}
+    for name, run in scenarios.items():
+        _cold(counting.sync)
+        counting.calls = []
+        await run()
+        result[name] = list(counting.calls)
+    return result
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(Path(tmp) / 'count.db')
+        sync_db.create_user(1, 'owner', 'Owner')
+        sync_db.create_subscription(1, 'month_1', 30)
+        qr_id = sync_db.create_item(1, expires_at=to_ts('2099-01-01'))['qr_id']
+        sync_db.set_qr_file_id(qr_id, 'cached-file-id')
+        new_qr_id = sync_db.create_item(1, expires_at=to_ts('2099-01-01'))['qr_id']
+        sync_db.build_qr_filter()
+
+        counting    = _CountingDatabase(sync_db)
+        handlers.db = counting
+        try:
+            calls = asyncio.run(_count(counting, _scenarios(1, 2, qr_id, new_qr_id)))
+        finally:
+            handlers.qr_renderer.close()
+            sync_db.close()
+
+    failed = False
+    for name, names in calls.items():
+        budget = BUDGETS[name]
+        mark   = 'ok  ' if len(names) <= budget else 'FAIL'
+        failed = failed or len(names) > budget
+        print(f"{mark} {name:<15} {len(names)}/{budget}  {', '.join(names)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+Локальная подмена Telegram для офлайн-нагрузки webhook-режима
+
+FakeTelegram отвечает на вызовы Bot API (getMe, sendMessage, sendPhoto,
+editMessageText, answerCallbackQuery, setWebhook, ...) правдоподобными
+объектами и считает их; getUpdates отдаёт апдейты, поставленные через
+push(), с long polling, как настоящий Telegram (этим пользуется
+benchmarks.load). main() поднимает бота в режиме webhook поверх
+временной базы, шлёт в webhook синтетические апдейты с заданной
+параллельностью и печатает пропускную способность.
+
+Запуск: python -m benchmarks.fake_telegram [--updates N] [--concurrency N] [--owners N]
+        [--update-concurrency N] [--api-latency MS]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import tempfile
+import time
+from collections import Counter, deque
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import bot.handlers as handlers
+from bot.webhook import HttpServer
+from config.config import BOT_USERNAME, UPDATE_CONCURRENCY, WEBHOOK_SECRET
+from database.async_db import AsyncDatabase
+from database.models import Database
+
+TOKEN = '123456:FAKE'
+
+_MULTIPART_FIELD = re.compile(rb'name="([^"]+)"\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', re.S)
+
+
+def _form(headers: dict, body: bytes) -> dict:
+    ctype = headers.get('content-type', '')
+    if ctype.startswith('multipart/form-data'):
+        return {
+            name.decode(): value.decode('utf-8', 'replace')
+            for name, value in _MULTIPART_FIELD.findall(body)
+            if len(value) < 4096
+        }
+    if ctype.startswith('application/json'):
+        return json.loads(body or b'{}')
+    return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+
+class FakeTelegram:
+    """Bot API на localhost: все вызовы успешны, счётчики — в calls."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        self.http        = HttpServer(self._handle, host, port)
+        self.latency     = latency
+        self.calls       = Counter()
+        self.delivered   = {}       # update_id -> perf_counter() первой выдачи в getUpdates
+        self._message_id = 0
+        self._updates    = deque()
+        self._arrived    = asyncio.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.http.host}:{self.http.port}"
+
+    async def start(self):
+        await self.http.start()
+
+    async def stop(self):
+        self._arrived.set()
+        await self.http.stop()
+
+    def push(self, updates: list):
+        """Поставить апдейты в очередь getUpdates."""
+        self._updates.extend(updates)
+        self._arrived.set()
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get('offset') or 0)
+        limit  = int(params.get('limit') or 100)
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                return []
+        batch = [self._updates[i] for i in range(min(limit, len(self._updates)))]
+        now   = time.perf_counter()
+        for update in batch:
+            self.delivered.setdefault(update['update_id'], now)
+        return batch
+
+    def _message(self, params: dict, **extra) -> dict:
+        self._message_id += 1
+        chat_id = int(params.get('chat_id') or 1)
+        message = {
+            'message_id': self._message_id,
+            'date':       int(time.time()),
+            'chat':       {'id': chat_id, 'type': 'private'},
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        message.update(extra)
+        return message
+
+    async def _handle(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        api_method = path.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = _form(headers, body)
+
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'QR-Finder', 'username': BOT_USERNAME}
+        elif api_method in ('sendMessage', 'editMessageText'):
+            result = self._message(params)
+        elif api_method == 'sendPhoto':
+            n = self._message_id + 1
+            result = self._message(params, photo=[
+                {'file_id': f'photo-{n}', 'file_unique_id': f'u{n}', 'width': 290, 'height': 290},
+            ])
+        elif api_method == 'sendDocument':
+            n = self._message_id + 1
+            result = self._message(params, document={'file_id': f'doc-{n}', 'file_unique_id': f'd{n}'})
+        elif api_method == 'getUpdates':
+            result = await self._get_updates(params)
+        else:
+            result = True
+        return 200, 'application/json', json.dumps({'ok': True, 'result': result}).encode()
+
+
+class Updates:
+    """Синтетические апдейты в формате Telegram."""
+
+    def __init__(self):
+        self._update_id = 0
+
+    def _user(self, user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+
+    def message(self, user_id: int, text: str) -> dict:
+        self._update_id += 1
+        message = {
+            'message_id': self._update_id,
+            'date':       int(time.time()),
+            'chat':       {'id': user_id, 'type': 'private'},
+            'from':       self._user(user_id),
+            'text':       text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': self._update_id, 'message': message}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        self._update_id += 1
+        return {
+            'update_id': self._update_id,
+            'callback_query': {
+                'id':            str(self._update_id),
+                'from':          self._user(user_id),
+                'chat_instance': str(user_id),
+                'data':          data,
+                'message': {
+                    'message_id': self._update_id,
+                    'date':       int(time.time()),
+                    'chat':       {'id': user_id, 'type': 'private'},
+                    'text':       'menu',
+                },
+            },
+        }
+
+
+async def post_updates(port: int, path: str, updates: list, concurrency: int,
+                       secret: str = WEBHOOK_SECRET) -> list:
+    """Отправить апдейты в webhook по concurrency keep-alive соединениям. Возвращает задержки."""
+    queue     = asyncio.Queue()
+    latencies = []
+    for update in updates:
+        queue.put_nowait(json.dumps(update).encode())
+
+    async def client():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            while not queue.empty():
+                body  = queue.get_nowait()
+                start = time.perf_counter()
+                writer.write(
+                    f"POST {path} HTTP/1.1\r\nHost: localhost\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                head   = await reader.readuntil(b'\r\n\r\n')
+                length = int(re.search(rb'Content-Length: (\d+)', head).group(1))
+                await reader.readexactly(length)
+                if not head.startswith(b'HTTP/1.1 200'):
+                    raise RuntimeError(head.split(b'\r\n', 1)[0].decode())
+                latencies.append(time.perf_counter() - start)
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies
+
+
+def scenario_mix(updates: Updates, count: int, qr_ids: list, owners: int) -> list:
+    result = []
+    for i in range(count):
+        owner  = 1 + i % owners
+        finder = 100000 + i
+        kind   = i % 5
+        if kind == 0:
+            result.append(updates.message(finder, f'/start found_{qr_ids[i % len(qr_ids)]}'))
+        elif kind == 1:
+            result.append(updates.message(owner, '/myitems'))
+        elif kind == 2:
+            result.append(updates.callback(owner, f'send_qr:{qr_ids[owner - 1]}'))
+        elif kind == 3:
+            result.append(updates.message(finder, '/start'))
+        else:
+            result.append(updates.callback(owner, 'my_items'))
+    return result
+
+
+async def _run(args, qr_ids: list) -> dict:
+    from main import QRFinderBot
+
+    telegram = FakeTelegram(latency=args.api_latency / 1000)
+    await telegram.start()
+
+    bot = QRFinderBot(TOKEN)
+    bot.build_application(api_url=telegram.url, concurrency=args.update_concurrency)
+    stop    = asyncio.Event()
+    serving = asyncio.create_task(bot.serve_webhook(stop, url='http://127.0.0.1', port=0))
+    while bot.webhook is None or not bot.webhook.port:
+        await asyncio.sleep(0.01)
+
+    updates   = scenario_mix(Updates(), args.updates, qr_ids, args.owners)
+    start     = time.perf_counter()
+    latencies = await post_updates(bot.webhook.port, bot.webhook.path, updates, args.concurrency)
+    # webhook отвечает до обработки — ждём, пока приложение разберёт очередь.
+    await bot.application.update_queue.join()
+    elapsed   = time.perf_counter() - start
+
+    stop.set()
+    await serving
+    await telegram.stop()
+    return {'elapsed': elapsed, 'latencies': latencies, 'calls': dict(telegram.calls)}
+
+
+def run_load(args) -> dict:
+    """Прогнать scenario_mix через webhook поверх временной базы."""
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(Path(tmp) / 'webhook.db')
+        qr_ids  = []
+        for owner in range(1, args.owners + 1):
+            sync_db.create_user(owner, f'owner{owner}', f'Owner {owner}')
+            item = sync_db.create_item(owner)
+            sync_db.set_qr_file_id(item['qr_id'], f'file-{owner}')
+            qr_ids.append(item['qr_id'])
+        handlers.db = AsyncDatabase(sync_db)
+        result = asyncio.run(_run(args, qr_ids))
+        handlers.db.close()
+    return result
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--updates',     type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16, help='соединений с webhook')
+    parser.add_argument('--owners',      type=int, default=50)
+    parser.add_argument('--api-latency', type=float, default=0.0, help='задержка ответа Bot API, мс')
+    parser.add_argument('--update-concurrency', type=int, default=UPDATE_CONCURRENCY,
+                        help='апдейтов в обработке одновременно')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    result    = run_load(args)
+    latencies = sorted(result['latencies'])
+    print(
+        f"webhook: {len(latencies)} апдейтов за {result['elapsed']:.2f} с — "
+        f"{len(latencies) / result['elapsed']:.0f} апд/с, "
+        f"ответ webhook p50={latencies[len(latencies) // 2] * 1000:.1f} ms  "
+        f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms"
+    )
+    print(f"Bot API: {result['calls']}")
+
+
+if __name__ == '__main__':
+    main()
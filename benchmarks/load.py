@@ -0,0 +1,260 @@
+"""
+Сквозной нагрузочный прогон бота без Telegram
+
+Поднимает FakeTelegram (benchmarks.fake_telegram) и QRFinderBot в режиме
+polling поверх временной базы: бот забирает апдейты через getUpdates и
+отвечает в подменный Bot API, как в продакшене. Смесь сценариев (/start,
+скан found_, /myitems, send_qr:, paid:) задаётся --mix, поток — --rate
+апдейтов в секунду (0 — всё сразу, меряется пропускная способность).
+
+По каждому сценарию печатается число апдейтов, p50/p95/p99 задержки от
+выдачи апдейта в getUpdates до конца обработки и среднее число обращений
+к базе на апдейт (ответы из кэша не считаются). --json PATH сохраняет
+те же данные для сравнения прогонов.
+
+Запуск: python -m benchmarks.load [--updates N] [--rate N] [--mix found=4,start=2,...]
+        [--owners N] [--api-latency MS] [--update-concurrency N] [--json PATH]
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import bot.handlers as handlers
+from benchmarks.fake_telegram import TOKEN, FakeTelegram, Updates
+from bot.webhook import ALLOWED_UPDATES
+from config.config import UPDATE_CONCURRENCY
+from database.async_db import AsyncDatabase
+from database.models import Database, to_ts
+from utils.cache import MISS
+
+SCENARIOS = ('start', 'found', 'myitems', 'send_qr', 'paid')
+DEFAULT_MIX = 'start=2,found=4,myitems=2,send_qr=1,paid=1'
+
+_scenario = contextvars.ContextVar('scenario', default=None)
+
+
+class _CountingAsyncDatabase(AsyncDatabase):
+    """AsyncDatabase, считающий поездки в поток базы по сценарию текущего апдейта."""
+
+    def __init__(self, db: Database):
+        super().__init__(db)
+        self.queries = defaultdict(Counter)     # сценарий -> метод -> вызовов
+
+    def __getattr__(self, name):
+        call = super().__getattr__(name)
+        if name.startswith('_') or not callable(call):
+            return call
+
+        async def counted(*args, **kwargs):
+            if name in self.sync.CACHED_READS:
+                cached = self.sync.peek_cached(name, *args, **kwargs)
+                if cached is not MISS:
+                    return cached
+            self.queries[_scenario.get() or 'other'][name] += 1
+            return await call(*args, **kwargs)
+
+        setattr(self, name, counted)
+        return counted
+
+
+def _parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f"Неизвестный сценарий {name!r}, доступны: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_updates(count: int, mix: dict, qr_ids: list, seed: int = 1) -> tuple:
+    """Список апдейтов и update_id -> сценарий."""
+    rng       = random.Random(seed)
+    updates   = Updates()
+    names     = list(mix)
+    weights   = [mix[name] for name in names]
+    result    = []
+    scenarios = {}
+    for i in range(count):
+        name  = rng.choices(names, weights)[0]
+        owner = rng.randrange(len(qr_ids))
+        if name == 'start':
+            update = updates.message(200000 + i, '/start')
+        elif name == 'found':
+            update = updates.message(100000 + i, f'/start found_{qr_ids[owner]}')
+        elif name == 'myitems':
+            update = updates.message(owner + 1, '/myitems')
+        elif name == 'send_qr':
+            update = updates.callback(owner + 1, f'send_qr:{qr_ids[owner]}')
+        else:
+            update = updates.callback(owner + 1, 'paid:month_1')
+        result.append(update)
+        scenarios[update['update_id']] = name
+    return result, scenarios
+
+
+def _percentile(values: list, q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def _run(args, updates: list, scenarios: dict) -> dict:
+    from main import QRFinderBot
+
+    telegram = FakeTelegram(latency=args.api_latency / 1000)
+    await telegram.start()
+
+    bot = QRFinderBot(TOKEN)
+    app = bot.build_application(api_url=telegram.url, concurrency=args.update_concurrency)
+
+    finished = {}
+    errors   = Counter()
+
+    async def mark_start(update: Update, context):
+        _scenario.set(scenarios.get(update.update_id))
+
+    async def mark_done(update: Update, context):
+        finished[update.update_id] = time.perf_counter()
+
+    # Группы выполняются по порядку: -1 — до обработчиков бота, 99 — после.
+    app.add_handler(TypeHandler(Update, mark_start), group=-1)
+    app.add_handler(TypeHandler(Update, mark_done), group=99)
+
+    async def count_error(update, context):
+        errors[type(context.error).__name__] += 1
+    app.add_error_handler(count_error)
+
+    await app.initialize()
+    await bot.post_init(app)
+    await app.start()
+    await app.updater.start_polling(poll_interval=0.0, timeout=1, allowed_updates=ALLOWED_UPDATES)
+
+    start = time.perf_counter()
+    if args.rate:
+        for i, update in enumerate(updates):
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            telegram.push([update])
+    else:
+        telegram.push(updates)
+    while len(finished) < len(updates):
+        await asyncio.sleep(0.01)
+    elapsed = max(finished.values()) - start
+
+    await app.updater.stop()
+    await app.stop()
+    handlers.admin_digest.flush()
+    await handlers.notifier.stop(timeout=args.drain)
+    await app.shutdown()
+    await telegram.stop()
+
+    latencies = defaultdict(list)
+    for update_id, done in finished.items():
+        latencies[scenarios[update_id]].append(done - telegram.delivered[update_id])
+    return {
+        'elapsed':   elapsed,
+        'latencies': latencies,
+        'api_calls': dict(telegram.calls),
+        'errors':    dict(errors),
+        'notifier':  handlers.notifier.stats(),
+    }
+
+
+def run(args) -> dict:
+    mix = _parse_mix(args.mix)
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(Path(tmp) / 'load.db')
+        qr_ids  = []
+        for owner in range(1, args.owners + 1):
+            sync_db.create_user(owner, f'owner{owner}', f'Owner {owner}')
+            sync_db.create_subscription(owner, 'month_1', 30)
+            item = sync_db.create_item(owner, expires_at=to_ts('2099-01-01'))
+            sync_db.set_qr_file_id(item['qr_id'], f'file-{owner}')
+            qr_ids.append(item['qr_id'])
+        sync_db.build_qr_filter()
+
+        updates, scenarios = build_updates(args.updates, mix, qr_ids, args.seed)
+        counting    = _CountingAsyncDatabase(sync_db)
+        handlers.db = counting
+        result      = asyncio.run(_run(args, updates, scenarios))
+        counting.close()
+
+    report = {
+        'config': {
+            'updates':            args.updates,
+            'rate':               args.rate,
+            'mix':                mix,
+            'owners':             args.owners,
+            'api_latency_ms':     args.api_latency,
+            'update_concurrency': args.update_concurrency,
+        },
+        'elapsed_s':        round(result['elapsed'], 3),
+        'throughput_ups':   round(args.updates / result['elapsed'], 1),
+        'scenarios':        {},
+        'db_queries_other': dict(counting.queries.get('other', {})),
+        'api_calls':        result['api_calls'],
+        'errors':           result['errors'],
+        'notifier':         result['notifier'],
+    }
+    for name in mix:
+        values  = sorted(result['latencies'].get(name, []))
+        queries = counting.queries.get(name, Counter())
+        report['scenarios'][name] = {
+            'count':                 len(values),
+            'p50_ms':                round(_percentile(values, 0.50) * 1000, 2),
+            'p95_ms':                round(_percentile(values, 0.95) * 1000, 2),
+            'p99_ms':                round(_percentile(values, 0.99) * 1000, 2),
+            'db_queries':            sum(queries.values()),
+            'db_queries_per_update': round(sum(queries.values()) / len(values), 2) if values else 0.0,
+            'db_methods':            dict(queries),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates',     type=int,   default=2000)
+    parser.add_argument('--rate',        type=float, default=0.0, help='апдейтов в секунду, 0 — всё сразу')
+    parser.add_argument('--mix',         default=DEFAULT_MIX)
+    parser.add_argument('--owners',      type=int,   default=200)
+    parser.add_argument('--api-latency', type=float, default=0.0, help='задержка ответа Bot API, мс')
+    parser.add_argument('--update-concurrency', type=int, default=UPDATE_CONCURRENCY)
+    parser.add_argument('--drain',       type=float, default=0.0,
+                        help='сколько секунд ждать отправки уведомлений после прогона')
+    parser.add_argument('--seed',        type=int,   default=1)
+    parser.add_argument('--json',        help='куда сохранить результат')
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    report = run(args)
+    print(
+        f"{args.updates} апдейтов за {report['elapsed_s']:.2f} с — {report['throughput_ups']:.0f} апд/с "
+        f"(параллельно {args.update_concurrency}, Bot API +{args.api_latency:.0f} ms)"
+    )
+    print(f"{'сценарий':<10} {'апдейтов':>8} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9} {'запросов/апд':>13}")
+    for name, row in report['scenarios'].items():
+        print(
+            f"{name:<10} {row['count']:>8} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+            f"{row['p99_ms']:>9.1f} {row['db_queries_per_update']:>13.2f}"
+        )
+    print(f"Bot API: {report['api_calls']}")
+    if report['errors']:
+        print(f"ошибки обработчиков: {report['errors']}")
+    print(f"уведомления: {report['notifier']}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Фоновое истечение QR и подписок QR-Находка
+
+Раз в interval секунд снимает истёкшие QR и подписки пачками по batch
+строк (expire_due) и ставит в очередь уведомлений напоминания о пакетах,
+истекающих в ближайшие remind_days дней, заодно чистит старые записи
+журнала qr_changes. После прохода в базе активны только действующие
+строки, поэтому горячие запросы (подписка, кабинет, скан) не сравнивают
+сроки с текущим временем.
+"""
+import asyncio
+import logging
+from datetime import date
+
+from config.config import (
+    EXPIRY_INTERVAL, EXPIRY_BATCH, EXPIRY_REMIND_DAYS, QR_CHANGES_RETENTION, QR_PACKAGES,
+)
+from database.models import DAY, format_ts, from_ts, now_ts
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryScheduler:
+    def __init__(self, db, notifier,
+                 interval: float = EXPIRY_INTERVAL,
+                 batch: int = EXPIRY_BATCH,
+                 remind_days: int = EXPIRY_REMIND_DAYS):
+        self.db          = db
+        self.notifier    = notifier
+        self.interval    = interval
+        self.batch       = max(1, batch)
+        self.remind_days = remind_days
+        self._task       = None
+
+    async def start(self):
+        if self.interval <= 0:
+            logger.info("Фоновое истечение выключено (EXPIRY_INTERVAL=0)")
+            return
+        self._task = asyncio.create_task(self._loop(), name='expiry')
+        logger.info(f"Фоновое истечение: каждые {self.interval:.0f} с, напоминание за {self.remind_days} дн.")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка фонового истечения: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> dict:
+        """Один проход: снять истёкшее и разослать напоминания. Возвращает счётчики."""
+        totals = {'items': 0, 'subscriptions': 0, 'reminders': 0}
+        # Пачками: каждая — короткая транзакция в очереди записи, между
+        # ними проходят записи обработчиков.
+        while True:
+            done = await self.db.expire_due(self.batch)
+            totals['items']         += done['items']
+            totals['subscriptions'] += done['subscriptions']
+            if done['items'] < self.batch and done['subscriptions'] < self.batch:
+                break
+
+        if self.remind_days > 0:
+            totals['reminders'] = await self._remind()
+
+        # Журнал нужен веб-воркерам только пока их записи индекса не истекли.
+        await self.db.prune_qr_changes(now_ts() - QR_CHANGES_RETENTION)
+
+        if any(totals.values()):
+            logger.info(
+                f"Истечение: QR {totals['items']}, подписок {totals['subscriptions']}, "
+                f"напоминаний {totals['reminders']}"
+            )
+        return totals
+
+    async def _remind(self) -> int:
+        until = now_ts() + self.remind_days * DAY
+        sent  = 0
+        while True:
+            subs = await self.db.get_expiring_subscriptions(until, self.batch)
+            if not subs:
+                return sent
+            for sub in subs:
+                self.notifier.send(sub['user_id'], _reminder_text(sub))
+            # Отмечаем сразу после постановки в очередь: недоставленное
+            # диспетчер сохранит в dead letters, повторно не напоминаем.
+            await self.db.mark_reminders_sent([sub['id'] for sub in subs])
+            sent += len(subs)
+            if len(subs) < self.batch:
+                return sent
+
+
+def _reminder_text(sub: dict) -> str:
+    plan = QR_PACKAGES.get(sub['plan'])
+    name = f"{plan['emoji']} {plan['label']}" if plan else sub['plan']
+    days = (from_ts(sub['expires_at']).date() - date.today()).days
+    when = {0: 'сегодня', 1: 'завтра'}.get(max(0, days), f"через {days} дн.")
+    return (
+        f"⏳ Ваш пакет заканчивается {when} — {format_ts(sub['expires_at'])}.\n\n"
+        f"{name}\n\n"
+        "После окончания QR-код перестанет работать. Продлить — /buy"
+    )
@@ -6,13 +6,22 @@ import io
 from datetime import datetime
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
+from bot.expiry import ExpiryScheduler
 from config.config import BOT_USERNAME, DATABASE_PATH, QR_PACKAGES, PAYMENT_DETAILS, ADMIN_ID
-from database.models import Database
+from database.async_db import AsyncDatabase
+from database.models import Database, format_ts
+from utils.notifications import AdminDigest, NotificationDispatcher
+from utils.qr_render import QRRenderer
 
 logger = logging.getLogger(__name__)
-db = Database(DATABASE_PATH)
+db = AsyncDatabase(Database(DATABASE_PATH))
+qr_renderer  = QRRenderer(cache=db.qr_cache)
+notifier     = NotificationDispatcher(db)
+admin_digest = AdminDigest(notifier, ADMIN_ID)
+expiry       = ExpiryScheduler(db, notifier)
 
 STAR_MAP = {1: '1 zvezda', 2: '2 zvezdy', 3: '3 zvezdy', 4: '4 zvezdy', 5: '5 zvezd'}
 STAR_EMO = {1: '\u2b50', 2: '\u2b50\u2b50', 3: '\u2b50\u2b50\u2b50', 4: '\u2b50\u2b50\u2b50\u2b50', 5: '\u2b50\u2b50\u2b50\u2b50\u2b50'}
@@ -29,9 +38,7 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await found_handler(update, context, context.args[0].replace('found_', ''))
         return
 
-    is_new = not db.user_exists(user.id)
-    if is_new:
-        db.create_user(user.id, user.username or '', user.full_name)
+    is_new = await db.create_user(user.id, user.username or '', user.full_name)
 
     greeting = "Dobro pozhalovat' v" if is_new else "S vozvrashcheniem v"
     mark = "\U0001f389 " if is_new else "\U0001f44b "
@@ -82,18 +89,18 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def buy_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if not db.user_exists(user_id):
+    user_id   = update.effective_user.id
+    dashboard = await db.get_user_dashboard(user_id, with_items=False)
+    if not dashboard:
         await update.message.reply_text("Сначала запустите бот: /start")
         return
-    await _show_packages_menu(update.message, user_id, edit=False)
+    await _show_packages_menu(update.message, dashboard['package'], edit=False)
 
 
-async def _show_packages_menu(message, user_id: int, edit: bool = False):
-    pkg = db.get_active_package(user_id)
+async def _show_packages_menu(message, pkg, edit: bool = False):
     if pkg:
         qr_status   = "✅ QR создан" if pkg.get('qr_used') else "⚡ QR ещё не создан"
-        status_line = f"Текущий QR-код активен до {pkg['expires_at'][:10]} | {qr_status}\n\n"
+        status_line = f"Текущий QR-код активен до {format_ts(pkg['expires_at'])} | {qr_status}\n\n"
     else:
         status_line = "У вас нет активного QR-кода.\n\n"
 
@@ -148,15 +155,18 @@ async def _handle_buy_plan(query, user_id: int, plan_key: str):
 
 
 async def additem_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if not db.user_exists(user_id):
+    user_id   = update.effective_user.id
+    dashboard = await db.get_user_dashboard(user_id, with_items=False)
+    if not dashboard:
         await update.message.reply_text("Сначала запустите бот: /start")
         return
-    await _create_qr_for_user(update.message, context, user_id, edit=False)
+    await _create_qr_for_user(update.message, context, user_id, dashboard, edit=False)
 
 
-async def _create_qr_for_user(message, context, user_id: int, edit: bool = False):
-    pkg = db.get_active_package(user_id)
+async def _create_qr_for_user(message, context, user_id: int, dashboard, edit: bool = False):
+    # dashboard без items (из кэша): список QR нужен только для ответа
+    # «уже создан» и читается отдельно.
+    pkg = dashboard['package'] if dashboard else None
 
     if not pkg:
         text = (
@@ -176,16 +186,14 @@ async def _create_qr_for_user(message, context, user_id: int, edit: bool = False
         return
 
     if pkg.get('qr_used'):
-        items  = db.get_user_items(user_id)
-        active = next(
-            (i for i in items if i.get('expires_at', '') >= datetime.now().strftime('%Y-%m-%d')),
-            None
-        )
+        # QR пакета выпущен с его сроком; истёкшие QR снимает ExpiryScheduler.
+        items  = await db.get_user_items(user_id)
+        active = next((i for i in items if i.get('expires_at') == pkg['expires_at']), None)
         if active:
             text = (
                 "ℹ️ QR-код в этом пакете уже создан.\n\n"
                 f"🏷 Ваш QR: {active['qr_id']}\n"
-                f"⏳ Активен до: {active['expires_at'][:10]}\n\n"
+                f"⏳ Активен до: {format_ts(active['expires_at'])}\n\n"
                 "Для нового QR-кода купите новый пакет."
             )
             keyboard = [
@@ -201,41 +209,56 @@ async def _create_qr_for_user(message, context, user_id: int, edit: bool = False
             await message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
             return
 
-    item = db.create_item(user_id, expires_at=pkg['expires_at'])
+    item = await db.create_item(user_id, expires_at=pkg['expires_at'], mark_qr_used=True)
     if not item:
         await message.reply_text("❌ Ошибка при создании QR-кода. Попробуйте ещё раз.")
         return
 
-    db.mark_qr_used(user_id)
-
-    qr_id    = item['qr_id']
-    qr_image = db.generate_qr_image(qr_id, BOT_USERNAME)
-    qr_url   = f"https://t.me/{BOT_USERNAME}?start=found_{qr_id}"
+    qr_id  = item['qr_id']
+    qr_url = f"https://t.me/{BOT_USERNAME}?start=found_{qr_id}"
 
     caption = (
         f"✅ QR-код создан!\n\n"
         f"🏷 Код: {qr_id}\n"
-        f"⏳ Активен до: {pkg['expires_at'][:10]}\n\n"
+        f"⏳ Активен до: {format_ts(pkg['expires_at'])}\n\n"
         "Распечатайте и наклейте на вещь.\n"
         "Когда кто-то отсканирует — вы получите уведомление с контактом нашедшего.\n\n"
         f"🔗 Ссылка: {qr_url}"
     )
     keyboard = [[InlineKeyboardButton("📋 Мои QR-коды", callback_data='my_items')]]
-    await message.reply_photo(
-        photo=io.BytesIO(qr_image),
+    await _send_qr_photo(
+        message.reply_photo, qr_id, file_id=None,
         caption=caption,
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
 
+async def _send_qr_photo(send, qr_id: str, file_id, **kwargs):
+    """
+    Отправить QR по сохранённому file_id (читается вместе с QR в get_item_by_qr);
+    если его нет или он устарел — загрузить PNG.
+    """
+    if file_id:
+        try:
+            return await send(photo=file_id, **kwargs)
+        except BadRequest as e:
+            logger.info(f"file_id для {qr_id} больше не действует, загружаем заново: {e}")
+            await db.clear_qr_file_id(qr_id)
+
+    qr_image = await qr_renderer.render(f"https://t.me/{BOT_USERNAME}?start=found_{qr_id}")
+    sent     = await send(photo=io.BytesIO(qr_image), **kwargs)
+    if sent and sent.photo:
+        await db.set_qr_file_id(qr_id, sent.photo[-1].file_id)
+    return sent
 
 
 
 
-def _build_items_text(items: list, user_id: int) -> tuple:
-    pkg = db.get_active_package(user_id)
+
+
+def _build_items_text(items: list, pkg) -> tuple:
     pkg_line = (
-        f"✅ QR-код активен до {pkg['expires_at'][:10]}"
+        f"✅ QR-код активен до {format_ts(pkg['expires_at'])}"
         if pkg else "❌ Нет активного QR-кода"
     )
 
@@ -250,8 +273,8 @@ def _build_items_text(items: list, user_id: int) -> tuple:
     text = f"📋 Мои QR-коды ({len(items)})\n{pkg_line}\n{'─' * 30}\n\n"
     for i, item in enumerate(items, 1):
         scanned = f"  · отсканирован {item['times_found']} раз" if item['times_found'] > 0 else ""
-        exp     = f"\n   ⏳ до {item['expires_at'][:10]}" if item.get('expires_at') else ""
-        text   += f"{i}. 🏷 {item['qr_id']}{scanned}{exp}\n   Создан: {item['added_at'][:10]}\n\n"
+        exp     = f"\n   ⏳ до {format_ts(item['expires_at'])}" if item.get('expires_at') else ""
+        text   += f"{i}. 🏷 {item['qr_id']}{scanned}{exp}\n   Создан: {format_ts(item['added_at'])}\n\n"
 
     keyboard = [
         [InlineKeyboardButton(f"🏷 {item['qr_id']}", callback_data=f"item_qr:{item['qr_id']}")]
@@ -274,12 +297,12 @@ async def myitems_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message = update.message
         edit    = False
 
-    if not db.user_exists(user_id):
+    dashboard = await db.get_user_dashboard(user_id)
+    if not dashboard:
         await message.reply_text("Сначала запустите бот: /start")
         return
 
-    items = db.get_user_items(user_id)
-    text, markup = _build_items_text(items, user_id)
+    text, markup = _build_items_text(dashboard['items'], dashboard['package'])
     if edit:
         try:
             await message.edit_text(text, reply_markup=markup)
@@ -295,12 +318,12 @@ async def myitems_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def history_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if not db.user_exists(user_id):
+    history = await db.get_user_history(user_id)
+    if history is None:
         await update.message.reply_text("Сначала запустите бот: /start")
         return
 
-    my_findings = db.get_user_findings(user_id, as_owner=True)
-    found_by_me = db.get_user_findings(user_id, as_owner=False)
+    my_findings, found_by_me = history
 
     text = "📜 История сканирований\n\n"
 
@@ -310,7 +333,7 @@ async def history_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             finder = f['finder_name']
             if f.get('finder_username'):
                 finder += f" (@{f['finder_username']})"
-            text += f"\n🏷 {f['qr_id']}\n   Нашёл: {finder}\n   Когда: {f['found_at'][:16]}\n"
+            text += f"\n🏷 {f['qr_id']}\n   Нашёл: {finder}\n   Когда: {format_ts(f['found_at'], '%Y-%m-%d %H:%M')}\n"
     else:
         text += "🔍 Мои QR-коды ещё не сканировали.\n"
 
@@ -319,7 +342,7 @@ async def history_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if found_by_me:
         text += "🤝 Я отсканировал чужие QR:\n"
         for f in found_by_me[:5]:
-            text += f"\n🏷 {f['qr_id']}  {f['found_at'][:16]}\n"
+            text += f"\n🏷 {f['qr_id']}  {format_ts(f['found_at'], '%Y-%m-%d %H:%M')}\n"
     else:
         text += "🤝 Я ещё не сканировал чужие QR."
 
@@ -335,7 +358,7 @@ async def review_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id   = update.effective_user.id
     full_name = update.effective_user.full_name
 
-    if not db.user_exists(user_id):
+    if not await db.user_exists(user_id):
         await update.message.reply_text("Сначала запустите бот: /start")
         return
 
@@ -352,24 +375,19 @@ async def review_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         review_text = ' '.join(context.args[1:]).strip()
 
-        if db.add_review(user_id, full_name, rating, review_text):
+        if await db.add_review(user_id, full_name, rating, review_text):
             stars = STAR_EMO[rating]
             await update.message.reply_text(
                 f"✅ Спасибо за отзыв!\n\n{stars} — {review_text or '(без комментария)'}"
             )
             if ADMIN_ID:
-                try:
-                    uname = update.effective_user.username
-                    await context.bot.send_message(
-                        chat_id=ADMIN_ID,
-                        text=(
-                            f"⭐ Новый отзыв\n\n"
-                            f"От: {full_name}" + (f" (@{uname})" if uname else "") +
-                            f"\nОценка: {stars}\nТекст: {review_text or '—'}"
-                        )
-                    )
-                except Exception:
-                    pass
+                uname = update.effective_user.username
+                admin_digest.add(
+                    'review',
+                    f"⭐ Новый отзыв\n\n"
+                    f"От: {full_name}" + (f" (@{uname})" if uname else "") +
+                    f"\nОценка: {stars}\nТекст: {review_text or '—'}"
+                )
         else:
             await update.message.reply_text("❌ Не удалось сохранить. Попробуйте ещё раз.")
         return
@@ -398,7 +416,7 @@ async def review_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    s = db.get_statistics()
+    s = await db.get_statistics()
     rating_line = (
         f"⭐ Средняя оценка: {s['avg_rating']} ({s['total_reviews']} отзывов)\n"
         if s['total_reviews'] else ""
@@ -472,29 +490,24 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text_in     = update.message.text.strip()
         review_text = '' if text_in == '-' else text_in
 
-        if db.add_review(user_id, full_name, rating, review_text):
+        if await db.add_review(user_id, full_name, rating, review_text):
             stars = STAR_EMO[rating]
             await update.message.reply_text(
                 f"✅ Отзыв сохранён!\n\n{stars} — {review_text or '(без комментария)'}"
             )
             if ADMIN_ID:
-                try:
-                    uname = update.effective_user.username
-                    await context.bot.send_message(
-                        chat_id=ADMIN_ID,
-                        text=(
-                            f"⭐ Новый отзыв\n\nОт: {full_name}"
-                            + (f" (@{uname})" if uname else "")
-                            + f"\nОценка: {stars}\nТекст: {review_text or '—'}"
-                        )
-                    )
-                except Exception:
-                    pass
+                uname = update.effective_user.username
+                admin_digest.add(
+                    'review',
+                    f"⭐ Новый отзыв\n\nОт: {full_name}"
+                    + (f" (@{uname})" if uname else "")
+                    + f"\nОценка: {stars}\nТекст: {review_text or '—'}"
+                )
         else:
             await update.message.reply_text("❌ Ошибка. Попробуйте /review ещё раз.")
         return
 
-    if not db.user_exists(user_id):
+    if not await db.user_exists(user_id):
         await update.message.reply_text("Сначала запустите бот: /start")
         return
 
@@ -517,31 +530,37 @@ async def found_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, qr_i
     finder_name     = finder.full_name
     finder_username = finder.username or ''
 
-    if not db.user_exists(finder_id):
-        db.create_user(finder_id, finder_username, finder_name)
+    # Индекс сканирований отвечает без базы; запись идёт только для чужого действующего QR.
+    record = await db.lookup_qr(qr_id)
+    if record is None:
+        status = 'not_found'
+    elif record.is_expired():
+        status = 'expired'
+    elif record.owner_id == finder_id:
+        status = 'own'
+    else:
+        scan   = await db.resolve_scan(qr_id, finder_id, finder_name, finder_username)
+        status = scan['status']
 
-    item = db.get_item_by_qr(qr_id)
-    if not item:
+    if status in ('not_found', 'error'):
         await update.message.reply_text(
             "❌ QR-код не найден или срок действия истёк.\n\n"
             f"Зарегистрируйте свои вещи в @{BOT_USERNAME}"
         )
         return
 
-    if item.get('expires_at'):
-        if datetime.now().strftime('%Y-%m-%d %H:%M:%S') > item['expires_at']:
-            await update.message.reply_text(
-                "⏰ Срок действия этого QR-кода истёк.\n"
-                "Владелец не продлил пакет."
-            )
-            return
+    if status == 'expired':
+        await update.message.reply_text(
+            "⏰ Срок действия этого QR-кода истёк.\n"
+            "Владелец не продлил пакет."
+        )
+        return
 
-    owner_id = item['user_id']
-    if owner_id == finder_id:
+    if status == 'own':
         await update.message.reply_text(f"😊 Это ваш QR-код ({qr_id}).")
         return
 
-    db.create_finding(qr_id, owner_id, finder_id, finder_name, finder_username)
+    owner_id = scan['item']['user_id']
 
     finder_keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_menu')]]
     await update.message.reply_text(
@@ -573,11 +592,8 @@ async def found_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, qr_i
             [InlineKeyboardButton(contact_label, url=contact_url)],
             [InlineKeyboardButton("🏠 Главное меню", callback_data='back_to_menu')],
         ]
-        await context.bot.send_message(
-            chat_id=owner_id,
-            text=owner_text,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+        # Нашедшему уже ответили; владельцу сообщение уйдёт из очереди диспетчера.
+        notifier.send(owner_id, owner_text, reply_markup=InlineKeyboardMarkup(keyboard))
     except Exception as e:
         logger.error(f"Ошибка уведомления владельца: {e}")
 
@@ -600,7 +616,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     
     if data in ('packages', 'subscription'):
-        await _show_packages_menu(query.message, user_id, edit=True)
+        dashboard = await db.get_user_dashboard(user_id, with_items=False)
+        await _show_packages_menu(query.message, dashboard and dashboard['package'], edit=True)
 
     elif data.startswith('buy:'):
         await _handle_buy_plan(query, user_id, data.split(':', 1)[1])
@@ -612,24 +629,18 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.answer("Неизвестный пакет", show_alert=True)
             return
 
-        db.add_pending_payment(user_id, plan_key)
+        user = await db.add_pending_payment(user_id, plan_key)
 
         if ADMIN_ID:
-            try:
-                user  = db.get_user(user_id)
-                name  = user['full_name'] if user else str(user_id)
-                uname = user.get('username', '') if user else ''
-                await context.bot.send_message(
-                    chat_id=ADMIN_ID,
-                    text=(
-                        f"💳 Новая оплата!\n\n"
-                        f"Пользователь: {name}" + (f" (@{uname})" if uname else "") +
-                        f"\nID: {user_id}\nПакет: {plan['label']}\n\n"
-                        f"Активировать:\n/activate {user_id} {plan_key}"
-                    )
-                )
-            except Exception as e:
-                logger.error(f"Ошибка уведомления администратора: {e}")
+            name  = user['full_name'] if user else str(user_id)
+            uname = user.get('username', '') if user else ''
+            admin_digest.add(
+                'payment',
+                f"💳 Новая оплата!\n\n"
+                f"Пользователь: {name}" + (f" (@{uname})" if uname else "") +
+                f"\nID: {user_id}\nПакет: {plan['label']}\n\n"
+                f"Активировать:\n/activate {user_id} {plan_key}"
+            )
 
         await edit_or_send(
             "✅ Заявка отправлена!\n\n"
@@ -641,30 +652,31 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     
     elif data == 'add_item':
-        await _create_qr_for_user(query.message, context, user_id, edit=True)
+        dashboard = await db.get_user_dashboard(user_id, with_items=False)
+        await _create_qr_for_user(query.message, context, user_id, dashboard, edit=True)
 
     
     elif data == 'my_items':
-        if not db.user_exists(user_id):
+        dashboard = await db.get_user_dashboard(user_id)
+        if not dashboard:
             await edit_or_send("Сначала запустите бот: /start")
             return
-        items = db.get_user_items(user_id)
-        text, markup = _build_items_text(items, user_id)
+        text, markup = _build_items_text(dashboard['items'], dashboard['package'])
         await edit_or_send(text, markup)
 
     
     elif data.startswith('item_qr:'):
         qr_id = data.split(':', 1)[1]
-        item  = db.get_item_by_qr(qr_id)
+        item  = await db.get_item_by_qr(qr_id)
         if not item:
             await query.answer("QR-код не найден", show_alert=True)
             return
         qr_url  = f"https://t.me/{BOT_USERNAME}?start=found_{qr_id}"
         scanned = f"\n🔍 Отсканирован {item['times_found']} раз" if item['times_found'] > 0 else ""
-        exp     = f"\n⏳ Активен до: {item['expires_at'][:10]}" if item.get('expires_at') else ""
+        exp     = f"\n⏳ Активен до: {format_ts(item['expires_at'])}" if item.get('expires_at') else ""
         text    = (
             f"🏷 QR-код: {qr_id}\n{'─' * 30}\n\n"
-            f"📅 Создан: {item['added_at'][:10]}{scanned}{exp}\n\n"
+            f"📅 Создан: {format_ts(item['added_at'])}{scanned}{exp}\n\n"
             f"Ссылка:\n{qr_url}"
         )
         keyboard = [
@@ -677,24 +689,23 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data.startswith('send_qr:'):
         qr_id = data.split(':', 1)[1]
-        item  = db.get_item_by_qr(qr_id)
+        item  = await db.get_item_by_qr(qr_id)
         if not item:
             await query.answer("QR-код не найден", show_alert=True)
             return
-        qr_image = db.generate_qr_image(qr_id, BOT_USERNAME)
-        await context.bot.send_photo(
+        await _send_qr_photo(
+            context.bot.send_photo, qr_id, file_id=item.get('file_id'),
             chat_id=query.message.chat_id,
-            photo=io.BytesIO(qr_image),
             caption=(
                 f"🏷 {qr_id}"
-                + (f"\n⏳ Активен до: {item['expires_at'][:10]}" if item.get('expires_at') else "")
+                + (f"\n⏳ Активен до: {format_ts(item['expires_at'])}" if item.get('expires_at') else "")
             )
         )
 
     
     elif data.startswith('confirm_delete:'):
         qr_id = data.split(':', 1)[1]
-        if not db.get_item_by_qr(qr_id):
+        if not await db.lookup_qr(qr_id):
             await query.answer("QR-код не найден", show_alert=True)
             return
         keyboard = [
@@ -708,10 +719,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data.startswith('do_delete:'):
         qr_id   = data.split(':', 1)[1]
-        success = db.delete_item(qr_id, user_id)
+        success = await db.delete_item(qr_id, user_id)
         await query.answer("✅ Удалено" if success else "❌ Ошибка")
-        items = db.get_user_items(user_id)
-        text, markup = _build_items_text(items, user_id)
+        dashboard = await db.get_user_dashboard(user_id)
+        text, markup = _build_items_text(dashboard['items'] if dashboard else [],
+                                         dashboard and dashboard['package'])
         await edit_or_send(text, markup)
 
     
@@ -749,7 +761,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     
     elif data == 'stats':
-        s = db.get_statistics()
+        s = await db.get_statistics()
         rating_line = (
             f"⭐ Средняя оценка: {s['avg_rating']} ({s['total_reviews']} отзывов)\n"
             if s['total_reviews'] else ""
@@ -0,0 +1,35 @@
+"""
+Сбор метрик на стороне Telegram QR-Находка
+"""
+from telegram import Update
+from telegram.request import HTTPXRequest
+
+from utils.metrics import metrics
+
+
+def update_label(update: object) -> str:
+    """Метка апдейта для гистограммы: команда, 'cb:<префикс>' или 'text'."""
+    if not isinstance(update, Update):
+        return 'other'
+    if update.callback_query:
+        return 'cb:' + (update.callback_query.data or '').split(':', 1)[0]
+    message = update.effective_message
+    if message is None or not message.text:
+        return 'other'
+    if not message.text.startswith('/'):
+        return 'text'
+    parts   = message.text.split(maxsplit=1)
+    command = parts[0].split('@', 1)[0]
+    if command == '/start' and len(parts) > 1 and parts[1].startswith('found_'):
+        return '/start found_'
+    return command
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, записывающий время каждого запроса к Bot API по имени метода."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        if not metrics.enabled:
+            return await super().do_request(url, method, *args, **kwargs)
+        with metrics.timer('bot_api', url.rsplit('/', 1)[-1]):
+            return await super().do_request(url, method, *args, **kwargs)
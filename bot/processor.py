@@ -0,0 +1,77 @@
+"""
+Параллельная обработка апдейтов с сохранением порядка для пользователя QR-Находка
+"""
+import asyncio
+from typing import Any, Awaitable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from bot.instrumentation import update_label
+from utils.metrics import metrics
+
+
+def _user_key(update: object) -> Optional[int]:
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Апдейты разных пользователей обрабатываются параллельно (не больше
+    max_concurrent_updates одновременно — семафор базового класса),
+    апдейты одного пользователя — строго по очереди прихода: иначе сломаются
+    диалоги через user_data (ожидание текста отзыва) и цепочка «купить →
+    оплатил».
+
+    Блокировка пользователя берётся в do_process_update, то есть уже со
+    слотом семафора: очередь одного пользователя может занять несколько
+    слотов, но держащий блокировку апдейт всегда выполняется, взаимной
+    блокировки нет.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks   = {}      # user_id -> asyncio.Lock
+        self._waiters = {}      # user_id -> сколько апдейтов ждут или держат блокировку
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = _user_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                await self._run(update, coroutine)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    async def _run(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if not metrics.enabled:
+            await coroutine
+            return
+        with metrics.timer('handler', update_label(update)):
+            await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def active_users(self) -> int:
+        return len(self._locks)
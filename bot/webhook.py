@@ -0,0 +1,219 @@
+"""
+Приём апдейтов через webhook QR-Находка
+
+Небольшой HTTP/1.1-сервер на asyncio: Telegram держит до max_connections
+постоянных соединений и шлёт апдейты POST-запросами. Апдейт ставится в
+update_queue приложения, и ответ 200 уходит сразу: медленный обработчик
+(/stickers) иначе не укладывается в таймаут Telegram, и апдейт приходит
+повторно. Повторы одного update_id отбрасываются.
+"""
+import asyncio
+import hmac
+import json
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from config.config import HTTP_HEADER_TIMEOUT, HTTP_BODY_TIMEOUT, HTTP_KEEPALIVE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Типы апдейтов, для которых зарегистрированы обработчики.
+ALLOWED_UPDATES = ['message', 'callback_query']
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES   = 1024 * 1024
+RECENT_UPDATES   = 10000        # сколько последних update_id помнить для отсева повторов
+
+_REASONS = {
+    200: 'OK', 301: 'Moved Permanently', 302: 'Found', 304: 'Not Modified',
+    400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+# (method, path, headers, body) -> (status, content_type, body[, extra_headers])
+HttpHandler = Callable[[str, str, dict, bytes], Awaitable[tuple]]
+
+
+def _check_headers(ctype: str, extra: dict):
+    """CR/LF в заголовке ответа разорвал бы его (подмена заголовков и тела)."""
+    for value in (ctype, *extra, *extra.values()):
+        if '\r' in str(value) or '\n' in str(value):
+            raise ValueError(f"перевод строки в заголовке ответа: {value!r}")
+
+
+class HttpServer:
+    """
+    Минимальный HTTP/1.1-сервер с keep-alive для одного обработчика.
+    reuse_port=True позволяет нескольким процессам слушать один порт —
+    ядро само распределяет соединения между ними.
+
+    Заголовки первого запроса должны прийти за header_timeout, следующего
+    по keep-alive — за keepalive_timeout (он же предел простоя), тело — за
+    body_timeout; иначе соединение закрывается.
+    """
+
+    def __init__(self, handler: HttpHandler, host: str, port: int, reuse_port: bool = False,
+                 header_timeout: float = HTTP_HEADER_TIMEOUT,
+                 body_timeout: float = HTTP_BODY_TIMEOUT,
+                 keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT):
+        self.handler           = handler
+        self.host              = host
+        self.port              = port
+        self.reuse_port        = reuse_port
+        self.header_timeout    = header_timeout
+        self.body_timeout      = body_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self._server           = None
+        self._conns            = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._serve, self.host, self.port, limit=MAX_HEADER_BYTES,
+            reuse_port=self.reuse_port or None,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._conns):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._conns.add(writer)
+        timeout = self.header_timeout
+        try:
+            while True:
+                request = await self._read_request(reader, timeout)
+                if request is None:
+                    break
+                timeout = self.keepalive_timeout
+                method, path, headers, body, status = request
+                extra = {}
+                if status is None:
+                    try:
+                        status, ctype, payload, *rest = await self.handler(method, path, headers, body)
+                        extra = rest[0] if rest else {}
+                        _check_headers(ctype, extra)
+                    except Exception as e:
+                        logger.error(f"Ошибка обработки {method} {path}: {e}", exc_info=e)
+                        status, ctype, payload, extra = 500, 'text/plain', b'', {}
+                else:
+                    ctype, payload = 'text/plain', b''
+                # После 400/413 граница следующего запроса неизвестна — закрываем.
+                keep_alive = headers.get('connection', '').lower() != 'close' and status not in (400, 413)
+                # У 304 тела нет, а Content-Length, если есть, обязан совпадать с 200-м.
+                length = '' if status == 304 else f"Content-Length: {len(payload)}\r\n"
+                head = (
+                    f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: {ctype}\r\n"
+                    f"{length}"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    + ''.join(f"{name}: {value}\r\n" for name, value in extra.items())
+                    + "\r\n"
+                )
+                writer.write(head.encode() + (b'' if method == 'HEAD' else payload))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError):
+            pass
+        finally:
+            self._conns.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader, timeout: float) -> Optional[tuple]:
+        """Следующий запрос или None, если клиент закрыл соединение или молчит дольше timeout."""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return None
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or not parts[0].isalpha() or not parts[2].startswith('HTTP/1.'):
+            return '', '', {}, b'', 400
+        method, path, _ = parts
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = headers.get('content-length', '0') or '0'
+        if not (length.isascii() and length.isdigit()):
+            return method, path, headers, b'', 400
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            return method, path, headers, b'', 413
+        body = await asyncio.wait_for(reader.readexactly(length), self.body_timeout) if length else b''
+        return method, path, headers, body, None
+
+
+class WebhookServer:
+    """
+    Принимает апдейты Telegram по path, проверяя заголовок
+    X-Telegram-Bot-Api-Secret-Token, и передаёт их приложению.
+    """
+
+    def __init__(self, application: Application, host: str, port: int,
+                 path: str, secret_token: str):
+        self.application  = application
+        self.path         = '/' + path.lstrip('/')
+        self.secret_token = secret_token
+        self.http         = HttpServer(self._handle, host, port)
+
+        self._recent      = OrderedDict()    # update_id -> None
+
+        self.received   = 0
+        self.rejected   = 0
+        self.duplicates = 0
+
+    @property
+    def port(self) -> int:
+        return self.http.port
+
+    async def start(self):
+        await self.http.start()
+        logger.info(f"Webhook слушает {self.http.host}:{self.http.port}{self.path}")
+
+    async def stop(self):
+        await self.http.stop()
+
+    async def _handle(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if path == '/healthz':
+            return 200, 'text/plain', b'ok'
+        if path != self.path:
+            return 404, 'text/plain', b''
+        if method != 'POST':
+            return 405, 'text/plain', b''
+
+        token = headers.get('x-telegram-bot-api-secret-token', '')
+        if self.secret_token and not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            return 403, 'text/plain', b''
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Некорректный апдейт в webhook: {e}")
+            return 400, 'text/plain', b''
+
+        if update.update_id in self._recent:
+            self.duplicates += 1
+            logger.info(f"Повтор апдейта {update.update_id} пропущен")
+            return 200, 'text/plain', b''
+        self._recent[update.update_id] = None
+        if len(self._recent) > RECENT_UPDATES:
+            self._recent.popitem(last=False)
+
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return 200, 'text/plain', b''
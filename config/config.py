@@ -10,11 +10,127 @@ DATABASE_DIR = BASE_DIR / 'database'
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '8238565811:AAFwz18jnwCd88AKjcWiTZ19swChIdkrCQ0')
 BOT_USERNAME       = os.getenv('BOT_USERNAME', 'QR_FinderBot')
+TELEGRAM_API_URL   = os.getenv('TELEGRAM_API_URL', '')      # пусто — api.telegram.org
+
+
+# polling | webhook. Webhook принимает HTTP; TLS снимает обратный прокси перед ботом.
+BOT_MODE                = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL             = os.getenv('WEBHOOK_URL', '')         # https://example.com — без пути
+WEBHOOK_HOST            = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT            = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH            = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+WEBHOOK_SECRET          = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Страница сканирования QR: python -m web.server.
+WEB_HOST    = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT    = int(os.getenv('WEB_PORT', '8080'))
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', '1'))     # процессов на одном порту (SO_REUSEPORT)
+
+WEB_PAGE_MAX_AGE   = int(os.getenv('WEB_PAGE_MAX_AGE', '60'))       # сек, Cache-Control страниц QR
+WEB_PAGE_CACHE_MAX = int(os.getenv('WEB_PAGE_CACHE_MAX', '5000'))   # готовых страниц в памяти процесса
+
+# Тайм-ауты HttpServer (webhook и сайт): медленный или молчащий клиент не
+# должен держать соединение бесконечно.
+HTTP_HEADER_TIMEOUT    = float(os.getenv('HTTP_HEADER_TIMEOUT', '10'))     # сек на заголовки первого запроса
+HTTP_BODY_TIMEOUT      = float(os.getenv('HTTP_BODY_TIMEOUT', '30'))       # сек на тело запроса
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '15'))  # сек простоя keep-alive до следующего запроса
+
+# Сколько апдейтов обрабатывается одновременно (апдейты одного пользователя — по очереди).
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '16'))
 
 
 DATABASE_PATH = DATABASE_DIR / 'qr_finder.db'
 
 
+DB_POOL_SIZE            = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT         = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+DB_POOL_HEALTH_INTERVAL = float(os.getenv('DB_POOL_HEALTH_INTERVAL', '30'))
+DB_READ_WORKERS         = int(os.getenv('DB_READ_WORKERS', '4'))
+
+
+WRITE_BATCH_SIZE  = int(os.getenv('WRITE_BATCH_SIZE', '100'))
+WRITE_BATCH_DELAY = float(os.getenv('WRITE_BATCH_DELAY', '0.01'))   # сек
+
+
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS  = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_SIZE   = int(os.getenv('DB_CACHE_SIZE', '-16000'))       # KiB, если отрицательное
+DB_MMAP_SIZE    = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+DB_TEMP_STORE   = os.getenv('DB_TEMP_STORE', 'MEMORY')
+DB_BUSY_TIMEOUT = int(os.getenv('DB_BUSY_TIMEOUT', '5000'))       # мс
+
+
+CACHE_ENABLED     = os.getenv('CACHE_ENABLED', '1') == '1'
+CACHE_TTL         = float(os.getenv('CACHE_TTL', '60'))            # сек
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+STATS_CACHE_TTL   = float(os.getenv('STATS_CACHE_TTL', '5'))       # сек, снимок get_statistics
+
+
+SCAN_INDEX_MAX_ENTRIES  = int(os.getenv('SCAN_INDEX_MAX_ENTRIES', '200000'))
+SCAN_INDEX_TTL          = float(os.getenv('SCAN_INDEX_TTL', '600'))         # сек
+SCAN_INDEX_NEGATIVE_MAX = int(os.getenv('SCAN_INDEX_NEGATIVE_MAX', '50000'))
+SCAN_INDEX_NEGATIVE_TTL = float(os.getenv('SCAN_INDEX_NEGATIVE_TTL', '30'))  # сек
+# Веб-воркеры читают журнал qr_changes раз в SCAN_INDEX_SYNC_INTERVAL: удаление,
+# истечение и выпуск QR в боте видны на сайте не позже чем через столько
+# секунд. 0 — не читать, тогда устаревание ограничено SCAN_INDEX_TTL.
+SCAN_INDEX_SYNC_INTERVAL = float(os.getenv('SCAN_INDEX_SYNC_INTERVAL', '2'))    # сек
+# Журнал хранится дольше SCAN_INDEX_TTL: воркер, пропустивший записи, всё
+# равно перечитает код по истечении TTL.
+QR_CHANGES_RETENTION    = int(os.getenv('QR_CHANGES_RETENTION', '3600'))    # сек
+
+
+QR_FILTER_FP_RATE       = float(os.getenv('QR_FILTER_FP_RATE', '0.001'))
+QR_FILTER_MIN_CAPACITY  = int(os.getenv('QR_FILTER_MIN_CAPACITY', '100000'))
+QR_FILTER_SYNC_INTERVAL = float(os.getenv('QR_FILTER_SYNC_INTERVAL', '1'))   # сек
+
+
+QR_CACHE_MAX_BYTES = int(os.getenv('QR_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+QR_CACHE_DIR       = os.getenv('QR_CACHE_DIR', '')      # пусто — без дискового кэша
+
+QR_ID_BLOCK_SIZE = int(os.getenv('QR_ID_BLOCK_SIZE', '64'))
+
+QR_RENDER_WORKERS     = int(os.getenv('QR_RENDER_WORKERS', str(min(4, os.cpu_count() or 1))))
+QR_RENDER_MAX_PENDING = int(os.getenv('QR_RENDER_MAX_PENDING', '64'))
+
+
+# Лимиты Telegram: ~30 сообщений/с на бота и ~1/с в один чат.
+NOTIFY_GLOBAL_RATE  = float(os.getenv('NOTIFY_GLOBAL_RATE', '25'))     # сообщений/с
+NOTIFY_CHAT_RATE    = float(os.getenv('NOTIFY_CHAT_RATE', '1'))        # сообщений/с в чат
+NOTIFY_CHAT_BURST   = int(os.getenv('NOTIFY_CHAT_BURST', '3'))
+NOTIFY_WORKERS      = int(os.getenv('NOTIFY_WORKERS', '8'))
+NOTIFY_QUEUE_SIZE   = int(os.getenv('NOTIFY_QUEUE_SIZE', '10000'))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '5'))
+NOTIFY_BACKOFF_BASE = float(os.getenv('NOTIFY_BACKOFF_BASE', '1'))     # сек
+
+
+ADMIN_DIGEST_ENABLED    = os.getenv('ADMIN_DIGEST_ENABLED', '1') == '1'
+ADMIN_DIGEST_WINDOW     = float(os.getenv('ADMIN_DIGEST_WINDOW', '60'))      # сек
+ADMIN_DIGEST_MAX_EVENTS = int(os.getenv('ADMIN_DIGEST_MAX_EVENTS', '20'))
+# Виды событий, которые уходят админу сразу, через запятую: payment,review,error
+ADMIN_DIGEST_BYPASS     = {k for k in os.getenv('ADMIN_DIGEST_BYPASS', '').split(',') if k}
+
+
+# Фоновое снятие истёкших QR и подписок и напоминания о скором окончании пакета.
+EXPIRY_INTERVAL    = float(os.getenv('EXPIRY_INTERVAL', '300'))    # сек между проходами, 0 — выключено
+EXPIRY_BATCH       = int(os.getenv('EXPIRY_BATCH', '500'))         # строк за одну транзакцию
+EXPIRY_REMIND_DAYS = int(os.getenv('EXPIRY_REMIND_DAYS', '3'))     # за сколько дней напомнить, 0 — не напоминать
+
+
+STICKER_COLS            = int(os.getenv('STICKER_COLS', '4'))
+STICKER_ROWS            = int(os.getenv('STICKER_ROWS', '6'))
+STICKER_DPI             = int(os.getenv('STICKER_DPI', '300'))
+STICKER_MARGIN_MM       = float(os.getenv('STICKER_MARGIN_MM', '8'))
+STICKER_MAX_PER_COMMAND = int(os.getenv('STICKER_MAX_PER_COMMAND', '1000'))
+
+
+# Гистограммы времени обработчиков, Database, рендера QR и Bot API и состояние
+# очереди записи, кэшей и фильтра qr_id (/perf, /metrics).
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+METRICS_HOST    = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT    = int(os.getenv('METRICS_PORT', '0'))        # 0 — без HTTP-эндпоинта /metrics
+
+
 LOG_LEVEL  = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
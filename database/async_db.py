@@ -0,0 +1,97 @@
+"""
+Асинхронный фасад базы данных QR-Находка
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config.config import DB_READ_WORKERS
+from database.models import Database
+from database.write_queue import WriteQueue
+from utils.cache import MISS
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """
+    Повторяет публичный API Database, но каждый метод возвращает awaitable.
+
+    Чтение выполняется в пуле потоков db-read, запись — через WriteQueue
+    с единственным потоком-писателем: записи идут по очереди, а находки и
+    регистрации пользователей объединяются в пакетные транзакции. Попадания
+    в кэш Database (CACHED_READS) отдаются сразу, без перехода в поток.
+
+    Время вызова для метрик меряется так, как его видит обработчик: вместе
+    с ожиданием в очереди записи или пула чтения.
+    """
+
+    WRITE_METHODS = frozenset({
+        'create_user',
+        'create_subscription',
+        'mark_qr_used',
+        'add_pending_payment',
+        'delete_pending_payment',
+        'create_item',
+        'create_items_bulk',
+        'delete_item',
+        'set_qr_file_id',
+        'clear_qr_file_id',
+        'create_finding',
+        'add_review',
+        'add_dead_letter',
+        'expire_due',
+        'mark_reminders_sent',
+        'prune_qr_changes',
+    })
+
+    def __init__(self, db: Database, read_workers: int = DB_READ_WORKERS):
+        self.sync     = db
+        self.writes   = WriteQueue(db)
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix='db-read')
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        if name in self.sync.BATCH_WRITES:
+            @functools.wraps(attr)
+            async def call(*args, **kwargs):
+                with metrics.timer('db', name):
+                    return await asyncio.wrap_future(self.writes.submit(name, *args, **kwargs))
+        elif name in self.WRITE_METHODS:
+            @functools.wraps(attr)
+            async def call(*args, **kwargs):
+                with metrics.timer('db', name):
+                    return await asyncio.wrap_future(self.writes.submit_call(attr, *args, **kwargs))
+        elif name in self.sync.CACHED_READS:
+            @functools.wraps(attr)
+            async def call(*args, **kwargs):
+                cached = self.sync.peek_cached(name, *args, **kwargs)
+                if cached is not MISS:
+                    metrics.count('db_cache_hits', name)
+                    return cached
+                loop = asyncio.get_running_loop()
+                with metrics.timer('db', name):
+                    return await loop.run_in_executor(
+                        self._readers, functools.partial(attr, *args, **kwargs)
+                    )
+        else:
+            @functools.wraps(attr)
+            async def call(*args, **kwargs):
+                loop = asyncio.get_running_loop()
+                with metrics.timer('db', name):
+                    return await loop.run_in_executor(
+                        self._readers, functools.partial(attr, *args, **kwargs)
+                    )
+
+        setattr(self, name, call)
+        return call
+
+    def close(self):
+        self.writes.close()
+        self._readers.shutdown(wait=True)
+        self.sync.close()
@@ -0,0 +1,532 @@
+"""
+Версионные миграции схемы QR-Находка
+
+Каждая миграция — функция, получающая соединение, и запись в MIGRATIONS.
+Применённые версии хранятся в таблице schema_version; новые миграции
+добавляются только в конец списка.
+
+Обычная миграция выполняется одной транзакцией. Помеченная @streaming
+сама коммитит работу короткими пачками (большие таблицы не блокируются
+целиком) и должна быть идемпотентной: после падения процесса она
+продолжается с места, записанного в migration_progress.
+"""
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Строк за одну транзакцию потоковой миграции.
+STREAMING_BATCH = 5000
+
+
+def streaming(migrate):
+    """Пометить миграцию как выполняемую вне общей транзакции."""
+    migrate.streaming = True
+    return migrate
+
+
+def _m001_initial(conn: sqlite3.Connection):
+    cur = conn.cursor()
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id     INTEGER PRIMARY KEY,
+            username    TEXT    DEFAULT '',
+            full_name   TEXT    DEFAULT '',
+            total_items INTEGER DEFAULT 0,
+            is_active   INTEGER DEFAULT 1,
+            created_at  TEXT    DEFAULT (datetime('now'))
+        )
+    ''')
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id     INTEGER NOT NULL,
+            plan        TEXT    NOT NULL,
+            started_at  TEXT    NOT NULL DEFAULT (datetime('now')),
+            expires_at  TEXT    NOT NULL,
+            qr_used     INTEGER DEFAULT 0,
+            is_active   INTEGER DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    ''')
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS items (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            qr_id       TEXT    UNIQUE NOT NULL,
+            user_id     INTEGER NOT NULL,
+            times_found INTEGER DEFAULT 0,
+            is_active   INTEGER DEFAULT 1,
+            added_at    TEXT    DEFAULT (datetime('now')),
+            expires_at  TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    ''')
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS findings (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            qr_id        TEXT    NOT NULL,
+            owner_id     INTEGER NOT NULL,
+            finder_id    INTEGER,
+            finder_name  TEXT    DEFAULT 'Аноним',
+            finder_username TEXT DEFAULT '',
+            found_at     TEXT    DEFAULT (datetime('now')),
+            FOREIGN KEY (qr_id) REFERENCES items(qr_id)
+        )
+    ''')
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS pending_payments (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id    INTEGER NOT NULL,
+            plan       TEXT    NOT NULL,
+            created_at TEXT    DEFAULT (datetime('now'))
+        )
+    ''')
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id     INTEGER NOT NULL,
+            full_name   TEXT    DEFAULT '',
+            rating      INTEGER NOT NULL,
+            review_text TEXT    DEFAULT '',
+            created_at  TEXT    DEFAULT (datetime('now')),
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    ''')
+
+
+def _m002_access_path_indexes(conn: sqlite3.Connection):
+    cur = conn.cursor()
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_findings_owner ON findings (owner_id, found_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_findings_finder ON findings (finder_id, found_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_items_user ON items (user_id, is_active, added_at)')
+    cur.execute(
+        'CREATE INDEX IF NOT EXISTS idx_subscriptions_user '
+        'ON subscriptions (user_id, is_active, expires_at)'
+    )
+
+
+def _m003_qr_file_ids(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS qr_file_ids (
+            qr_id      TEXT PRIMARY KEY,
+            file_id    TEXT NOT NULL,
+            updated_at TEXT DEFAULT (datetime('now'))
+        )
+    ''')
+
+
+def _m004_qr_id_sequence(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS qr_id_seq (
+            name       TEXT PRIMARY KEY,
+            next_value INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO qr_id_seq (name, next_value) VALUES ('items', 0)")
+
+
+def _m005_notification_dead_letters(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notification_dead_letters (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id    INTEGER NOT NULL,
+            text       TEXT    NOT NULL,
+            payload    TEXT    DEFAULT '',
+            error      TEXT    DEFAULT '',
+            attempts   INTEGER DEFAULT 0,
+            created_at TEXT    DEFAULT (datetime('now'))
+        )
+    ''')
+
+
+def _m006_stats_counters(conn: sqlite3.Connection):
+    # Одна строка со счётчиками; триггеры поддерживают её при любой записи,
+    # включая правки базы в обход Database.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats (
+            id           INTEGER PRIMARY KEY CHECK (id = 1),
+            users        INTEGER NOT NULL DEFAULT 0,
+            items        INTEGER NOT NULL DEFAULT 0,
+            findings     INTEGER NOT NULL DEFAULT 0,
+            reviews      INTEGER NOT NULL DEFAULT 0,
+            rating_sum   INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO stats (id, users, items, findings, reviews, rating_sum) VALUES (1,
+            (SELECT COUNT(*) FROM users WHERE is_active = 1),
+            (SELECT COUNT(*) FROM items WHERE is_active = 1),
+            (SELECT COUNT(*) FROM findings),
+            (SELECT COUNT(*) FROM reviews),
+            (SELECT COALESCE(SUM(rating), 0) FROM reviews))
+    ''')
+
+    # Для users и items считаются только активные строки. executescript не
+    # годится: он коммитит открытую транзакцию миграции.
+    triggers = []
+    for table in ('users', 'items'):
+        triggers += [
+            f'''CREATE TRIGGER IF NOT EXISTS stats_{table}_insert AFTER INSERT ON {table}
+                WHEN NEW.is_active = 1
+                BEGIN UPDATE stats SET {table} = {table} + 1 WHERE id = 1; END''',
+            f'''CREATE TRIGGER IF NOT EXISTS stats_{table}_delete AFTER DELETE ON {table}
+                WHEN OLD.is_active = 1
+                BEGIN UPDATE stats SET {table} = {table} - 1 WHERE id = 1; END''',
+            f'''CREATE TRIGGER IF NOT EXISTS stats_{table}_active AFTER UPDATE OF is_active ON {table}
+                WHEN (NEW.is_active = 1) != (OLD.is_active = 1)
+                BEGIN
+                    UPDATE stats SET {table} = {table} + (NEW.is_active = 1) - (OLD.is_active = 1)
+                    WHERE id = 1;
+                END''',
+        ]
+    triggers += [
+        '''CREATE TRIGGER IF NOT EXISTS stats_findings_insert AFTER INSERT ON findings
+            BEGIN UPDATE stats SET findings = findings + 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_findings_delete AFTER DELETE ON findings
+            BEGIN UPDATE stats SET findings = findings - 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_reviews_insert AFTER INSERT ON reviews
+            BEGIN
+                UPDATE stats SET reviews = reviews + 1, rating_sum = rating_sum + NEW.rating
+                WHERE id = 1;
+            END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_reviews_delete AFTER DELETE ON reviews
+            BEGIN
+                UPDATE stats SET reviews = reviews - 1, rating_sum = rating_sum - OLD.rating
+                WHERE id = 1;
+            END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_reviews_rating AFTER UPDATE OF rating ON reviews
+            BEGIN
+                UPDATE stats SET rating_sum = rating_sum + NEW.rating - OLD.rating WHERE id = 1;
+            END''',
+    ]
+    for sql in triggers:
+        conn.execute(sql)
+
+
+def _m007_expiry(conn: sqlite3.Connection):
+    # Частичные индексы: в них только действующие строки, и проход по
+    # истёкшим не читает всю таблицу.
+    conn.execute('ALTER TABLE subscriptions ADD COLUMN reminder_sent INTEGER DEFAULT 0')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_items_expiry ON items (expires_at) '
+        'WHERE is_active = 1 AND expires_at IS NOT NULL'
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_subscriptions_expiry ON subscriptions (expires_at) '
+        'WHERE is_active = 1'
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_subscriptions_reminder ON subscriptions (expires_at) '
+        'WHERE is_active = 1 AND reminder_sent = 0'
+    )
+
+
+# Таблица -> столбцы времени, которые миграция 8 переводит из TEXT
+# ('YYYY-MM-DD HH:MM:SS') в INTEGER — секунды Unix.
+EPOCH_COLUMNS = {
+    'users':            ('created_at',),
+    'subscriptions':    ('started_at', 'expires_at'),
+    'items':            ('added_at', 'expires_at'),
+    'findings':         ('found_at',),
+    'pending_payments': ('created_at',),
+    'reviews':          ('created_at',),
+    'qr_file_ids':      ('updated_at',),
+}
+
+# Текущее время в секундах Unix как DEFAULT (unixepoch() есть только с 3.38).
+NOW_EPOCH = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+# Таблицы после перевода: прежние столбцы и ограничения, время — INTEGER.
+# Первый столбец из EPOCH_COLUMNS у каждой таблицы имеет DEFAULT — по нему
+# _epoch_done отличает пересобранную таблицу.
+EPOCH_TABLES = {
+    'users': '''
+        CREATE TABLE {name} (
+            user_id     INTEGER PRIMARY KEY,
+            username    TEXT    DEFAULT '',
+            full_name   TEXT    DEFAULT '',
+            total_items INTEGER DEFAULT 0,
+            is_active   INTEGER DEFAULT 1,
+            created_at  INTEGER DEFAULT {now}
+        )''',
+    'subscriptions': '''
+        CREATE TABLE {name} (
+            id            INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id       INTEGER NOT NULL,
+            plan          TEXT    NOT NULL,
+            started_at    INTEGER NOT NULL DEFAULT {now},
+            expires_at    INTEGER NOT NULL,
+            qr_used       INTEGER DEFAULT 0,
+            is_active     INTEGER DEFAULT 1,
+            reminder_sent INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )''',
+    'items': '''
+        CREATE TABLE {name} (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            qr_id       TEXT    UNIQUE NOT NULL,
+            user_id     INTEGER NOT NULL,
+            times_found INTEGER DEFAULT 0,
+            is_active   INTEGER DEFAULT 1,
+            added_at    INTEGER DEFAULT {now},
+            expires_at  INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )''',
+    'findings': '''
+        CREATE TABLE {name} (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            qr_id        TEXT    NOT NULL,
+            owner_id     INTEGER NOT NULL,
+            finder_id    INTEGER,
+            finder_name  TEXT    DEFAULT 'Аноним',
+            finder_username TEXT DEFAULT '',
+            found_at     INTEGER DEFAULT {now},
+            FOREIGN KEY (qr_id) REFERENCES items(qr_id)
+        )''',
+    'pending_payments': '''
+        CREATE TABLE {name} (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id    INTEGER NOT NULL,
+            plan       TEXT    NOT NULL,
+            created_at INTEGER DEFAULT {now}
+        )''',
+    'reviews': '''
+        CREATE TABLE {name} (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id     INTEGER NOT NULL,
+            full_name   TEXT    DEFAULT '',
+            rating      INTEGER NOT NULL,
+            review_text TEXT    DEFAULT '',
+            created_at  INTEGER DEFAULT {now},
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )''',
+    'qr_file_ids': '''
+        CREATE TABLE {name} (
+            qr_id      TEXT PRIMARY KEY,
+            file_id    TEXT NOT NULL,
+            updated_at INTEGER DEFAULT {now}
+        )''',
+}
+
+# Эти столбцы приложение заполняло само, в местном времени процесса
+# (datetime.now() в create_subscription; срок QR копировался из подписки).
+# Остальные писали значения по умолчанию datetime('now') — это UTC.
+LOCAL_TIME_COLUMNS = {
+    ('subscriptions', 'started_at'),
+    ('subscriptions', 'expires_at'),
+    ('items', 'expires_at'),
+}
+
+
+def _epoch_expr(table: str, col: str) -> str:
+    """SQL перевода текстового времени столбца в секунды Unix."""
+    if (table, col) in LOCAL_TIME_COLUMNS:
+        return f"CAST(strftime('%s', {col}, 'utc') AS INTEGER)"
+    return f"CAST(strftime('%s', {col}) AS INTEGER)"
+
+
+def _column_types(conn: sqlite3.Connection, table: str) -> dict:
+    return {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _epoch_done(conn: sqlite3.Connection, table: str) -> bool:
+    """Таблица уже пересобрана: время — INTEGER со значением по умолчанию."""
+    column = EPOCH_COLUMNS[table][0]
+    for row in conn.execute(f'PRAGMA table_info({table})'):
+        if row[1] == column:
+            return row[2].upper() == 'INTEGER' and row[4] is not None
+    return False
+
+
+def _epoch_backfill(conn: sqlite3.Connection, table: str, columns: tuple, batch: int):
+    """Заполнить <col>_epoch пачками по rowid, сохраняя позицию после каждой."""
+    key  = f'epoch:{table}'
+    row  = conn.execute('SELECT position FROM migration_progress WHERE name = ?', (key,)).fetchone()
+    last = row[0] if row else 0
+    sets = ', '.join(f"{col}_epoch = {_epoch_expr(table, col)}" for col in columns)
+    while True:
+        bound = conn.execute(
+            f'SELECT MAX(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?)',
+            (last, batch)
+        ).fetchone()[0]
+        if bound is None:
+            return
+        conn.execute(f'UPDATE {table} SET {sets} WHERE rowid > ? AND rowid <= ?', (last, bound))
+        conn.execute(
+            'INSERT OR REPLACE INTO migration_progress (name, position) VALUES (?, ?)', (key, bound)
+        )
+        conn.commit()
+        last = bound
+
+
+def _epoch_rebuild(conn: sqlite3.Connection, table: str, columns: tuple):
+    """
+    Пересобрать таблицу по EPOCH_TABLES: CREATE новой, INSERT…SELECT,
+    DROP старой, RENAME. Строки, записанные во время переноса, досчитываются
+    здесь же. Индексы и триггеры пропадают вместе со старой таблицей и
+    создаются заново тем же SQL.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if _epoch_done(conn, table):
+            conn.rollback()
+            return
+        types = _column_types(conn, table)
+        saved = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') "
+            "AND tbl_name = ? AND sql IS NOT NULL ORDER BY type",
+            (table,)
+        ).fetchall()
+        seq = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+
+        conn.execute(f'DROP TABLE IF EXISTS {table}_new')
+        conn.execute(EPOCH_TABLES[table].format(name=f'{table}_new', now=NOW_EPOCH))
+        target = [row[1] for row in conn.execute(f'PRAGMA table_info({table}_new)')]
+        exprs  = [
+            f'COALESCE({col}_epoch, {_epoch_expr(table, col)})'
+            if col in columns and types[col] != 'INTEGER' else col
+            for col in target
+        ]
+        conn.execute(
+            f'INSERT INTO {table}_new ({", ".join(target)}) SELECT {", ".join(exprs)} FROM {table}'
+        )
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+        for (sql,) in saved:
+            conn.execute(sql)
+        # AUTOINCREMENT не должен выдать заново номера удалённых строк. Для
+        # пустой таблицы строки в sqlite_sequence нет, а уникального ключа по
+        # name там нет вовсе — поэтому не UPDATE и не REPLACE, а DELETE + INSERT.
+        if seq:
+            current = conn.execute(
+                'SELECT MAX(seq) FROM sqlite_sequence WHERE name = ?', (table,)
+            ).fetchone()[0] or 0
+            conn.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+            conn.execute(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, max(seq[0], current))
+            )
+        conn.execute('DELETE FROM migration_progress WHERE name = ?', (f'epoch:{table}',))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _epoch_convert(conn: sqlite3.Connection, batch: int):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS migration_progress (
+            name     TEXT PRIMARY KEY,
+            position INTEGER NOT NULL
+        )
+    ''')
+    conn.commit()
+    for table, columns in EPOCH_COLUMNS.items():
+        if _epoch_done(conn, table):
+            continue
+        # Текст переводится заранее, пачками во временные <col>_epoch;
+        # под блокировкой пересборки остаётся только копирование.
+        if _column_types(conn, table).get(columns[0]) != 'INTEGER':
+            conn.execute('BEGIN IMMEDIATE')
+            types = _column_types(conn, table)
+            for col in columns:
+                if f'{col}_epoch' not in types:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {col}_epoch INTEGER')
+            conn.commit()
+            _epoch_backfill(conn, table, columns, batch)
+        _epoch_rebuild(conn, table, columns)
+        logger.info(f"Время в {table} переведено в секунды Unix")
+
+
+@streaming
+def _m008_epoch_timestamps(conn: sqlite3.Connection, batch: int = STREAMING_BATCH):
+    # Таблицы пересобираются по EPOCH_TABLES — с прежними NOT NULL и
+    # значениями по умолчанию, но уже в секундах Unix.
+    _epoch_convert(conn, batch)
+
+
+def _m009_qr_changes(conn: sqlite3.Connection):
+    # Журнал изменённых qr_id: по нему процессы с индексом сканирований
+    # (веб-воркеры) узнают о выпуске, удалении и истечении кодов, сделанных
+    # в других процессах. Старые записи удаляет фоновое истечение.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS qr_changes (
+            seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+            qr_id      TEXT    NOT NULL,
+            changed_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+    triggers = [
+        '''CREATE TRIGGER IF NOT EXISTS qr_changes_insert AFTER INSERT ON items
+            BEGIN INSERT INTO qr_changes (qr_id) VALUES (NEW.qr_id); END''',
+        '''CREATE TRIGGER IF NOT EXISTS qr_changes_update
+            AFTER UPDATE OF is_active, expires_at, user_id ON items
+            BEGIN INSERT INTO qr_changes (qr_id) VALUES (NEW.qr_id); END''',
+        '''CREATE TRIGGER IF NOT EXISTS qr_changes_delete AFTER DELETE ON items
+            BEGIN INSERT INTO qr_changes (qr_id) VALUES (OLD.qr_id); END''',
+    ]
+    for sql in triggers:
+        conn.execute(sql)
+
+
+MIGRATIONS = [
+    (1, 'Начальная схема', _m001_initial),
+    (2, 'Индексы для findings, items и subscriptions', _m002_access_path_indexes),
+    (3, 'Telegram file_id загруженных QR', _m003_qr_file_ids),
+    (4, 'Последовательность для выдачи qr_id', _m004_qr_id_sequence),
+    (5, 'Неотправленные уведомления', _m005_notification_dead_letters),
+    (6, 'Счётчики статистики с триггерами', _m006_stats_counters),
+    (7, 'Индексы по сроку действия и напоминания', _m007_expiry),
+    (8, 'Время — целые секунды Unix вместо текста', _m008_epoch_timestamps),
+    (9, 'Журнал изменений qr_id для индекса сканирований', _m009_qr_changes),
+]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """Применить недостающие миграции. Возвращает итоговую версию схемы."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version     INTEGER PRIMARY KEY,
+            description TEXT    DEFAULT '',
+            applied_at  TEXT    DEFAULT (datetime('now'))
+        )
+    ''')
+    conn.commit()
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version(conn):
+            continue
+        if getattr(migrate, 'streaming', False):
+            # Свои короткие транзакции; версия записывается только после
+            # полного выполнения, прерванная миграция продолжится при запуске.
+            migrate(conn)
+        # BEGIN IMMEDIATE: бот и веб-сервер могут стартовать одновременно.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            if not getattr(migrate, 'streaming', False):
+                migrate(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception(f"Миграция {version} ({description}) не применена")
+            raise
+        logger.info(f"Применена миграция {version}: {description}")
+
+    return current_version(conn)
@@ -3,36 +3,92 @@
 """
 import sqlite3
 import logging
-import uuid
-import qrcode
-import io
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime
+from typing import Optional, Union
+
+from config.config import (
+    DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_HEALTH_INTERVAL,
+    DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_CACHE_SIZE, DB_MMAP_SIZE, DB_TEMP_STORE, DB_BUSY_TIMEOUT,
+    QR_CACHE_MAX_BYTES, QR_CACHE_DIR, QR_ID_BLOCK_SIZE,
+    CACHE_ENABLED, CACHE_TTL, CACHE_MAX_ENTRIES, STATS_CACHE_TTL,
+    SCAN_INDEX_MAX_ENTRIES, SCAN_INDEX_TTL, SCAN_INDEX_NEGATIVE_MAX, SCAN_INDEX_NEGATIVE_TTL,
+    QR_FILTER_FP_RATE, QR_FILTER_MIN_CAPACITY, QR_FILTER_SYNC_INTERVAL,
+    EXPIRY_BATCH,
+)
+from database.migrations import apply_migrations
+from database.pool import ConnectionPool
+from database.qr_filter import QRIdFilter
+from database.qr_ids import QRIdAllocator
+from database.scan_index import ScanIndex, ScanRecord
+from utils.cache import MISS, TTLCache
+from utils.qr_cache import QRImageCache
 
 logger = logging.getLogger(__name__)
 
 
-def _qr_image_bytes(url: str) -> bytes:
-    """Генерирует PNG QR-кода и возвращает bytes."""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
+# Время в базе — целые секунды Unix (миграция 8). Переводы в datetime и
+# строки для показа — только через эти функции.
+DAY = 86400
+
+
+def now_ts() -> int:
+    return int(time.time())
+
+
+def to_ts(value: Union[datetime, str, None]) -> Optional[int]:
+    """
+    datetime или 'YYYY-MM-DD[ HH:MM:SS]' в местном времени -> секунды Unix.
+
+    В местном времени до миграции 8 хранились сроки подписок и QR; время
+    по умолчанию (datetime('now')) было в UTC — миграция учитывает оба.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+
+def from_ts(ts: Optional[int]) -> Optional[datetime]:
+    return datetime.fromtimestamp(ts) if ts is not None else None
+
+
+def format_ts(ts: Optional[int], fmt: str = '%Y-%m-%d') -> str:
+    """Время из базы для показа пользователю (по умолчанию — дата)."""
+    return datetime.fromtimestamp(ts).strftime(fmt) if ts is not None else ''
 
 
 class Database:
-    def __init__(self, db_path):
+    def __init__(self, db_path, pool_size: int = DB_POOL_SIZE, cache_enabled: bool = CACHE_ENABLED):
         self.db_path = str(db_path)
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.pool = ConnectionPool(
+            self.get_connection,
+            max_size=pool_size,
+            timeout=DB_POOL_TIMEOUT,
+            health_check_interval=DB_POOL_HEALTH_INTERVAL,
+        ) if pool_size > 0 else None
+        self.qr_cache = QRImageCache(QR_CACHE_MAX_BYTES, QR_CACHE_DIR or None)
+        self.qr_ids   = QRIdAllocator(self.get_connection, QR_ID_BLOCK_SIZE)
+
+        # user_id -> зарегистрирован ли; user_id -> активная подписка или None.
+        self.users_cache         = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL, cache_enabled)
+        self.subscriptions_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_TTL, cache_enabled)
+        # Снимок get_statistics: сами счётчики читаются за O(1), кэш избавляет
+        # от похода в поток базы на каждый / и /stats.
+        self.stats_cache         = TTLCache(1, STATS_CACHE_TTL, cache_enabled)
+        self.scan_index          = ScanIndex(
+            SCAN_INDEX_MAX_ENTRIES, SCAN_INDEX_TTL,
+            SCAN_INDEX_NEGATIVE_MAX, SCAN_INDEX_NEGATIVE_TTL, cache_enabled,
+        )
+        self.qr_filter           = QRIdFilter(
+            QR_FILTER_FP_RATE, QR_FILTER_MIN_CAPACITY, QR_FILTER_SYNC_INTERVAL,
+        )
+        self._tx                 = threading.local()
         self.init_db()
 
     
@@ -40,317 +96,598 @@ class Database:
     
 
     def init_db(self):
-        conn = self.get_connection()
-        cur  = conn.cursor()
+        with self.connection() as conn:
+            journal = conn.execute(f'PRAGMA journal_mode={DB_JOURNAL_MODE}').fetchone()[0]
+            version = apply_migrations(conn)
+        logger.info(f"База данных инициализирована (схема v{version}, journal_mode={journal})")
 
-        
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id     INTEGER PRIMARY KEY,
-                username    TEXT    DEFAULT '',
-                full_name   TEXT    DEFAULT '',
-                total_items INTEGER DEFAULT 0,
-                is_active   INTEGER DEFAULT 1,
-                created_at  TEXT    DEFAULT (datetime('now'))
-            )
-        ''')
-
-        
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS subscriptions (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id     INTEGER NOT NULL,
-                plan        TEXT    NOT NULL,
-                started_at  TEXT    NOT NULL DEFAULT (datetime('now')),
-                expires_at  TEXT    NOT NULL,
-                qr_used     INTEGER DEFAULT 0,
-                is_active   INTEGER DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        ''')
+    
 
-        
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS items (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                qr_id       TEXT    UNIQUE NOT NULL,
-                user_id     INTEGER NOT NULL,
-                times_found INTEGER DEFAULT 0,
-                is_active   INTEGER DEFAULT 1,
-                added_at    TEXT    DEFAULT (datetime('now')),
-                expires_at  TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        ''')
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=self.pool is None)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}')
+        conn.execute(f'PRAGMA synchronous = {DB_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size = {DB_CACHE_SIZE}')
+        conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+        conn.execute(f'PRAGMA temp_store = {DB_TEMP_STORE}')
+        return conn
 
-        
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS findings (
-                id           INTEGER PRIMARY KEY AUTOINCREMENT,
-                qr_id        TEXT    NOT NULL,
-                owner_id     INTEGER NOT NULL,
-                finder_id    INTEGER,
-                finder_name  TEXT    DEFAULT 'Аноним',
-                finder_username TEXT DEFAULT '',
-                found_at     TEXT    DEFAULT (datetime('now')),
-                FOREIGN KEY (qr_id) REFERENCES items(qr_id)
-            )
-        ''')
+    @contextmanager
+    def connection(self):
+        """Соединение из пула; при pool_size=0 — новое на каждый вызов."""
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+            return
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
 
-        
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS pending_payments (
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id    INTEGER NOT NULL,
-                plan       TEXT    NOT NULL,
-                created_at TEXT    DEFAULT (datetime('now'))
-            )
-        ''')
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
 
-        
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS reviews (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id     INTEGER NOT NULL,
-                full_name   TEXT    DEFAULT '',
-                rating      INTEGER NOT NULL,
-                review_text TEXT    DEFAULT '',
-                created_at  TEXT    DEFAULT (datetime('now')),
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        ''')
+    
 
-        conn.commit()
-        conn.close()
-        logger.info("База данных инициализирована")
+    # Записи, которые можно объединять в пакеты: имя метода -> результат при ошибке.
+    BATCH_WRITES = {
+        'create_user':    False,
+        'create_finding': False,
+        'resolve_scan':   {'status': 'error', 'item': None},
+    }
+
+    def apply_writes(self, ops: list) -> list:
+        """
+        Выполнить пакет записей [(метод, args, kwargs), ...] одной транзакцией.
+
+        Каждая запись идёт в своём SAVEPOINT: ошибка одной откатывает только
+        её, а вместо результата возвращается значение из BATCH_WRITES.
+        """
+        results = []
+        self._tx.invalidate = []
+        try:
+            with self.connection() as conn:
+                cur = conn.cursor()
+                cur.execute('BEGIN IMMEDIATE')
+                for name, args, kwargs in ops:
+                    cur.execute('SAVEPOINT write_op')
+                    try:
+                        results.append(getattr(self, f'_write_{name}')(cur, *args, **kwargs))
+                    except Exception as e:
+                        cur.execute('ROLLBACK TO write_op')
+                        logger.error(f"Ошибка записи {name}: {e}")
+                        results.append(self.BATCH_WRITES[name])
+                    cur.execute('RELEASE write_op')
+                conn.commit()
+        finally:
+            pending, self._tx.invalidate = self._tx.invalidate, None
+            for cache, key in pending:
+                cache.invalidate(key)
+        return results
+
+    def _invalidate_after_commit(self, cache: TTLCache, key):
+        """Внутри apply_writes — отложить инвалидацию до COMMIT, иначе сбросить сразу."""
+        pending = getattr(self._tx, 'invalidate', None)
+        if pending is None:
+            cache.invalidate(key)
+        else:
+            pending.append((cache, key))
 
     
 
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+    # Чтения, которые AsyncDatabase может отдать из кэша, не уходя в поток базы.
+    CACHED_READS = frozenset({
+        'user_exists', 'get_active_subscription', 'get_active_package', 'get_user_dashboard',
+        'lookup_qr', 'get_item_by_qr', 'get_statistics',
+    })
+
+    def peek_cached(self, name: str, key=None, **kwargs):
+        """Результат чтения из CACHED_READS без обращения к базе или MISS."""
+        if name == 'user_exists':
+            return self.users_cache.get(key)
+        if name == 'get_statistics':
+            return self.stats_cache.get(None)
+        if name == 'get_user_dashboard':
+            return MISS if kwargs.get('with_items', True) else self.peek_dashboard(key)
+        if name in ('lookup_qr', 'get_item_by_qr'):
+            if self.qr_filter.check(key) is False:
+                return None
+            record = self.scan_index.peek(key)
+            if name == 'lookup_qr':
+                return record
+            # Полную строку не кэшируем, но про неизвестный код ответ уже известен.
+            return None if record is None else MISS
+        return self.subscriptions_cache.get(key)
+
+    def invalidate_user(self, user_id: int):
+        """Сбросить кэш пользователя и его подписки (например, после правки базы извне)."""
+        self.users_cache.invalidate(user_id)
+        self.subscriptions_cache.invalidate(user_id)
+
+    def cache_stats(self) -> dict:
+        return {
+            'users':         self.users_cache.stats(),
+            'subscriptions': self.subscriptions_cache.stats(),
+            'stats':         self.stats_cache.stats(),
+            'scan_index':    self.scan_index.stats(),
+        }
+
+    def _cache_subscription(self, user_id: int, sub: Optional[dict], token: int):
+        # Запись не должна пережить срок самой подписки.
+        ttl = None
+        if sub:
+            ttl = sub['expires_at'] - time.time()
+        self.subscriptions_cache.put(user_id, sub, ttl=ttl, token=token)
 
     
 
     def user_exists(self, user_id: int) -> bool:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute('SELECT 1 FROM users WHERE user_id = ?', (user_id,))
-        result = cur.fetchone()
-        conn.close()
-        return result is not None
-
-    def create_user(self, user_id: int, username: str, full_name: str):
-        conn = self.get_connection()
-        cur  = conn.cursor()
+        cached = self.users_cache.get(user_id)
+        if cached is not MISS:
+            return cached
+        token = self.users_cache.token()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT 1 FROM users WHERE user_id = ?', (user_id,))
+            result = cur.fetchone() is not None
+        self.users_cache.put(user_id, result, token=token)
+        return result
+
+    def create_user(self, user_id: int, username: str, full_name: str) -> bool:
+        """Зарегистрировать пользователя. True — если его ещё не было."""
+        return self.apply_writes([('create_user', (user_id, username, full_name), {})])[0]
+
+    def _write_create_user(self, cur, user_id: int, username: str, full_name: str) -> bool:
         cur.execute(
-            'INSERT OR IGNORE INTO users (user_id, username, full_name) VALUES (?, ?, ?)',
-            (user_id, username, full_name)
+            'INSERT OR IGNORE INTO users (user_id, username, full_name, created_at) VALUES (?, ?, ?, ?)',
+            (user_id, username, full_name, now_ts())
         )
-        conn.commit()
-        conn.close()
+        if cur.rowcount > 0:
+            self._invalidate_after_commit(self.users_cache, user_id)
+            return True
+        return False
 
     def get_user(self, user_id: int) -> Optional[dict]:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        row = cur.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            row = cur.fetchone()
+            return dict(row) if row else None
 
     
 
     def get_active_subscription(self, user_id: int) -> Optional[dict]:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute('''
-            SELECT * FROM subscriptions
-            WHERE user_id = ? AND is_active = 1
-              AND expires_at > datetime('now')
-            ORDER BY expires_at DESC LIMIT 1
-        ''', (user_id,))
-        row = cur.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        cached = self.subscriptions_cache.get(user_id)
+        if cached is not MISS:
+            return cached
+        token = self.subscriptions_cache.token()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT * FROM subscriptions
+                WHERE user_id = ? AND is_active = 1
+                ORDER BY expires_at DESC LIMIT 1
+            ''', (user_id,))
+            row = cur.fetchone()
+        sub = _unexpired(dict(row) if row else None)
+        self._cache_subscription(user_id, sub, token)
+        return sub
 
     def create_subscription(self, user_id: int, plan: str, days: int) -> dict:
-        conn    = self.get_connection()
-        cur     = conn.cursor()
-        cur.execute(
-            'UPDATE subscriptions SET is_active = 0 WHERE user_id = ? AND is_active = 1',
-            (user_id,)
-        )
-        started   = datetime.now()
-        expires   = started + timedelta(days=days)
-        started_s = started.strftime('%Y-%m-%d %H:%M:%S')
-        expires_s = expires.strftime('%Y-%m-%d %H:%M:%S')
-        cur.execute(
-            'INSERT INTO subscriptions (user_id, plan, started_at, expires_at) VALUES (?, ?, ?, ?)',
-            (user_id, plan, started_s, expires_s)
-        )
-        conn.commit()
-        conn.close()
-        return {'plan': plan, 'started_at': started_s, 'expires_at': expires_s}
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                'UPDATE subscriptions SET is_active = 0 WHERE user_id = ? AND is_active = 1',
+                (user_id,)
+            )
+            started = now_ts()
+            expires = started + days * DAY
+            cur.execute(
+                'INSERT INTO subscriptions (user_id, plan, started_at, expires_at) VALUES (?, ?, ?, ?)',
+                (user_id, plan, started, expires)
+            )
+            conn.commit()
+            self.subscriptions_cache.invalidate(user_id)
+            return {'plan': plan, 'started_at': started, 'expires_at': expires}
 
     def mark_qr_used(self, user_id: int):
         """Отметить что QR уже создан в рамках подписки."""
-        conn = self.get_connection()
-        cur  = conn.cursor()
+        with self.connection() as conn:
+            self._mark_qr_used(conn.cursor(), user_id)
+            conn.commit()
+        self.subscriptions_cache.invalidate(user_id)
+
+    def _mark_qr_used(self, cur, user_id: int):
         cur.execute('''
             UPDATE subscriptions SET qr_used = 1
             WHERE user_id = ? AND is_active = 1
-              AND expires_at > datetime('now')
         ''', (user_id,))
-        conn.commit()
-        conn.close()
 
-    def add_pending_payment(self, user_id: int, plan: str):
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute(
-            'INSERT INTO pending_payments (user_id, plan) VALUES (?, ?)',
-            (user_id, plan)
-        )
-        conn.commit()
-        conn.close()
+    def add_pending_payment(self, user_id: int, plan: str) -> Optional[dict]:
+        """Записать заявку на оплату. Возвращает пользователя для уведомления админа."""
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                'INSERT INTO pending_payments (user_id, plan, created_at) VALUES (?, ?, ?)',
+                (user_id, plan, now_ts())
+            )
+            conn.commit()
+            cur.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            row = cur.fetchone()
+            return dict(row) if row else None
 
     def get_pending_payments(self) -> list:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute('''
-            SELECT pp.*, u.full_name, u.username
-            FROM pending_payments pp
-            JOIN users u ON pp.user_id = u.user_id
-            ORDER BY pp.created_at ASC
-        ''')
-        rows = [dict(r) for r in cur.fetchall()]
-        conn.close()
-        return rows
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT pp.*, u.full_name, u.username
+                FROM pending_payments pp
+                JOIN users u ON pp.user_id = u.user_id
+                ORDER BY pp.created_at ASC
+            ''')
+            rows = [dict(r) for r in cur.fetchall()]
+            return rows
 
     def delete_pending_payment(self, payment_id: int):
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute('DELETE FROM pending_payments WHERE id = ?', (payment_id,))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('DELETE FROM pending_payments WHERE id = ?', (payment_id,))
+            conn.commit()
 
     
 
-    def _generate_qr_id(self) -> str:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        while True:
-            qr_id = 'QR' + uuid.uuid4().hex[:6].upper()
-            cur.execute('SELECT 1 FROM items WHERE qr_id = ?', (qr_id,))
-            if not cur.fetchone():
-                conn.close()
-                return qr_id
-
-    def create_item(self, user_id: int, expires_at: Optional[str] = None) -> Optional[dict]:
-        """Создать QR без названия. Возвращает словарь или None."""
-        qr_id = self._generate_qr_id()
-        conn  = self.get_connection()
-        cur   = conn.cursor()
-        try:
-            cur.execute(
-                'INSERT INTO items (qr_id, user_id, expires_at) VALUES (?, ?, ?)',
-                (qr_id, user_id, expires_at)
+    def create_item(self, user_id: int, expires_at: Optional[int] = None,
+                    mark_qr_used: bool = False) -> Optional[dict]:
+        """Создать QR без названия. Возвращает словарь или None.
+
+        mark_qr_used=True в той же транзакции отмечает QR в активной подписке.
+        """
+        with self.connection() as conn:
+            cur = conn.cursor()
+            for attempt in range(3):
+                qr_id = self.qr_ids.next()
+                try:
+                    cur.execute(
+                        'INSERT INTO items (qr_id, user_id, added_at, expires_at) VALUES (?, ?, ?, ?)',
+                        (qr_id, user_id, now_ts(), expires_at)
+                    )
+                    cur.execute(
+                        'UPDATE users SET total_items = total_items + 1 WHERE user_id = ?',
+                        (user_id,)
+                    )
+                    if mark_qr_used:
+                        self._mark_qr_used(cur, user_id)
+                    conn.commit()
+                    if mark_qr_used:
+                        self.subscriptions_cache.invalidate(user_id)
+                    self.scan_index.added(qr_id, user_id, expires_at)
+                    self.qr_filter.add(qr_id)
+                    return {'qr_id': qr_id, 'expires_at': expires_at}
+                except sqlite3.IntegrityError as e:
+                    # Возможно только при ручной правке qr_id_seq — берём следующий номер.
+                    conn.rollback()
+                    logger.warning(f"qr_id {qr_id} уже занят (попытка {attempt + 1}): {e}")
+                except Exception as e:
+                    logger.error(f"Ошибка создания вещи: {e}")
+                    return None
+            return None
+
+    def get_user_dashboard(self, user_id: int, with_items: bool = True) -> Optional[dict]:
+        """
+        Всё для экранов «Мои QR» и «Купить» одним запросом:
+        {'package': активная подписка или None, 'items': [...]}.
+        None — если пользователя нет. Без items ответ может прийти из кэша.
+        """
+        if not with_items:
+            cached = self.peek_dashboard(user_id)
+            if cached is not MISS:
+                return cached
+
+        users_token, subs_token = self.users_cache.token(), self.subscriptions_cache.token()
+        items_join = (
+            'LEFT JOIN items i ON i.user_id = u.user_id AND i.is_active = 1'
+            if with_items else 'LEFT JOIN items i ON 0'
+        )
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f'''
+                SELECT u.user_id AS u_user_id,
+                       s.id AS s_id, s.plan AS s_plan, s.started_at AS s_started_at,
+                       s.expires_at AS s_expires_at, s.qr_used AS s_qr_used, s.is_active AS s_is_active,
+                       i.*
+                FROM users u
+                LEFT JOIN subscriptions s ON s.id = (
+                    SELECT id FROM subscriptions
+                    WHERE user_id = u.user_id AND is_active = 1
+                    ORDER BY expires_at DESC LIMIT 1
+                )
+                {items_join}
+                WHERE u.user_id = ?
+                ORDER BY i.added_at DESC
+            ''', (user_id,))
+            rows = cur.fetchall()
+
+        if not rows:
+            self.users_cache.put(user_id, False, token=users_token)
+            return None
+        first = rows[0]
+        package = None
+        if first['s_id'] is not None:
+            package = {
+                'id':         first['s_id'],
+                'user_id':    user_id,
+                'plan':       first['s_plan'],
+                'started_at': first['s_started_at'],
+                'expires_at': first['s_expires_at'],
+                'qr_used':    first['s_qr_used'],
+                'is_active':  first['s_is_active'],
+            }
+        package = _unexpired(package)
+        self.users_cache.put(user_id, True, token=users_token)
+        self._cache_subscription(user_id, package, subs_token)
+
+        items = [
+            {k: r[k] for k in r.keys() if not k.startswith(('u_', 's_'))}
+            for r in rows if r['qr_id'] is not None
+        ]
+        return {'package': package, 'items': items}
+
+    def peek_dashboard(self, user_id: int):
+        """get_user_dashboard(with_items=False) из кэша или MISS."""
+        exists = self.users_cache.get(user_id)
+        if exists is MISS:
+            return MISS
+        if not exists:
+            return None
+        package = self.subscriptions_cache.get(user_id)
+        if package is MISS:
+            return MISS
+        return {'package': package, 'items': []}
+
+    def create_items_bulk(self, user_id: int, count: int,
+                          expires_at: Optional[int] = None) -> list:
+        """Создать count QR одной транзакцией (печать стикеров). Возвращает список qr_id."""
+        qr_ids = self.qr_ids.take(count)
+        added  = now_ts()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            cur.executemany(
+                'INSERT INTO items (qr_id, user_id, added_at, expires_at) VALUES (?, ?, ?, ?)',
+                ((qr_id, user_id, added, expires_at) for qr_id in qr_ids)
             )
             cur.execute(
-                'UPDATE users SET total_items = total_items + 1 WHERE user_id = ?',
-                (user_id,)
+                'UPDATE users SET total_items = total_items + ? WHERE user_id = ?',
+                (count, user_id)
             )
             conn.commit()
-            return {'qr_id': qr_id, 'expires_at': expires_at}
-        except Exception as e:
-            logger.error(f"Ошибка создания вещи: {e}")
-            return None
-        finally:
-            conn.close()
+        for qr_id in qr_ids:
+            self.scan_index.added(qr_id, user_id, expires_at)
+            self.qr_filter.add(qr_id)
+        return qr_ids
 
     def get_user_items(self, user_id: int) -> list:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute(
-            'SELECT * FROM items WHERE user_id = ? AND is_active = 1 ORDER BY added_at DESC',
-            (user_id,)
-        )
-        rows = [dict(r) for r in cur.fetchall()]
-        conn.close()
-        return rows
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                'SELECT * FROM items WHERE user_id = ? AND is_active = 1 ORDER BY added_at DESC',
+                (user_id,)
+            )
+            rows = [dict(r) for r in cur.fetchall()]
+            return rows
+
+    def may_exist(self, qr_id: str) -> bool:
+        """False — такой qr_id точно не выдавался (формат или фильтр Блума)."""
+        verdict = self.qr_filter.check(qr_id)
+        if verdict is None:
+            with self.connection() as conn:
+                self.qr_filter.sync(conn)
+            verdict = self.qr_filter.check(qr_id)
+        return verdict is not False
+
+    def build_qr_filter(self):
+        """Построить фильтр Блума по всем выданным qr_id (при старте)."""
+        with self.connection() as conn:
+            self.qr_filter.build(conn)
+        stats = self.qr_filter.stats()
+        logger.info(f"Фильтр qr_id: {stats['keys']} кодов, {stats['bytes'] // 1024} КиБ")
+
+    def lookup_qr(self, qr_id: str) -> Optional[ScanRecord]:
+        """Владелец и срок действующего QR (из индекса сканирований) или None."""
+        if not self.may_exist(qr_id):
+            return None
+        record = self.scan_index.peek(qr_id)
+        if record is not MISS:
+            return record
+        tokens = self.scan_index.tokens()
+        with self.connection() as conn:
+            row = conn.execute(
+                'SELECT user_id, expires_at FROM items WHERE qr_id = ? AND is_active = 1', (qr_id,)
+            ).fetchone()
+        record = ScanRecord(row['user_id'], row['expires_at']) if row else None
+        self.scan_index.remember(qr_id, record, tokens)
+        return record
+
+    def warm_scan_index(self) -> int:
+        """Загрузить действующие QR в индекс сканирований (при старте бота)."""
+        with self.connection() as conn:
+            # Позиция журнала — до чтения items: изменения, сделанные во
+            # время загрузки, sync_scan_index потом сбросит.
+            self.scan_index.last_change = conn.execute(
+                'SELECT COALESCE(MAX(seq), 0) FROM qr_changes'
+            ).fetchone()[0]
+            rows = conn.execute(
+                'SELECT qr_id, user_id, expires_at FROM items WHERE is_active = 1 ORDER BY id DESC'
+            )
+            count = self.scan_index.warm(rows)
+        logger.info(f"Индекс сканирований: загружено {count} QR")
+        return count
+
+    def sync_scan_index(self) -> int:
+        """
+        Сбросить в индексе сканирований коды, изменённые после прошлого
+        вызова (в том числе другими процессами), и догрузить новые коды в
+        фильтр qr_id. Возвращает число прочитанных записей журнала.
+        """
+        with self.connection() as conn:
+            if self.scan_index.last_change is None:
+                self.scan_index.last_change = conn.execute(
+                    'SELECT COALESCE(MAX(seq), 0) FROM qr_changes'
+                ).fetchone()[0]
+                return 0
+            rows = conn.execute(
+                'SELECT seq, qr_id FROM qr_changes WHERE seq > ? ORDER BY seq',
+                (self.scan_index.last_change,)
+            ).fetchall()
+            # Среди изменений могут быть новые коды — их должен знать и фильтр.
+            if rows and self.qr_filter.ready:
+                self.qr_filter.sync(conn)
+        for seq, qr_id in rows:
+            self.scan_index.forget(qr_id)
+            self.scan_index.last_change = seq
+        return len(rows)
+
+    def prune_qr_changes(self, before: int) -> int:
+        """Удалить из журнала qr_changes записи старше before."""
+        with self.connection() as conn:
+            cur = conn.execute('DELETE FROM qr_changes WHERE changed_at < ?', (before,))
+            conn.commit()
+            return cur.rowcount
 
     def get_item_by_qr(self, qr_id: str) -> Optional[dict]:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute('SELECT * FROM items WHERE qr_id = ? AND is_active = 1', (qr_id,))
-        row = cur.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        """Активный QR вместе с file_id его загруженного фото (или None)."""
+        if not self.may_exist(qr_id) or self.scan_index.peek(qr_id) is None:
+            return None
+        tokens = self.scan_index.tokens()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT i.*, f.file_id FROM items i
+                LEFT JOIN qr_file_ids f ON f.qr_id = i.qr_id
+                WHERE i.qr_id = ? AND i.is_active = 1
+            ''', (qr_id,))
+            row = cur.fetchone()
+        item = dict(row) if row else None
+        self.scan_index.remember(
+            qr_id, ScanRecord(item['user_id'], item['expires_at']) if item else None, tokens
+        )
+        return item
 
     def delete_item(self, qr_id: str, user_id: int) -> bool:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute(
-            'UPDATE items SET is_active = 0 WHERE qr_id = ? AND user_id = ?',
-            (qr_id, user_id)
-        )
-        affected = cur.rowcount
-        if affected:
+        with self.connection() as conn:
+            cur = conn.cursor()
             cur.execute(
-                'UPDATE users SET total_items = MAX(0, total_items - 1) WHERE user_id = ?',
-                (user_id,)
+                'UPDATE items SET is_active = 0 WHERE qr_id = ? AND user_id = ?',
+                (qr_id, user_id)
             )
-        conn.commit()
-        conn.close()
+            affected = cur.rowcount
+            if affected:
+                cur.execute(
+                    'UPDATE users SET total_items = MAX(0, total_items - 1) WHERE user_id = ?',
+                    (user_id,)
+                )
+                cur.execute('DELETE FROM qr_file_ids WHERE qr_id = ?', (qr_id,))
+            conn.commit()
+        if affected:
+            self.scan_index.removed(qr_id)
         return affected > 0
 
-    def generate_qr_image(self, qr_id: str, bot_username: str) -> bytes:
-        url = f"https://t.me/{bot_username}?start=found_{qr_id}"
-        return _qr_image_bytes(url)
+    def set_qr_file_id(self, qr_id: str, file_id: str):
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT INTO qr_file_ids (qr_id, file_id, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(qr_id) DO UPDATE SET file_id = excluded.file_id, updated_at = excluded.updated_at
+            ''', (qr_id, file_id, now_ts()))
+            conn.commit()
+
+    def clear_qr_file_id(self, qr_id: str):
+        with self.connection() as conn:
+            conn.execute('DELETE FROM qr_file_ids WHERE qr_id = ?', (qr_id,))
+            conn.commit()
 
     
 
     def create_finding(self, qr_id: str, owner_id: int,
                        finder_id: int, finder_name: str,
                        finder_username: str = '') -> bool:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        try:
-            cur.execute('''
-                INSERT INTO findings (qr_id, owner_id, finder_id, finder_name, finder_username)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (qr_id, owner_id, finder_id, finder_name, finder_username or ''))
-            cur.execute(
-                'UPDATE items SET times_found = times_found + 1 WHERE qr_id = ?',
-                (qr_id,)
-            )
-            conn.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка записи находки: {e}")
-            return False
-        finally:
-            conn.close()
+        return self.apply_writes([(
+            'create_finding', (qr_id, owner_id, finder_id, finder_name, finder_username), {}
+        )])[0]
+
+    def _write_create_finding(self, cur, qr_id: str, owner_id: int,
+                              finder_id: int, finder_name: str,
+                              finder_username: str = '') -> bool:
+        cur.execute('''
+            INSERT INTO findings (qr_id, owner_id, finder_id, finder_name, finder_username, found_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (qr_id, owner_id, finder_id, finder_name, finder_username or '', now_ts()))
+        cur.execute(
+            'UPDATE items SET times_found = times_found + 1 WHERE qr_id = ?',
+            (qr_id,)
+        )
+        return True
+
+    def resolve_scan(self, qr_id: str, finder_id: int, finder_name: str,
+                     finder_username: str = '') -> dict:
+        """
+        Обработать сканирование одной транзакцией: зарегистрировать нашедшего,
+        найти QR и, если он действует и чужой, записать находку.
+
+        status: 'not_found' | 'expired' | 'own' | 'found'.
+        """
+        return self.apply_writes([(
+            'resolve_scan', (qr_id, finder_id, finder_name, finder_username), {}
+        )])[0]
+
+    def _write_resolve_scan(self, cur, qr_id: str, finder_id: int, finder_name: str,
+                            finder_username: str = '') -> dict:
+        self._write_create_user(cur, finder_id, finder_username, finder_name)
+        cur.execute('SELECT * FROM items WHERE qr_id = ? AND is_active = 1', (qr_id,))
+        row = cur.fetchone()
+        if not row:
+            return {'status': 'not_found', 'item': None}
+
+        item = dict(row)
+        if item.get('expires_at') and now_ts() > item['expires_at']:
+            return {'status': 'expired', 'item': item}
+        if item['user_id'] == finder_id:
+            return {'status': 'own', 'item': item}
+
+        self._write_create_finding(cur, qr_id, item['user_id'], finder_id, finder_name, finder_username)
+        return {'status': 'found', 'item': item}
 
     def get_user_findings(self, user_id: int, as_owner: bool = True) -> list:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        if as_owner:
-            cur.execute('''
-                SELECT f.* FROM findings f
-                WHERE f.owner_id = ?
-                ORDER BY f.found_at DESC LIMIT 20
-            ''', (user_id,))
-        else:
-            cur.execute('''
-                SELECT f.* FROM findings f
-                WHERE f.finder_id = ?
-                ORDER BY f.found_at DESC LIMIT 20
-            ''', (user_id,))
-        rows = [dict(r) for r in cur.fetchall()]
-        conn.close()
-        return rows
+        with self.connection() as conn:
+            cur = conn.cursor()
+            if as_owner:
+                cur.execute('''
+                    SELECT f.* FROM findings f
+                    WHERE f.owner_id = ?
+                    ORDER BY f.found_at DESC LIMIT 20
+                ''', (user_id,))
+            else:
+                cur.execute('''
+                    SELECT f.* FROM findings f
+                    WHERE f.finder_id = ?
+                    ORDER BY f.found_at DESC LIMIT 20
+                ''', (user_id,))
+            rows = [dict(r) for r in cur.fetchall()]
+            return rows
+
+    def get_user_history(self, user_id: int) -> Optional[tuple]:
+        """(находки моих QR, мои находки) или None, если пользователя нет."""
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT 1 FROM users WHERE user_id = ?', (user_id,))
+            if not cur.fetchone():
+                return None
+            return (
+                self.get_user_findings(user_id, as_owner=True),
+                self.get_user_findings(user_id, as_owner=False),
+            )
 
     def get_active_package(self, user_id: int) -> Optional[dict]:
         """Алиас для get_active_subscription — используется в handlers."""
@@ -359,46 +696,108 @@ class Database:
     
 
     def add_review(self, user_id: int, full_name: str, rating: int, review_text: str) -> bool:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        try:
-            cur.execute(
-                'INSERT INTO reviews (user_id, full_name, rating, review_text) VALUES (?, ?, ?, ?)',
-                (user_id, full_name, rating, review_text or '')
+        with self.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(
+                    'INSERT INTO reviews (user_id, full_name, rating, review_text, created_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (user_id, full_name, rating, review_text or '', now_ts())
+                )
+                conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Ошибка сохранения отзыва: {e}")
+                return False
+
+    
+
+    def add_dead_letter(self, chat_id: int, text: str, payload: str, error: str, attempts: int):
+        """Сохранить уведомление, которое не удалось доставить."""
+        with self.connection() as conn:
+            conn.execute(
+                'INSERT INTO notification_dead_letters (chat_id, text, payload, error, attempts) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (chat_id, text, payload, error, attempts)
+            )
+            conn.commit()
+
+    
+
+    def expire_due(self, limit: int = EXPIRY_BATCH, now: Optional[int] = None) -> dict:
+        """
+        Снять истёкшие QR и подписки — не больше limit тех и других за вызов.
+
+        Возвращает {'items': n, 'subscriptions': n}; если n == limit, истёкшие
+        ещё остались. Обе выборки идут по частичным индексам (миграция 7).
+        """
+        now = now or now_ts()
+        with self.connection() as conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            items = cur.execute(
+                'SELECT id, qr_id FROM items '
+                'WHERE is_active = 1 AND expires_at IS NOT NULL AND expires_at < ? LIMIT ?',
+                (now, limit)
+            ).fetchall()
+            cur.executemany('UPDATE items SET is_active = 0 WHERE id = ?', ((r['id'],) for r in items))
+            subs = cur.execute(
+                'SELECT id, user_id FROM subscriptions WHERE is_active = 1 AND expires_at <= ? LIMIT ?',
+                (now, limit)
+            ).fetchall()
+            cur.executemany('UPDATE subscriptions SET is_active = 0 WHERE id = ?', ((r['id'],) for r in subs))
+            conn.commit()
+        for row in items:
+            self.scan_index.removed(row['qr_id'])
+        for row in subs:
+            self.subscriptions_cache.invalidate(row['user_id'])
+        return {'items': len(items), 'subscriptions': len(subs)}
+
+    def get_expiring_subscriptions(self, until: int, limit: int = EXPIRY_BATCH) -> list:
+        """Действующие подписки, истекающие не позже until, о которых ещё не напоминали."""
+        with self.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, user_id, plan, expires_at FROM subscriptions
+                WHERE is_active = 1 AND reminder_sent = 0 AND expires_at <= ?
+                ORDER BY expires_at LIMIT ?
+            ''', (until, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark_reminders_sent(self, subscription_ids: list):
+        with self.connection() as conn:
+            conn.executemany(
+                'UPDATE subscriptions SET reminder_sent = 1 WHERE id = ?',
+                ((sub_id,) for sub_id in subscription_ids)
             )
             conn.commit()
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка сохранения отзыва: {e}")
-            return False
-        finally:
-            conn.close()
 
     
 
     def get_statistics(self) -> dict:
-        conn = self.get_connection()
-        cur  = conn.cursor()
-        cur.execute('SELECT COUNT(*) AS cnt FROM users WHERE is_active = 1')
-        total_users = cur.fetchone()['cnt']
-        cur.execute('SELECT COUNT(*) AS cnt FROM items WHERE is_active = 1')
-        total_items = cur.fetchone()['cnt']
-        cur.execute('SELECT COUNT(*) AS cnt FROM findings')
-        total_findings = cur.fetchone()['cnt']
-        cur.execute('SELECT COUNT(*) AS cnt FROM reviews')
-        total_reviews = cur.fetchone()['cnt']
-        avg_rating = 0.0
-        if total_reviews:
-            cur.execute('SELECT AVG(rating) AS avg FROM reviews')
-            row = cur.fetchone()
-            avg_rating = round(row['avg'], 1) if row['avg'] else 0.0
-        avg_per_user = round(total_items / total_users, 1) if total_users else 0
-        conn.close()
-        return {
+        """Сводка для /stats и сайта — одна строка таблицы stats (её ведут триггеры)."""
+        cached = self.stats_cache.get(None)
+        if cached is not MISS:
+            return cached
+        token = self.stats_cache.token()
+        with self.connection() as conn:
+            row = conn.execute(
+                'SELECT users, items, findings, reviews, rating_sum FROM stats WHERE id = 1'
+            ).fetchone()
+        total_users, total_items, total_findings, total_reviews, rating_sum = row
+        result = {
             'total_users':    total_users,
             'total_items':    total_items,
             'total_findings': total_findings,
-            'avg_per_user':   avg_per_user,
+            'avg_per_user':   round(total_items / total_users, 1) if total_users else 0,
             'total_reviews':  total_reviews,
-            'avg_rating':     avg_rating,
-        }
\ No newline at end of file
+            'avg_rating':     round(rating_sum / total_reviews, 1) if total_reviews else 0.0,
+        }
+        self.stats_cache.put(None, result, token=token)
+        return result
+
+
+def _unexpired(sub: Optional[dict]) -> Optional[dict]:
+    """Подписку с прошедшим сроком, которую ещё не снял expire_due, считаем неактивной."""
+    if sub and sub['expires_at'] <= now_ts():
+        return None
+    return sub
@@ -0,0 +1,159 @@
+"""
+Пул соединений SQLite для QR-Находка
+"""
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledConnection:
+    __slots__ = ('conn', 'owner', 'last_used')
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn      = conn
+        self.owner     = threading.get_ident()
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул соединений с привязкой к потокам.
+
+    Поток получает то соединение, которым пользовался в прошлый раз (если оно
+    свободно), вложенные вызовы в одном потоке переиспользуют уже выданное
+    соединение. Простаивающие дольше health_check_interval соединения
+    проверяются через SELECT 1 и пересоздаются при ошибке.
+    """
+
+    def __init__(self, factory: Callable[[], sqlite3.Connection],
+                 max_size: int = 8, timeout: float = 5.0,
+                 health_check_interval: float = 30.0):
+        self._factory  = factory
+        self.max_size  = max(1, max_size)
+        self.timeout   = timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond   = threading.Condition()
+        self._idle   = []
+        self._size   = 0
+        self._closed = False
+        self._local  = threading.local()
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, 'held', None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held.conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        pooled = self._acquire()
+        self._local.held  = pooled
+        self._local.depth = 0
+        try:
+            yield pooled.conn
+        finally:
+            self._local.held = None
+            self._release(pooled)
+
+    def _acquire(self) -> _PooledConnection:
+        me       = threading.get_ident()
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Пул соединений закрыт")
+                if self._idle:
+                    idx = next(
+                        (i for i in range(len(self._idle) - 1, -1, -1) if self._idle[i].owner == me),
+                        len(self._idle) - 1
+                    )
+                    pooled = self._idle.pop(idx)
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Нет свободных соединений за {self.timeout} с")
+                self._cond.wait(remaining)
+
+        try:
+            if pooled is None:
+                return _PooledConnection(self._factory())
+            if time.monotonic() - pooled.last_used > self.health_check_interval:
+                pooled = self._check(pooled)
+            pooled.owner = me
+            return pooled
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _check(self, pooled: _PooledConnection) -> _PooledConnection:
+        try:
+            pooled.conn.execute('SELECT 1').fetchone()
+            return pooled
+        except sqlite3.Error as e:
+            logger.warning(f"Соединение не прошло проверку, пересоздаём: {e}")
+            try:
+                pooled.conn.close()
+            except sqlite3.Error:
+                pass
+            return _PooledConnection(self._factory())
+
+    def _release(self, pooled: _PooledConnection):
+        conn = pooled.conn
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"Сбрасываем повреждённое соединение: {e}")
+            self._discard(pooled)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                conn.close()
+                return
+            pooled.last_used = time.monotonic()
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def _discard(self, pooled: _PooledConnection):
+        try:
+            pooled.conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def close(self):
+        """Закрыть свободные соединения; занятые закроются при возврате."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            pooled.conn.close()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
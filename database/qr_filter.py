@@ -0,0 +1,90 @@
+"""
+Отсев заведомо несуществующих qr_id QR-Находка
+
+Перед любым обращением к базе код проверяется по формату (контрольный
+символ) и по фильтру Блума всех выданных qr_id. Фильтр строится из items
+при старте и пополняется при выпуске кодов в этом процессе; коды, выпущенные
+другими процессами, догружаются запросом items.id > last_id, но не чаще
+одного раза в sync_interval — поток сканов выдуманных кодов не превращается
+в поток запросов.
+"""
+import threading
+import time
+
+from database.qr_ids import is_well_formed
+from utils.bloom import BloomFilter
+
+
+class QRIdFilter:
+    def __init__(self, fp_rate: float, min_capacity: int, sync_interval: float):
+        self.fp_rate       = fp_rate
+        self.min_capacity  = min_capacity
+        self.sync_interval = sync_interval
+        self.bloom         = None
+        self.last_id       = 0
+        self._last_sync    = 0.0
+        self._lock         = threading.Lock()
+
+        self.malformed = 0
+        self.filtered  = 0
+        self.syncs     = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.bloom is not None
+
+    def build(self, conn):
+        """Построить фильтр заново по всем строкам items."""
+        with self._lock:
+            total = conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+            bloom = BloomFilter(max(self.min_capacity, total * 2), self.fp_rate)
+            last_id = 0
+            for row_id, qr_id in conn.execute('SELECT id, qr_id FROM items ORDER BY id'):
+                bloom.add(qr_id)
+                last_id = row_id
+            self.bloom, self.last_id = bloom, last_id
+            self._last_sync = time.monotonic()
+
+    def sync(self, conn):
+        """Догрузить коды, выпущенные после last_id (в том числе другими процессами)."""
+        if self.bloom.saturated:
+            self.build(conn)
+            return
+        with self._lock:
+            rows = conn.execute(
+                'SELECT id, qr_id FROM items WHERE id > ? ORDER BY id', (self.last_id,)
+            ).fetchall()
+            for row_id, qr_id in rows:
+                self.bloom.add(qr_id)
+                self.last_id = row_id
+            self._last_sync = time.monotonic()
+            self.syncs += 1
+
+    def add(self, qr_id: str):
+        if self.bloom is not None:
+            self.bloom.add(qr_id)
+
+    def check(self, qr_id: str):
+        """
+        False — кода точно нет, True — может быть, None — фильтр говорит «нет»,
+        но пора догрузить новые коды (sync) и спросить снова.
+        """
+        if not is_well_formed(qr_id):
+            self.malformed += 1
+            return False
+        if self.bloom is None or qr_id in self.bloom:
+            return True
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            return None
+        self.filtered += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            'ready':     self.ready,
+            'keys':      self.bloom.count if self.bloom else 0,
+            'bytes':     self.bloom.nbytes if self.bloom else 0,
+            'malformed': self.malformed,
+            'filtered':  self.filtered,
+            'syncs':     self.syncs,
+        }
@@ -0,0 +1,92 @@
+"""
+Выдача qr_id без проверки уникальности в цикле
+
+Номера берутся из общей последовательности qr_id_seq блоками, так что
+процессы (бот, веб-сервер, CLI печати) не пересекаются, а обращение к базе
+нужно один раз на блок. Номер перемешивается обратимым умножением по модулю
+32^6, кодируется шестью символами base32 Crockford и дополняется
+контрольным символом: QR + 6 символов + 1 контрольный = 9 знаков.
+Старые коды (QR + 6 hex, 8 знаков) с новыми не пересекаются по длине.
+"""
+import sqlite3
+import threading
+from typing import Callable
+
+ALPHABET  = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_VALUES   = {c: i for i, c in enumerate(ALPHABET)}
+_DIGITS   = 6
+_SPACE    = 32 ** _DIGITS
+_MULT     = 0x2F0A3B5      # нечётный — взаимно прост с 2^30
+_OFFSET   = 0x1B7E151
+_PREFIX   = 'QR'
+_LEGACY_HEX = set('0123456789ABCDEF')
+
+
+def _checksum(body: str) -> str:
+    total = sum((i + 1) * _VALUES[c] for i, c in enumerate(body))
+    return ALPHABET[total % 31]
+
+
+def encode(n: int) -> str:
+    value = (n * _MULT + _OFFSET) % _SPACE
+    chars = []
+    for _ in range(_DIGITS):
+        value, rem = divmod(value, 32)
+        chars.append(ALPHABET[rem])
+    body = ''.join(reversed(chars))
+    return f'{_PREFIX}{body}{_checksum(body)}'
+
+
+def is_well_formed(qr_id: str) -> bool:
+    """Похож ли qr_id на выданный: старый hex-формат или новый с верной контрольной суммой."""
+    if not qr_id.startswith(_PREFIX):
+        return False
+    body = qr_id[len(_PREFIX):]
+    if len(body) == 6:
+        return set(body) <= _LEGACY_HEX
+    if len(body) != _DIGITS + 1 or not set(body) <= _VALUES.keys():
+        return False
+    return _checksum(body[:-1]) == body[-1]
+
+
+class QRIdAllocator:
+    """Потокобезопасная выдача qr_id из блоков, зарезервированных в базе."""
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], block_size: int = 64):
+        self._connect    = connect
+        self.block_size  = max(1, block_size)
+        self._lock       = threading.Lock()
+        self._next       = 0
+        self._end        = 0
+
+    def take(self, count: int = 1) -> list:
+        with self._lock:
+            ids = []
+            while len(ids) < count:
+                if self._next >= self._end:
+                    self._next, self._end = self._reserve(max(self.block_size, count - len(ids)))
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(encode(n) for n in range(self._next, self._next + take))
+                self._next += take
+            return ids
+
+    def next(self) -> str:
+        return self.take(1)[0]
+
+    def _reserve(self, size: int) -> tuple:
+        # Отдельное соединение: резерв фиксируется сразу и не откатится
+        # вместе с транзакцией, в которой потом вставляются items.
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                "UPDATE qr_id_seq SET next_value = next_value + ? WHERE name = 'items'",
+                (size,)
+            )
+            end = conn.execute("SELECT next_value FROM qr_id_seq WHERE name = 'items'").fetchone()[0]
+            conn.commit()
+        finally:
+            conn.close()
+        if end > _SPACE:
+            raise RuntimeError("Пространство qr_id исчерпано")
+        return end - size, end
@@ -0,0 +1,96 @@
+"""
+Индекс сканирований qr_id -> владелец QR-Находка
+
+Сканирование QR решает три вопроса: есть ли такой код, не истёк ли он и
+чей он. Для этого не нужна строка items целиком, поэтому в памяти держится
+компактная запись на код и отдельный кэш «такого кода нет», чтобы поток
+сканов несуществующих кодов не доходил до SQLite.
+"""
+import time
+from typing import Optional
+
+from utils.cache import MISS, TTLCache
+
+
+class ScanRecord:
+    __slots__ = ('owner_id', 'expires_at', 'is_active')
+
+    def __init__(self, owner_id: int, expires_at: Optional[int], is_active: bool = True):
+        self.owner_id   = owner_id
+        self.expires_at = expires_at
+        self.is_active  = is_active
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        if not self.expires_at:
+            return False
+        return (time.time() if now is None else now) > self.expires_at
+
+    def __repr__(self):
+        return f'ScanRecord(owner_id={self.owner_id}, expires_at={self.expires_at!r})'
+
+
+class ScanIndex:
+    """
+    qr_id -> ScanRecord для действующих кодов и qr_id -> None для неизвестных
+    или удалённых. Обе части ограничены по размеру (LRU) и по времени: код
+    могут выпустить или удалить в другом процессе (печать стикеров, бот).
+    Такие изменения процесс подхватывает из журнала qr_changes (forget по
+    каждой записи после last_change); TTL — страховка, если журнал не читают.
+    Срок действия самого QR проверяется при каждом обращении по expires_at.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, negative_max: int,
+                 negative_ttl: float, enabled: bool = True):
+        self.known   = TTLCache(max_entries, ttl, enabled)
+        self.unknown = TTLCache(negative_max, negative_ttl, enabled)
+
+        self.last_change = None    # seq последней прочитанной записи qr_changes
+        self.forgotten   = 0
+
+    def peek(self, qr_id: str):
+        """ScanRecord, None (кода нет) или MISS (нужно спросить базу)."""
+        record = self.known.get(qr_id)
+        if record is not MISS:
+            return record
+        return self.unknown.get(qr_id)
+
+    def tokens(self) -> tuple:
+        return self.known.token(), self.unknown.token()
+
+    def remember(self, qr_id: str, record: Optional[ScanRecord], tokens: tuple = (None, None)):
+        if record is None:
+            self.unknown.put(qr_id, None, token=tokens[1])
+        else:
+            self.known.put(qr_id, record, token=tokens[0])
+
+    def added(self, qr_id: str, owner_id: int, expires_at: Optional[int]):
+        self.unknown.invalidate(qr_id)
+        self.known.put(qr_id, ScanRecord(owner_id, expires_at))
+
+    def removed(self, qr_id: str):
+        self.known.invalidate(qr_id)
+        self.unknown.put(qr_id, None)
+
+    def forget(self, qr_id: str):
+        """Код изменён в другом процессе: следующее обращение спросит базу."""
+        self.known.invalidate(qr_id)
+        self.unknown.invalidate(qr_id)
+        self.forgotten += 1
+
+    def warm(self, rows) -> int:
+        """Заполнить индекс строками (qr_id, user_id, expires_at)."""
+        count = 0
+        for qr_id, owner_id, expires_at in rows:
+            if count >= self.known.max_entries:
+                break
+            self.known.put(qr_id, ScanRecord(owner_id, expires_at))
+            count += 1
+        return count
+
+    def stats(self) -> dict:
+        return {
+            'known':       self.known.stats(),
+            'unknown':     self.unknown.stats(),
+            'last_change': self.last_change,
+            'forgotten':   self.forgotten,
+        }
@@ -0,0 +1,172 @@
+"""
+Очередь записи с единственным потоком-писателем для QR-Находка
+"""
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Callable
+
+from config.config import WRITE_BATCH_SIZE, WRITE_BATCH_DELAY
+from database.models import Database
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteQueue:
+    """
+    Все записи проходят через один поток в порядке поступления.
+
+    Записи из Database.BATCH_WRITES (находки, счётчики times_found,
+    create_user) копятся в пакет и фиксируются одной транзакцией, когда
+    набирается max_batch операций или проходит max_delay секунд. Остальные
+    записи выполняются по одной, предварительно сбросив накопленный пакет,
+    так что порядок сохраняется для всех записей. Запись, отменённую до
+    начала выполнения, писатель пропускает; после close() новые не
+    принимаются.
+    """
+
+    def __init__(self, db: Database,
+                 max_batch: int = WRITE_BATCH_SIZE,
+                 max_delay: float = WRITE_BATCH_DELAY):
+        self.db        = db
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+
+        self._queue   = queue.Queue()
+        self._batches = 0
+        self._ops     = 0
+        self._last_batch    = 0
+        self._max_batch_seen = 0
+        self._last_flush    = 0.0
+        self._total_flush   = 0.0
+
+        # Поток стартует с первой записью, а не при импорте: до него процесс
+        # однопоточный и пул рендера QR может безопасно сделать fork.
+        self._thread = threading.Thread(target=self._run, name='db-write-queue', daemon=True)
+        self._lock   = threading.Lock()
+        self._closed = False
+
+    def submit(self, name: str, *args, **kwargs) -> Future:
+        """Поставить в очередь пакетную запись Database.<name>."""
+        if name not in self.db.BATCH_WRITES:
+            raise ValueError(f"{name} не поддерживает пакетную запись")
+        future = Future()
+        self._put((name, args, kwargs, future))
+        return future
+
+    def submit_call(self, fn: Callable, *args, **kwargs) -> Future:
+        """Выполнить произвольную запись в потоке-писателе, сохраняя порядок."""
+        future = Future()
+        self._put((None, (fn,) + args, kwargs, future))
+        return future
+
+    def flush(self, timeout: float = None):
+        """Дождаться записи всего, что было поставлено до вызова."""
+        self.submit_call(lambda: None).result(timeout)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            started = self._thread.ident is not None
+            if started:
+                self._queue.put(_STOP)
+        if started:
+            self._thread.join()
+
+    def _put(self, entry):
+        # Под блокировкой: ни одна запись не встанет в очередь после _STOP.
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("очередь записи закрыта")
+            if self._thread.ident is None:
+                self._thread.start()
+            self._queue.put(entry)
+
+    def metrics(self) -> dict:
+        return {
+            'queue_depth':     self._queue.qsize(),
+            'batches':         self._batches,
+            'ops':             self._ops,
+            'last_batch_size': self._last_batch,
+            'max_batch_size':  self._max_batch_seen,
+            'avg_batch_size':  round(self._ops / self._batches, 2) if self._batches else 0,
+            'last_flush_ms':   round(self._last_flush * 1000, 2),
+            'avg_flush_ms':    round(self._total_flush / self._batches * 1000, 2) if self._batches else 0,
+        }
+
+    
+
+    def _run(self):
+        pending = None
+        while True:
+            entry = pending if pending is not None else self._queue.get()
+            pending = None
+            if entry is _STOP:
+                return
+
+            # После set_running_or_notify_cancel() future уже не отменить, и
+            # результат можно выставлять без гонки с отменой. Отменённую до
+            # начала записи (таймаут, остановка) не выполняем.
+            if not entry[-1].set_running_or_notify_cancel():
+                continue
+            if entry[0] is None:
+                self._run_call(entry)
+                continue
+
+            batch    = [entry]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    nxt = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if nxt is _STOP or nxt[0] is None:
+                    pending = nxt
+                    break
+                if nxt[-1].set_running_or_notify_cancel():
+                    batch.append(nxt)
+            self._flush(batch)
+
+    def _run_call(self, entry):
+        _, (fn, *args), kwargs, future = entry
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            _resolve(future, exception=e)
+        else:
+            _resolve(future, result)
+
+    def _flush(self, batch: list):
+        started = time.perf_counter()
+        try:
+            results = self.db.apply_writes([(name, args, kwargs) for name, args, kwargs, _ in batch])
+        except Exception as e:
+            logger.error(f"Не удалось записать пакет из {len(batch)} операций: {e}")
+            for *_, future in batch:
+                _resolve(future, exception=e)
+            return
+        finally:
+            elapsed = time.perf_counter() - started
+            self._batches       += 1
+            self._ops           += len(batch)
+            self._last_batch     = len(batch)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+            self._last_flush     = elapsed
+            self._total_flush   += elapsed
+
+        for (*_, future), result in zip(batch, results):
+            _resolve(future, result)
+
+
+def _resolve(future: Future, result=None, exception: BaseException = None):
+    # future уже в состоянии RUNNING (см. _run) — отмена его не меняет.
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
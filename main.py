@@ -1,7 +1,13 @@
 """
 Основной модуль Telegram бота QR-Finder
 """
+import asyncio
 import logging
+import signal
+import sqlite3
+import tempfile
+from pathlib import Path
+
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -12,9 +18,17 @@ from telegram.ext import (
     filters,
 )
 
-from config.config import TELEGRAM_BOT_TOKEN, DATABASE_PATH, QR_PACKAGES, ADMIN_ID
-from database.models import Database
+from config.config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_API_URL, QR_PACKAGES, ADMIN_ID, STICKER_MAX_PER_COMMAND,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS, UPDATE_CONCURRENCY, NOTIFY_WORKERS, METRICS_HOST, METRICS_PORT,
+)
 from bot.handlers import (
+    db,
+    admin_digest,
+    expiry,
+    notifier,
+    qr_renderer,
     start_handler,
     additem_handler,
     myitems_handler,
@@ -29,6 +43,12 @@ from bot.handlers import (
     leaderboard_handler,
     buy_handler,
 )
+from bot.instrumentation import InstrumentedRequest
+from bot.processor import PerUserUpdateProcessor
+from bot.webhook import ALLOWED_UPDATES, HttpServer, WebhookServer
+from database.models import format_ts
+from utils.metrics import metrics
+from utils.sticker_sheet import build_sheets_async
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -36,8 +56,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-db = Database(DATABASE_PATH)
-
 
 async def activate_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """/activate <user_id> <plan> — активировать подписку"""
@@ -65,30 +83,25 @@ async def activate_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Неизвестный план: {plan_key}")
         return
 
-    if not db.user_exists(target_id):
+    if not await db.user_exists(target_id):
         await update.message.reply_text(f"❌ Пользователь {target_id} не найден.")
         return
 
-    sub = db.create_subscription(target_id, plan_key, plan['days'])
+    sub = await db.create_subscription(target_id, plan_key, plan['days'])
 
-    try:
-        await context.bot.send_message(
-            chat_id=target_id,
-            text=(
-                f"🎉 QR-код активирован!\n\n"
-                f"{plan['emoji']} {plan['label']}\n"
-                f"✅ Действует до: {sub['expires_at'][:10]}\n\n"
-                f"Теперь создайте свой QR-код — нажмите /myitems или кнопку ниже."
-            )
-        )
-    except Exception as e:
-        logger.warning(f"Не удалось уведомить {target_id}: {e}")
+    notifier.send(
+        target_id,
+        f"🎉 QR-код активирован!\n\n"
+        f"{plan['emoji']} {plan['label']}\n"
+        f"✅ Действует до: {format_ts(sub['expires_at'])}\n\n"
+        f"Теперь создайте свой QR-код — нажмите /myitems или кнопку ниже."
+    )
 
     await update.message.reply_text(
         f"✅ QR-код активирован!\n"
         f"Пользователь: {target_id}\n"
         f"Пакет: {plan['label']}\n"
-        f"До: {sub['expires_at'][:10]}"
+        f"До: {format_ts(sub['expires_at'])}"
     )
 
 
@@ -99,7 +112,7 @@ async def pending_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Только для администратора.")
         return
 
-    payments = db.get_pending_payments()
+    payments = await db.get_pending_payments()
     if not payments:
         await update.message.reply_text("Нет ожидающих платежей.")
         return
@@ -111,16 +124,128 @@ async def pending_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text += (
             f"#{p['id']} | {p['full_name']}{uname} (ID: {p['user_id']})\n"
             f"Пакет: {plan.get('label', p['plan'])}\n"
-            f"Когда: {p['created_at'][:16]}\n"
+            f"Когда: {format_ts(p['created_at'], '%Y-%m-%d %H:%M')}\n"
             f"➡️ /activate {p['user_id']} {p['plan']}\n\n"
         )
     await update.message.reply_text(text)
 
 
+async def stickers_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stickers <кол-во> [user_id] — выпустить QR-коды и прислать PDF для печати"""
+    caller_id = update.effective_user.id
+    if ADMIN_ID and caller_id != ADMIN_ID:
+        await update.message.reply_text("❌ Только для администратора.")
+        return
+
+    try:
+        count     = int(context.args[0])
+        target_id = int(context.args[1]) if len(context.args) > 1 else caller_id
+    except (IndexError, ValueError):
+        await update.message.reply_text("Использование: /stickers <кол-во> [user_id]")
+        return
+
+    if not 1 <= count <= STICKER_MAX_PER_COMMAND:
+        await update.message.reply_text(
+            f"❌ За раз можно выпустить от 1 до {STICKER_MAX_PER_COMMAND} QR-кодов.\n"
+            "Для больших тиражей используйте: python -m utils.sticker_sheet"
+        )
+        return
+
+    if not await db.user_exists(target_id):
+        await update.message.reply_text(f"❌ Пользователь {target_id} не найден.")
+        return
+
+    qr_ids = await db.create_items_bulk(target_id, count)
+    await update.message.reply_text(f"⏳ Выпущено {len(qr_ids)} QR-кодов, готовлю листы…")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path  = Path(tmp) / f"stickers_{qr_ids[0]}_{len(qr_ids)}.pdf"
+        pages = await build_sheets_async(qr_ids, path, qr_renderer)
+        with open(path, 'rb') as f:
+            await update.message.reply_document(
+                document=f,
+                filename=path.name,
+                caption=f"🏷 {len(qr_ids)} QR-кодов, {pages} стр. ({qr_ids[0]} … {qr_ids[-1]})"
+            )
+
+
+async def perf_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/perf [reset] — где тратится время: обработчики, база, рендер QR, Bot API"""
+    caller_id = update.effective_user.id
+    if ADMIN_ID and caller_id != ADMIN_ID:
+        await update.message.reply_text("❌ Только для администратора.")
+        return
+
+    if not metrics.enabled:
+        await update.message.reply_text("Метрики выключены. Включите METRICS_ENABLED=1.")
+        return
+    if context.args and context.args[0] == 'reset':
+        metrics.reset()
+        await update.message.reply_text("Метрики сброшены.")
+        return
+
+    sections = (
+        ('handler',   'Обработчики'),
+        ('db',        'База данных'),
+        ('qr_render', 'Рендер QR'),
+        ('bot_api',   'Bot API'),
+    )
+    text = "⏱ Время: p50 / p95 (мс), всего (с)\n"
+    for family, title in sections:
+        rows = metrics.summary(family, limit=8)
+        if not rows:
+            continue
+        text += f"\n{title}:\n"
+        for label, count, p50, p95, total in rows:
+            text += f"  {label} ×{count}: {p50 * 1000:.1f} / {p95 * 1000:.1f}, {total:.1f}\n"
+
+    queue = metrics.snapshot('write_queue')
+    if queue:
+        text += (
+            f"\nОчередь записи: ждут {queue['queue_depth']}, пакетов {queue['batches']} "
+            f"(в среднем {queue['avg_batch_size']} оп.), фиксация {queue['avg_flush_ms']} мс\n"
+        )
+
+    caches = metrics.snapshot('cache')
+    if caches:
+        text += "\nКэши: попадания, записей\n"
+        rows = [(name, caches[name]) for name in ('users', 'subscriptions', 'stats')]
+        rows += [(f"scan_index.{part}", caches['scan_index'][part]) for part in ('known', 'unknown')]
+        for name, stats in rows:
+            text += f"  {name}: {stats['hit_rate']:.0%}, {stats['entries']}\n"
+
+    qr_filter = metrics.snapshot('qr_filter')
+    if qr_filter.get('ready'):
+        text += (
+            f"\nФильтр qr_id: кодов {qr_filter['keys']}, отсеяно невыданных {qr_filter['filtered']}, "
+            f"с неверным форматом {qr_filter['malformed']}, догрузок {qr_filter['syncs']}\n"
+        )
+    await update.message.reply_text(text)
+
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """Ошибки обработчиков — в лог и в сводку администратору; сбои базы — сразу."""
+    err = context.error
+    logger.error("Ошибка при обработке апдейта", exc_info=err)
+    where = ''
+    if isinstance(update, Update):
+        if update.callback_query:
+            where = f"\nКнопка: {update.callback_query.data}"
+        elif update.effective_message and update.effective_message.text:
+            where = f"\nСообщение: {update.effective_message.text[:100]}"
+    admin_digest.add(
+        'error',
+        f"{type(err).__name__}: {str(err)[:300]}{where}",
+        critical=isinstance(err, sqlite3.DatabaseError),
+    )
+
+
 class QRFinderBot:
     def __init__(self, token: str):
-        self.token       = token
-        self.application = None
+        self.token        = token
+        self.application  = None
+        self.webhook      = None
+        self.metrics_http = None
 
     def setup_handlers(self):
         app = self.application
@@ -137,18 +262,113 @@ class QRFinderBot:
         app.add_handler(CommandHandler("leaderboard",  leaderboard_handler))
         app.add_handler(CommandHandler("activate",     activate_handler))
         app.add_handler(CommandHandler("pending",      pending_handler))
+        app.add_handler(CommandHandler("stickers",     stickers_handler))
+        app.add_handler(CommandHandler("perf",         perf_handler))
         app.add_handler(CallbackQueryHandler(button_handler))
         app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
+        app.add_error_handler(error_handler)
         logger.info("Обработчики настроены")
 
+    async def post_init(self, application: Application):
+        metrics.collect('write_queue', db.writes.metrics)
+        metrics.collect('cache',       db.sync.cache_stats)
+        metrics.collect('qr_filter',   db.sync.qr_filter.stats)
+        await notifier.start(application.bot)
+        await expiry.start()
+        if metrics.enabled and METRICS_PORT:
+            self.metrics_http = HttpServer(self._serve_metrics, METRICS_HOST, METRICS_PORT)
+            await self.metrics_http.start()
+            logger.info(f"Метрики: http://{METRICS_HOST}:{self.metrics_http.port}/metrics")
+
+    async def post_stop(self, application: Application):
+        # Бот ещё инициализирован — очередь уведомлений можно дослать.
+        await expiry.stop()
+        admin_digest.flush()
+        await notifier.stop()
+        if self.metrics_http is not None:
+            await self.metrics_http.stop()
+            self.metrics_http = None
+
+    async def _serve_metrics(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if path != '/metrics':
+            return 404, 'text/plain', b''
+        return 200, 'text/plain; version=0.0.4; charset=utf-8', metrics.render().encode()
+
+    def build_application(self, api_url: str = TELEGRAM_API_URL,
+                          concurrency: int = UPDATE_CONCURRENCY) -> Application:
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(PerUserUpdateProcessor(concurrency))
+            # Каждый апдейт и каждый воркер уведомлений держит не больше одного
+            # запроса к Bot API. Больший пул не ускоряет, а замедляет: httpx
+            # перебирает все соединения пула на каждом запросе.
+            .request(InstrumentedRequest(connection_pool_size=concurrency + NOTIFY_WORKERS))
+            .post_init(self.post_init)
+            .post_stop(self.post_stop)
+        )
+        if api_url:
+            api_url = api_url.rstrip('/')
+            builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+        self.application = builder.build()
+        self.setup_handlers()
+        return self.application
+
+    async def serve_webhook(self, stop: asyncio.Event, url: str = WEBHOOK_URL,
+                            host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                            register: bool = True) -> None:
+        """Жизненный цикл приложения в режиме webhook — до установки stop."""
+        app    = self.application
+        server = WebhookServer(app, host, port, WEBHOOK_PATH, WEBHOOK_SECRET)
+        await app.initialize()
+        await self.post_init(app)
+        await app.start()
+        await server.start()
+        self.webhook = server
+        try:
+            if register:
+                await app.bot.set_webhook(
+                    url=f"{url.rstrip('/')}{server.path}",
+                    secret_token=WEBHOOK_SECRET or None,
+                    allowed_updates=ALLOWED_UPDATES,
+                    max_connections=WEBHOOK_MAX_CONNECTIONS,
+                )
+            await stop.wait()
+        finally:
+            await server.stop()
+            await app.stop()
+            await self.post_stop(app)
+            await app.shutdown()
+
     def run(self):
         if not self.token:
             logger.error("TELEGRAM_BOT_TOKEN не установлен!")
             return
-        self.application = Application.builder().token(self.token).build()
-        self.setup_handlers()
-        logger.info("🚀 QR-Finder бот запущен!")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+            logger.error("BOT_MODE=webhook требует WEBHOOK_URL")
+            return
+        if BOT_MODE == 'webhook' and not WEBHOOK_SECRET:
+            logger.warning("WEBHOOK_SECRET не задан — webhook примет запрос от кого угодно")
+        self.build_application()
+        qr_renderer.start()
+        db.sync.build_qr_filter()
+        db.sync.warm_scan_index()
+        logger.info(f"🚀 QR-Finder бот запущен ({BOT_MODE})!")
+        try:
+            if BOT_MODE == 'webhook':
+                asyncio.run(self._run_webhook())
+            else:
+                self.application.run_polling(allowed_updates=ALLOWED_UPDATES)
+        finally:
+            qr_renderer.close()
+            db.close()
+
+    async def _run_webhook(self):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await self.serve_webhook(stop)
 
 
 def main():
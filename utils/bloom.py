@@ -0,0 +1,47 @@
+"""
+Фильтр Блума QR-Находка
+"""
+import hashlib
+import math
+import threading
+
+
+class BloomFilter:
+    """
+    Множество с ложноположительными ответами: «нет» — точно нет, «да» —
+    с вероятностью ошибки fp_rate, пока добавлено не больше capacity ключей.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = max(1, capacity)
+        self.fp_rate  = fp_rate
+        self.size     = max(8, int(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes   = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count    = 0
+        self._bits    = bytearray((self.size + 7) // 8)
+        self._lock    = threading.Lock()
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        positions = self._positions(key)
+        with self._lock:
+            for pos in positions:
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    @property
+    def saturated(self) -> bool:
+        return self.count > self.capacity
@@ -0,0 +1,95 @@
+"""
+TTL/LRU-кэш для горячих чтений QR-Находка
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+MISS = object()
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш с ограничением числа записей (LRU) и сроком жизни
+    каждой записи.
+
+    Чтобы значение, прочитанное из базы до записи, не легло в кэш после её
+    инвалидации, чтение берёт token() до запроса и передаёт его в put():
+    если с тех пор была инвалидация, значение отбрасывается.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, enabled: bool = True):
+        self.max_entries = max(0, max_entries)
+        self.ttl         = ttl
+        self.enabled     = enabled and self.max_entries > 0 and ttl > 0
+
+        self._lock       = threading.Lock()
+        self._entries    = OrderedDict()     # key -> (expires_at, value)
+        self._generation = 0
+
+        self.hits          = 0
+        self.misses        = 0
+        self.invalidations = 0
+        self.evictions     = 0
+
+    def token(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> Any:
+        """Значение или MISS."""
+        if not self.enabled:
+            return MISS
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return MISS
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None,
+            token: Optional[int] = None):
+        if not self.enabled:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            if token is not None and token != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled':       self.enabled,
+                'entries':       len(self._entries),
+                'hits':          self.hits,
+                'misses':        self.misses,
+                'invalidations': self.invalidations,
+                'evictions':     self.evictions,
+                'hit_rate':      round(self.hits / lookups, 3) if lookups else 0.0,
+            }
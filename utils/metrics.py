@@ -0,0 +1,204 @@
+"""
+Метрики производительности QR-Находка
+
+Гистограммы длительностей в формате Prometheus: обработка апдейтов (по
+команде или префиксу callback_data), вызовы Database, рендер QR и запросы
+к Bot API. Пока METRICS_ENABLED выключен, timer() отдаёт общий пустой
+контекст-менеджер и ничего не записывает.
+
+Состояние компонентов, которые сами ведут счётчики (очередь записи,
+кэши, фильтр qr_id), не дублируется: источник регистрируется через collect() и
+опрашивается при каждом render().
+"""
+import bisect
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from config.config import METRICS_ENABLED
+
+# Верхние границы корзин, сек.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Семейство -> (имя метрики, описание, имя метки).
+HISTOGRAMS = {
+    'handler':   ('qrfinder_handler_seconds',   'Обработка апдейта',         'handler'),
+    'db':        ('qrfinder_db_seconds',        'Вызов метода Database',     'method'),
+    'qr_render': ('qrfinder_qr_render_seconds', 'Получение PNG QR-кода',     'source'),
+    'bot_api':   ('qrfinder_bot_api_seconds',   'Запрос к Bot API',          'method'),
+}
+COUNTERS = {
+    'db_cache_hits': ('qrfinder_db_cache_hits_total', 'Ответы Database из кэша', 'method'),
+}
+# Семейство -> (имя метрики, описание, имена меток). Значения — снимок
+# словаря, который возвращает зарегистрированный источник.
+GAUGES = {
+    'write_queue': ('qrfinder_write_queue', 'Очередь записи: глубина, пакеты, время фиксации', ('stat',)),
+    'cache':       ('qrfinder_cache', 'Кэши Database и индекс сканирований', ('cache', 'stat')),
+    'qr_filter':   ('qrfinder_qr_filter', 'Фильтр qr_id: коды, отсеянные сканы, синхронизации', ('stat',)),
+}
+
+# Меток в одном семействе не больше — остальное уходит в 'other'
+# (команды и callback_data присылают пользователи).
+MAX_LABELS = 200
+
+_NULL = nullcontext()
+
+
+class Histogram:
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum     = 0.0
+        self.count   = 0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum   += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                low  = BUCKETS[i - 1] if i else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+class _Timer:
+    __slots__ = ('metrics', 'family', 'label', 'start')
+
+    def __init__(self, metrics, family: str, label: str):
+        self.metrics = metrics
+        self.family  = family
+        self.label   = label
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.family, self.label, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled   = enabled
+        self._series   = {family: {} for family in HISTOGRAMS}
+        self._counters = {family: Counter() for family in COUNTERS}
+        self._sources  = {}
+        self._lock     = threading.Lock()
+
+    def _label(self, known, label: str) -> str:
+        return label if label in known or len(known) < MAX_LABELS else 'other'
+
+    def timer(self, family: str, label: str):
+        """with metrics.timer('db', 'lookup_qr'): ..."""
+        if not self.enabled:
+            return _NULL
+        return _Timer(self, family, label)
+
+    def observe(self, family: str, label: str, seconds: float):
+        if not self.enabled:
+            return
+        series = self._series[family]
+        with self._lock:
+            label = self._label(series, label)
+            hist  = series.get(label)
+            if hist is None:
+                hist = series[label] = Histogram()
+            hist.observe(seconds)
+
+    def count(self, family: str, label: str, n: int = 1):
+        if not self.enabled:
+            return
+        counter = self._counters[family]
+        with self._lock:
+            counter[self._label(counter, label)] += n
+
+    def collect(self, family: str, source):
+        """Опрашивать source() -> dict при render(); вложенные словари — метки."""
+        if family not in GAUGES:
+            raise ValueError(f"неизвестное семейство {family}")
+        self._sources[family] = source
+
+    def snapshot(self, family: str) -> dict:
+        """Текущее значение источника или {}, если он не зарегистрирован."""
+        source = self._sources.get(family)
+        return source() if source is not None else {}
+
+    def reset(self):
+        with self._lock:
+            for series in self._series.values():
+                series.clear()
+            for counter in self._counters.values():
+                counter.clear()
+
+    def summary(self, family: str, limit: int = 10) -> list:
+        """[(метка, вызовов, p50, p95, всего сек)] по убыванию суммарного времени."""
+        with self._lock:
+            rows = [
+                (label, h.count, h.quantile(0.5), h.quantile(0.95), h.sum)
+                for label, h in self._series[family].items()
+            ]
+        rows.sort(key=lambda row: row[4], reverse=True)
+        return rows[:limit]
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus 0.0.4."""
+        lines = []
+        with self._lock:
+            for family, (name, help_text, label_name) in HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for label, h in sorted(self._series[family].items()):
+                    tag, cumulative = f'{label_name}="{_escape(label)}"', 0
+                    for bound, n in zip(BUCKETS, h.buckets):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{{{tag},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{tag},le="+Inf"}} {h.count}')
+                    lines.append(f'{name}_sum{{{tag}}} {h.sum:.6f}')
+                    lines.append(f'{name}_count{{{tag}}} {h.count}')
+            for family, (name, help_text, label_name) in COUNTERS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for label, n in sorted(self._counters[family].items()):
+                    lines.append(f'{name}{{{label_name}="{_escape(label)}"}} {n}')
+        # Источники опрашиваются вне блокировки: у них свои.
+        for family, (name, help_text, label_names) in GAUGES.items():
+            if family not in self._sources:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for path, value in _flatten(self.snapshot(family)):
+                # Лишние уровни вложенности склеиваются в первую метку.
+                split  = max(1, len(path) - len(label_names) + 1)
+                values = ('.'.join(path[:split]),) + path[split:]
+                tags   = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(label_names, values))
+                lines.append(f'{name}{{{tags}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _flatten(data: dict, path: tuple = ()):
+    """(путь ключей, число) для всех числовых значений; None пропускается."""
+    for key, value in sorted(data.items()):
+        if isinstance(value, dict):
+            yield from _flatten(value, path + (str(key),))
+        elif isinstance(value, (int, float)):
+            yield path + (str(key),), int(value) if isinstance(value, bool) else value
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
@@ -1,29 +1,406 @@
 """
 Утилиты QR-Находка
 """
-from datetime import datetime
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
 from typing import Optional
 
+from telegram.error import BadRequest, Forbidden, RetryAfter
 
-def format_time_ago(timestamp: str) -> str:
-    """Форматировать время в 'X назад'."""
-    try:
-        dt      = datetime.fromisoformat(timestamp)
-        seconds = (datetime.now() - dt).total_seconds()
-        if seconds < 60:
-            return "только что"
-        elif seconds < 3600:
-            m = int(seconds / 60)
-            return f"{m} {'минуту' if m == 1 else 'минут'} назад"
-        elif seconds < 86400:
-            h = int(seconds / 3600)
-            return f"{h} {'час' if h == 1 else 'часов'} назад"
-        else:
-            d = int(seconds / 86400)
-            return f"{d} {'день' if d == 1 else 'дней'} назад"
-    except Exception:
-        return timestamp[:10]
+from config.config import (
+    NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_RATE, NOTIFY_CHAT_BURST, NOTIFY_WORKERS,
+    NOTIFY_QUEUE_SIZE, NOTIFY_MAX_ATTEMPTS, NOTIFY_BACKOFF_BASE,
+    ADMIN_DIGEST_ENABLED, ADMIN_DIGEST_WINDOW, ADMIN_DIGEST_MAX_EVENTS, ADMIN_DIGEST_BYPASS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def format_time_ago(timestamp: int) -> str:
+    """Форматировать время из базы (секунды Unix) в 'X назад'."""
+    seconds = time.time() - timestamp
+    if seconds < 60:
+        return "только что"
+    elif seconds < 3600:
+        m = int(seconds / 60)
+        return f"{m} {'минуту' if m == 1 else 'минут'} назад"
+    elif seconds < 86400:
+        h = int(seconds / 3600)
+        return f"{h} {'час' if h == 1 else 'часов'} назад"
+    else:
+        d = int(seconds / 86400)
+        return f"{d} {'день' if d == 1 else 'дней'} назад"
 
 
 def generate_qr_url(qr_id: str, bot_username: str) -> str:
     return f"https://t.me/{bot_username}?start=found_{qr_id}"
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate          = rate
+        self.capacity      = max(1.0, capacity)
+        self.tokens        = self.capacity
+        self.updated       = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self) -> float:
+        """Взять токен и вернуть 0 или вернуть, сколько секунд ждать следующего."""
+        now = time.monotonic()
+        self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def block(self, seconds: float):
+        """Не выдавать токены seconds секунд (ответ 429 от Telegram)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class _Notification:
+    __slots__ = ('chat_id', 'text', 'kwargs', 'attempts')
+
+    def __init__(self, chat_id: int, text: str, kwargs: dict):
+        self.chat_id  = chat_id
+        self.text     = text
+        self.kwargs   = kwargs
+        self.attempts = 0
+
+
+class _ChatQueue:
+    __slots__ = ('bucket', 'jobs', 'scheduled', 'sending')
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket    = bucket
+        self.jobs      = deque()
+        self.scheduled = False      # стоит в _ready или ждёт таймера
+        self.sending   = False      # рабочая задача отправляет его сообщение
+
+
+class NotificationDispatcher:
+    """
+    Фоновая отправка уведомлений, не задерживающая обработчики.
+
+    send() только ставит сообщение в очередь своего чата. Рабочие задачи
+    берут готовые к отправке чаты из общей очереди: сообщения одного чата
+    уходят по порядку и не чаще chat_rate, все вместе — не чаще global_rate.
+    Чат, которому рано отправлять, откладывается таймером и не занимает
+    рабочую задачу. RetryAfter блокирует чат на указанное Telegram время,
+    сетевые ошибки повторяются с экспоненциальной задержкой, а сообщения,
+    которые так и не ушли (или не поместились в очередь), сохраняются в
+    notification_dead_letters.
+    """
+
+    MAX_IDLE_CHATS = 10000
+
+    def __init__(self, db,
+                 global_rate: float = NOTIFY_GLOBAL_RATE,
+                 chat_rate: float = NOTIFY_CHAT_RATE,
+                 chat_burst: int = NOTIFY_CHAT_BURST,
+                 workers: int = NOTIFY_WORKERS,
+                 queue_size: int = NOTIFY_QUEUE_SIZE,
+                 max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+                 backoff_base: float = NOTIFY_BACKOFF_BASE):
+        self.db           = db
+        self.chat_rate    = chat_rate
+        self.chat_burst   = chat_burst
+        self.workers      = max(1, workers)
+        self.queue_size   = queue_size
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+
+        self.bot      = None
+        self._global  = TokenBucket(global_rate, global_rate)
+        self._chats   = OrderedDict()        # chat_id -> _ChatQueue
+        self._ready   = asyncio.Queue()      # chat_id, которым можно отправлять
+        self._tasks   = []
+        self._timers  = {}                   # chat_id -> отложенный _wake
+        self._pending = 0
+        self._idle    = None
+        self._writes  = set()                # незавершённые записи в dead letters
+
+        self.sent    = 0
+        self.retried = 0
+        self.dead    = 0
+
+    async def start(self, bot):
+        self.bot  = bot
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f'notify-{i}') for i in range(self.workers)
+        ]
+        logger.info(f"Диспетчер уведомлений запущен: {self.workers} задач")
+
+    async def stop(self, timeout: float = 10.0):
+        """Дождаться отправки очереди (не дольше timeout), остальное — в dead letters."""
+        if self._idle is not None and self._pending:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Не отправлено уведомлений при остановке: {self._pending}")
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for chat in self._chats.values():
+            while chat.jobs:
+                await self._dead_letter(chat.jobs.popleft(), 'остановка бота')
+                self._done()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def send(self, chat_id: int, text: str, **kwargs) -> bool:
+        """Поставить сообщение в очередь. False — очередь переполнена, сообщение в dead letters."""
+        job = _Notification(chat_id, text, kwargs)
+        if self._pending >= self.queue_size:
+            task = asyncio.ensure_future(self._dead_letter(job, 'очередь переполнена'))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+            return False
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _ChatQueue(TokenBucket(self.chat_rate, self.chat_burst))
+        else:
+            self._chats.move_to_end(chat_id)
+        chat.jobs.append(job)
+        self._pending += 1
+        if self._idle is not None:
+            self._idle.clear()
+        self._schedule(chat_id, chat)
+        # После постановки: новый чат с сообщением уже не считается простаивающим.
+        self._evict_idle_chats()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'pending': self._pending,
+            'chats':   len(self._chats),
+            'sent':    self.sent,
+            'retried': self.retried,
+            'dead':    self.dead,
+        }
+
+    
+
+    def _schedule(self, chat_id: int, chat: _ChatQueue, delay: float = 0.0):
+        # Пока сообщение чата отправляется, чат перепланирует сам _process.
+        if chat.scheduled or chat.sending or not chat.jobs:
+            return
+        chat.scheduled = True
+        if delay <= 0:
+            self._ready.put_nowait(chat_id)
+            return
+        self._timers[chat_id] = asyncio.get_running_loop().call_later(delay, self._wake, chat_id)
+
+    def _wake(self, chat_id: int):
+        self._timers.pop(chat_id, None)
+        self._ready.put_nowait(chat_id)
+
+    def _evict_idle_chats(self):
+        if len(self._chats) <= self.MAX_IDLE_CHATS:
+            return
+        for chat_id in list(self._chats):
+            chat = self._chats[chat_id]
+            if not chat.jobs and not chat.scheduled and not chat.sending:
+                del self._chats[chat_id]
+                if len(self._chats) <= self.MAX_IDLE_CHATS:
+                    return
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            chat    = self._chats.get(chat_id)
+            if chat is None:
+                continue
+            # Ошибка в одном чате не должна останавливать рабочую задачу:
+            # её никто не перезапустит, и очередь встанет навсегда.
+            try:
+                await self._process(chat_id, chat)
+            except Exception as e:
+                logger.exception(f"Ошибка рабочей задачи уведомлений (чат {chat_id}): {e}")
+
+    async def _process(self, chat_id: int, chat: _ChatQueue):
+        chat.scheduled = False
+        if not chat.jobs:
+            return
+        wait = chat.bucket.delay()
+        if wait:
+            self._schedule(chat_id, chat, wait)
+            return
+
+        job = chat.jobs.popleft()
+        chat.sending = True
+        try:
+            await self._global.acquire()
+            delay = await self._deliver(chat, job)
+        except asyncio.CancelledError:
+            # Остановка: сообщение вернётся в очередь и уйдёт в dead letters в stop().
+            chat.jobs.appendleft(job)
+            raise
+        except Exception as e:
+            await self._dead_letter(job, f"{type(e).__name__}: {e}")
+            delay = None
+        finally:
+            chat.sending = False
+
+        if delay is not None:
+            chat.jobs.appendleft(job)
+        else:
+            self._done()
+        self._schedule(chat_id, chat, delay or 0.0)
+
+    async def _deliver(self, chat: _ChatQueue, job: _Notification) -> Optional[float]:
+        """Отправить сообщение. None — готово (отправлено или в dead letters), иначе пауза до повтора."""
+        job.attempts += 1
+        try:
+            await self.bot.send_message(chat_id=job.chat_id, text=job.text, **job.kwargs)
+            self.sent += 1
+            return None
+        except RetryAfter as e:
+            delay = _seconds(e.retry_after)
+            # Flood control Telegram — на весь бот, а не только на этот чат.
+            chat.bucket.block(delay)
+            self._global.block(delay)
+            error = f"RetryAfter {delay:.0f} с"
+        except (Forbidden, BadRequest) as e:
+            await self._dead_letter(job, str(e))
+            return None
+        except Exception as e:
+            delay = self.backoff_base * 2 ** (job.attempts - 1) * random.uniform(0.8, 1.2)
+            error = f"{type(e).__name__}: {e}"
+
+        if job.attempts >= self.max_attempts:
+            await self._dead_letter(job, error)
+            return None
+        self.retried += 1
+        logger.info(f"Повтор уведомления в чат {job.chat_id} через {delay:.1f} с: {error}")
+        return delay
+
+    def _done(self):
+        self._pending -= 1
+        if not self._pending and self._idle is not None:
+            self._idle.set()
+
+    async def _dead_letter(self, job: _Notification, error: str):
+        self.dead += 1
+        payload = json.dumps(
+            {k: (v.to_dict() if hasattr(v, 'to_dict') else v) for k, v in job.kwargs.items()},
+            ensure_ascii=False, default=str
+        ) if job.kwargs else ''
+        logger.error(f"Уведомление в чат {job.chat_id} не доставлено ({job.attempts} попыток): {error}")
+        try:
+            await self.db.add_dead_letter(job.chat_id, job.text, payload, error, job.attempts)
+        except Exception as e:
+            logger.error(f"Не удалось сохранить dead letter: {e}")
+
+
+def _seconds(value) -> float:
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+class AdminDigest:
+    """
+    Сводка событий для администратора.
+
+    События (оплаты, отзывы, ошибки) копятся window секунд с первого из
+    них и уходят одним сообщением; при max_events сводка отправляется
+    сразу. Одинаковые тексты склеиваются со счётчиком. critical=True и виды
+    из bypass отправляются без ожидания, как и всё при enabled=False.
+    """
+
+    TITLES = {
+        'payment': '💳 Оплаты',
+        'review':  '⭐ Отзывы',
+        'error':   '⚠️ Ошибки',
+    }
+    MAX_MESSAGE = 4000      # лимит Telegram — 4096 символов
+
+    def __init__(self, notifier: NotificationDispatcher, admin_id: int,
+                 window: float = ADMIN_DIGEST_WINDOW,
+                 max_events: int = ADMIN_DIGEST_MAX_EVENTS,
+                 enabled: bool = ADMIN_DIGEST_ENABLED,
+                 bypass: set = ADMIN_DIGEST_BYPASS):
+        self.notifier   = notifier
+        self.admin_id   = admin_id
+        self.window     = window
+        self.max_events = max(1, max_events)
+        self.enabled    = enabled and window > 0
+        self.bypass     = set(bypass)
+
+        self._events = OrderedDict()     # (kind, text) -> сколько раз
+        self._count  = 0
+        self._timer  = None
+
+    def add(self, kind: str, text: str, critical: bool = False):
+        if not self.admin_id:
+            return
+        if critical or not self.enabled or kind in self.bypass:
+            self.notifier.send(self.admin_id, text)
+            return
+
+        key = (kind, text)
+        self._events[key] = self._events.get(key, 0) + 1
+        self._count += 1
+        if self._count >= self.max_events:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._events:
+            return
+        events, count = self._events, self._count
+        self._events, self._count = OrderedDict(), 0
+
+        if count == 1:
+            (_, text), = events
+            self.notifier.send(self.admin_id, text)
+            return
+        for message in self._format(events, count):
+            self.notifier.send(self.admin_id, message)
+
+    def _format(self, events: OrderedDict, count: int) -> list:
+        by_kind = OrderedDict()
+        for (kind, text), times in events.items():
+            by_kind.setdefault(kind, []).append(text + (f"\n(×{times})" if times > 1 else ""))
+
+        blocks = [f"📬 Сводка: {count} событий"]
+        for kind, texts in by_kind.items():
+            total = sum(times for (k, _), times in events.items() if k == kind)
+            blocks.append(f"{self.TITLES.get(kind, kind)} ({total}):")
+            blocks.extend(texts)
+
+        messages, current = [], ''
+        for block in blocks:
+            block = block[:self.MAX_MESSAGE]
+            if current and len(current) + len(block) + 2 > self.MAX_MESSAGE:
+                messages.append(current)
+                current = ''
+            current = f"{current}\n\n{block}" if current else block
+        messages.append(current)
+        return messages
@@ -0,0 +1,124 @@
+"""
+Кэш PNG QR-кодов QR-Находка
+"""
+import hashlib
+import json
+import os
+import threading
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QRImageCache:
+    """
+    Двухуровневый кэш PNG, адресуемый содержимым: ключ — sha256 от URL и
+    параметров рендера. В памяти — LRU с ограничением по байтам, на диске
+    (если задан disk_dir) — файлы <ключ>.png без ограничения размера.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir  = Path(disk_dir) if disk_dir else None
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock    = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes   = 0
+
+        self.hits      = 0
+        self.disk_hits = 0
+        self.misses    = 0
+
+    @staticmethod
+    def key(url: str, params: dict) -> str:
+        payload = json.dumps([url, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._read_disk(key)
+        if data is not None:
+            self._remember(key, data)
+            with self._lock:
+                self.disk_hits += 1
+            return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes):
+        self._remember(key, data)
+        self._write_disk(key, data)
+
+    def get_or_render(self, url: str, params: dict, render: Callable[[str], bytes]) -> bytes:
+        key  = self.key(url, params)
+        data = self.get(key)
+        if data is None:
+            data = render(url)
+            self.put(key, data)
+        return data
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries':   len(self._entries),
+                'bytes':     self._bytes,
+                'hits':      self.hits,
+                'disk_hits': self.disk_hits,
+                'misses':    self.misses,
+                'hit_rate':  round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+    
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f'{key}.png'
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать QR из дискового кэша: {e}")
+            return None
+
+    def _write_disk(self, key: str, data: bytes):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp  = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            path.parent.mkdir(exist_ok=True)
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Не удалось записать QR в дисковый кэш: {e}")
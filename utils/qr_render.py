@@ -0,0 +1,136 @@
+"""
+Рендеринг QR-кодов в пуле процессов QR-Находка
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import qrcode
+
+from config.config import QR_RENDER_WORKERS, QR_RENDER_MAX_PENDING
+from utils.metrics import metrics
+from utils.qr_cache import QRImageCache
+
+logger = logging.getLogger(__name__)
+
+
+QR_RENDER_PARAMS = {
+    'version':          1,
+    'error_correction': qrcode.constants.ERROR_CORRECT_H,
+    'box_size':         10,
+    'border':           4,
+}
+
+
+def pool_context():
+    """
+    Контекст multiprocessing для пула рендера.
+
+    fork дешевле всего (воркер получает уже импортированный код), но после
+    запуска потоков (очередь записи, чтения AsyncDatabase, PTB) копирует в
+    воркер чужие захваченные блокировки. Тогда воркеры запускаются через
+    forkserver — от чистого процесса, ценой повторного импорта модулей.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if threading.active_count() == 1 and 'fork' in methods:
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def render_png(url: str) -> bytes:
+    """Генерирует PNG QR-кода и возвращает bytes."""
+    qr = qrcode.QRCode(**QR_RENDER_PARAMS)
+    qr.add_data(url)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def warm_worker():
+    # Импорт PIL-плагинов и первый рендер заметно дольше последующих.
+    render_png('warm-up')
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class QRRenderer:
+    """
+    Пул процессов для рендера QR, не занимающий event loop.
+
+    Воркеры создаются и прогреваются в start(); если start() не вызван,
+    первый render() прогревает пул в потоке, не блокируя event loop.
+    Число одновременно отправленных в пул задач ограничено max_pending —
+    остальные ждут в event loop. Готовые PNG кладутся в общий QRImageCache.
+    """
+
+    def __init__(self, workers: int = QR_RENDER_WORKERS,
+                 max_pending: int = QR_RENDER_MAX_PENDING,
+                 cache: Optional[QRImageCache] = None):
+        self.workers     = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.cache       = cache
+        self._pool       = None
+        self._slots      = None
+        self._starting   = None
+
+    def start(self):
+        if self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=pool_context(), initializer=warm_worker
+        )
+        for future in [self._pool.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+        logger.info(f"QR-рендерер запущен: {self.workers} процессов")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    async def render(self, url: str, use_cache: bool = True) -> bytes:
+        cache = self.cache if use_cache else None
+        key   = QRImageCache.key(url, QR_RENDER_PARAMS)
+        if cache is not None:
+            start = time.perf_counter()
+            data  = cache.get(key)
+            if data is not None:
+                metrics.observe('qr_render', 'cache', time.perf_counter() - start)
+                return data
+
+        if self._pool is None:
+            await self._start_async()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        with metrics.timer('qr_render', 'pool'):
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                data = await loop.run_in_executor(self._pool, render_png, url)
+
+        if cache is not None:
+            cache.put(key, data)
+        return data
+
+    async def _start_async(self):
+        # start() ждёт прогрева воркеров через future.result() — в event loop
+        # это остановило бы все обработчики на время запуска процессов.
+        if self._starting is None:
+            self._starting = asyncio.Lock()
+        async with self._starting:
+            if self._pool is None:
+                await asyncio.get_running_loop().run_in_executor(None, self.start)
+
+    async def render_many(self, urls: list, use_cache: bool = True) -> list:
+        """PNG для каждого URL в том же порядке. use_cache=False — для массовой печати."""
+        return await asyncio.gather(*(self.render(url, use_cache) for url in urls))
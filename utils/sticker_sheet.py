@@ -0,0 +1,259 @@
+"""
+Печатные листы стикеров QR-Находка
+
+Раскладывает QR-коды сеткой на страницы A4 с подписью qr_id под каждым
+кодом. Страницы собираются и записываются по одной, поэтому память не
+растёт с числом кодов.
+
+CLI: python -m utils.sticker_sheet --count 500 --user-id 123 --out stickers.pdf
+"""
+import argparse
+import asyncio
+import io
+import zlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from PIL import Image, ImageDraw, ImageFont
+
+from config.config import (
+    BOT_USERNAME, DATABASE_PATH, QR_RENDER_WORKERS,
+    STICKER_COLS, STICKER_ROWS, STICKER_DPI, STICKER_MARGIN_MM,
+)
+from utils.notifications import generate_qr_url
+from utils.qr_render import pool_context, render_png, warm_worker
+
+logger = logging.getLogger(__name__)
+
+A4_MM = (210.0, 297.0)
+
+
+def _mm_to_px(mm: float, dpi: int) -> int:
+    return round(mm / 25.4 * dpi)
+
+
+def _load_font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 умеет только растровый шрифт фиксированного размера.
+        return ImageFont.load_default()
+
+
+class SheetLayout:
+    def __init__(self, cols: int = STICKER_COLS, rows: int = STICKER_ROWS,
+                 dpi: int = STICKER_DPI, margin_mm: float = STICKER_MARGIN_MM):
+        self.cols = max(1, cols)
+        self.rows = max(1, rows)
+        self.dpi  = dpi
+
+        self.page_w = _mm_to_px(A4_MM[0], dpi)
+        self.page_h = _mm_to_px(A4_MM[1], dpi)
+        self.margin = _mm_to_px(margin_mm, dpi)
+        self.cell_w = (self.page_w - 2 * self.margin) // self.cols
+        self.cell_h = (self.page_h - 2 * self.margin) // self.rows
+
+        self.label_h = max(12, self.cell_h // 8)
+        self.qr_size = max(1, min(self.cell_w, self.cell_h - self.label_h) - self.label_h // 2)
+        self.font    = _load_font(int(self.label_h * 0.7))
+
+    @property
+    def per_page(self) -> int:
+        return self.cols * self.rows
+
+    @property
+    def page_size_pt(self) -> tuple:
+        return self.page_w * 72 / self.dpi, self.page_h * 72 / self.dpi
+
+    def compose(self, stickers: list) -> Image.Image:
+        """Собрать страницу из [(qr_id, png_bytes), ...] (не больше per_page)."""
+        page = Image.new('1', (self.page_w, self.page_h), 1)
+        draw = ImageDraw.Draw(page)
+        for idx, (qr_id, png) in enumerate(stickers):
+            row, col = divmod(idx, self.cols)
+            x0 = self.margin + col * self.cell_w
+            y0 = self.margin + row * self.cell_h
+
+            qr = Image.open(io.BytesIO(png)).convert('1')
+            qr = qr.resize((self.qr_size, self.qr_size), Image.NEAREST)
+            page.paste(qr, (x0 + (self.cell_w - self.qr_size) // 2, y0))
+
+            text_w = draw.textlength(qr_id, font=self.font)
+            draw.text(
+                (x0 + (self.cell_w - text_w) / 2, y0 + self.qr_size + self.label_h // 4),
+                qr_id, fill=0, font=self.font
+            )
+        return page
+
+
+def _chunks(seq: list, size: int) -> Iterator[list]:
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def iter_pages(layout: SheetLayout, qr_ids: list,
+               render_many: Callable[[list], Iterable[bytes]]) -> Iterator[Image.Image]:
+    for chunk in _chunks(qr_ids, layout.per_page):
+        pngs = render_many([generate_qr_url(qr_id, BOT_USERNAME) for qr_id in chunk])
+        yield layout.compose(list(zip(chunk, pngs)))
+
+
+class PdfWriter:
+    """
+    Потоковая запись PDF: каждая страница — 1-битное изображение во
+    FlateDecode, в памяти держатся только смещения объектов.
+    """
+
+    def __init__(self, fileobj, page_size_pt: tuple):
+        self._out     = fileobj
+        self._size    = page_size_pt
+        self._offsets = {}
+        self._kids    = []
+        self._next_id = 3      # 1 — Catalog, 2 — Pages (пишется в конце)
+        self._written = 0
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    def add_page(self, image: Image.Image):
+        image = image.convert('1')
+        img_id, content_id, page_id = self._next_id, self._next_id + 1, self._next_id + 2
+        self._next_id += 3
+
+        data = zlib.compress(image.tobytes(), 6)
+        self._stream(img_id, (
+            f'<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} '
+            f'/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode '
+            f'/Length {len(data)} >>'
+        ).encode(), data)
+
+        w, h    = self._size
+        content = f'q {w:.2f} 0 0 {h:.2f} 0 0 cm /Im0 Do Q'.encode()
+        self._stream(content_id, f'<< /Length {len(content)} >>'.encode(), content)
+
+        self._object(page_id, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w:.2f} {h:.2f}] '
+            f'/Resources << /XObject << /Im0 {img_id} 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode())
+        self._kids.append(page_id)
+
+    def close(self):
+        kids = ' '.join(f'{k} 0 R' for k in self._kids)
+        self._object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._kids)} >>'.encode())
+
+        xref_at = self._written
+        count   = self._next_id
+        self._write(f'xref\n0 {count}\n0000000000 65535 f \n'.encode())
+        for obj_id in range(1, count):
+            self._write(f'{self._offsets[obj_id]:010d} 00000 n \n'.encode())
+        self._write(
+            f'trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n'.encode()
+        )
+
+    def _write(self, data: bytes):
+        self._out.write(data)
+        self._written += len(data)
+
+    def _object(self, obj_id: int, body: bytes):
+        self._offsets[obj_id] = self._written
+        self._write(f'{obj_id} 0 obj\n'.encode() + body + b'\nendobj\n')
+
+    def _stream(self, obj_id: int, header: bytes, data: bytes):
+        self._offsets[obj_id] = self._written
+        self._write(f'{obj_id} 0 obj\n'.encode() + header + b'\nstream\n')
+        self._write(data)
+        self._write(b'\nendstream\nendobj\n')
+
+
+class _SheetSink:
+    """Куда складываются страницы: PDF (out.pdf) или PNG-файлы (каталог)."""
+
+    def __init__(self, out: Path, layout: SheetLayout):
+        self.out    = Path(out)
+        self.layout = layout
+        self.count  = 0
+        self._file  = None
+        self._pdf   = None
+        if self.out.suffix.lower() == '.pdf':
+            self._file = open(self.out, 'wb')
+            self._pdf  = PdfWriter(self._file, layout.page_size_pt)
+        else:
+            self.out.mkdir(parents=True, exist_ok=True)
+
+    def add(self, page: Image.Image):
+        self.count += 1
+        if self._pdf:
+            self._pdf.add_page(page)
+        else:
+            dpi = (self.layout.dpi, self.layout.dpi)
+            page.save(self.out / f'sheet_{self.count:05d}.png', dpi=dpi, optimize=True)
+
+    def close(self):
+        if self._pdf:
+            self._pdf.close()
+            self._file.close()
+
+
+def write_sheets(pages: Iterable[Image.Image], out: Path, layout: SheetLayout) -> int:
+    """Записать страницы в PDF или каталог PNG. Возвращает число страниц."""
+    sink = _SheetSink(out, layout)
+    try:
+        for page in pages:
+            sink.add(page)
+    finally:
+        sink.close()
+    return sink.count
+
+
+async def build_sheets_async(qr_ids: list, out: Path, renderer,
+                             layout: SheetLayout = None) -> int:
+    """Вариант для бота: рендер через QRRenderer, сборка и запись — в потоке."""
+    layout = layout or SheetLayout()
+    loop   = asyncio.get_running_loop()
+    sink   = _SheetSink(out, layout)
+    try:
+        for chunk in _chunks(qr_ids, layout.per_page):
+            urls = [generate_qr_url(qr_id, BOT_USERNAME) for qr_id in chunk]
+            pngs = await renderer.render_many(urls, use_cache=False)
+            page = await loop.run_in_executor(None, layout.compose, list(zip(chunk, pngs)))
+            await loop.run_in_executor(None, sink.add, page)
+    finally:
+        sink.close()
+    return sink.count
+
+
+def main():
+    from database.models import Database, to_ts
+
+    parser = argparse.ArgumentParser(description='Печать листов QR-стикеров')
+    parser.add_argument('--count',   type=int, required=True, help='сколько новых QR выпустить')
+    parser.add_argument('--user-id', type=int, required=True, help='владелец выпускаемых QR')
+    parser.add_argument('--expires', default=None, type=lambda v: to_ts(v),
+                        help="срок действия, 'YYYY-MM-DD[ HH:MM:SS]'")
+    parser.add_argument('--out',     required=True, help='файл .pdf или каталог для PNG')
+    parser.add_argument('--cols',    type=int, default=STICKER_COLS)
+    parser.add_argument('--rows',    type=int, default=STICKER_ROWS)
+    parser.add_argument('--dpi',     type=int, default=STICKER_DPI)
+    parser.add_argument('--workers', type=int, default=QR_RENDER_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    db = Database(DATABASE_PATH)
+    if not db.user_exists(args.user_id):
+        parser.error(f"пользователь {args.user_id} не найден")
+    qr_ids = db.create_items_bulk(args.user_id, args.count, expires_at=args.expires)
+    db.close()
+    logger.info(f"Выпущено {len(qr_ids)} QR: {qr_ids[0]} … {qr_ids[-1]}")
+
+    layout = SheetLayout(cols=args.cols, rows=args.rows, dpi=args.dpi)
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=pool_context(),
+                             initializer=warm_worker) as pool:
+        pages = iter_pages(layout, qr_ids, lambda urls: pool.map(render_png, urls, chunksize=4))
+        count = write_sheets(pages, Path(args.out), layout)
+    logger.info(f"Записано страниц: {count} → {args.out}")
+
+
+if __name__ == '__main__':
+    main()
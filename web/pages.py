@@ -0,0 +1,128 @@
+"""
+Готовые HTTP-ответы сайта QR-Находка
+
+Page — отрендеренное тело со сжатыми вариантами (gzip, brotli при
+наличии модуля brotli) и сильными ETag; одна и та же страница отдаётся
+из памяти сколько угодно раз. respond() выбирает кодировку по
+Accept-Encoding и отвечает 304, если клиент или прокси уже видели
+эту версию.
+"""
+import gzip
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:     # необязательная зависимость: без неё отдаём только gzip
+    brotli = None
+
+# Меньшие тела не сжимаем: выигрыш меньше заголовков.
+MIN_COMPRESS_BYTES = 256
+GZIP_LEVEL         = 6
+
+# Accept-Encoding -> принятые кодировки; браузеров немного, строки повторяются.
+_ACCEPTED_CACHE_MAX = 256
+_accepted_cache     = {}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _compress(body: bytes, compress: bool) -> dict:
+    bodies = {'identity': body}
+    if compress and len(body) >= MIN_COMPRESS_BYTES:
+        bodies['gzip'] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            bodies['br'] = brotli.compress(body)
+    return bodies
+
+
+def _accepted(accept_encoding: str) -> frozenset:
+    accepted = _accepted_cache.get(accept_encoding)
+    if accepted is not None:
+        return accepted
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip())
+    accepted = frozenset(accepted)
+    if len(_accepted_cache) < _ACCEPTED_CACHE_MAX:
+        _accepted_cache[accept_encoding] = accepted
+    return accepted
+
+
+class Page:
+    """
+    Неизменяемый ответ: статус, тип, тело в нескольких кодировках.
+
+    max_age — сколько прокси и браузер могут хранить ответ; expires_ts
+    (epoch) дополнительно ограничивает его: страница действующего QR не
+    должна жить в кэше дольше самого QR. compress=False — для одноразовых
+    ответов: сжатие стоит дороже, чем передача пары килобайт.
+    """
+
+    __slots__ = ('status', 'ctype', 'bodies', 'etags', 'tags', 'max_age', 'expires_ts',
+                 'cache_control', 'last_modified')
+
+    def __init__(self, status: int, ctype: str, body: bytes, max_age: int,
+                 expires_ts: Optional[float] = None, cache_control: Optional[str] = None,
+                 last_modified: Optional[float] = None, compress: bool = True):
+        digest             = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.status        = status
+        self.ctype         = ctype
+        self.bodies        = _compress(body, compress)
+        self.etags         = {
+            coding: f'"{digest}"' if coding == 'identity' else f'"{digest}-{coding}"'
+            for coding in self.bodies
+        }
+        self.tags          = frozenset(self.etags.values())
+        self.max_age       = max_age
+        self.expires_ts    = expires_ts
+        self.cache_control = cache_control
+        self.last_modified = formatdate(last_modified, usegmt=True) if last_modified else None
+
+    @property
+    def digest(self) -> str:
+        return self.etags['identity'].strip('"')
+
+    def _cache_control(self) -> str:
+        if self.cache_control:
+            return self.cache_control
+        max_age = self.max_age
+        if self.expires_ts is not None:
+            max_age = max(0, min(max_age, int(self.expires_ts - time.time())))
+        return f'public, max-age={max_age}'
+
+    def _not_modified(self, headers: dict) -> bool:
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            # Слабое сравнение (RFC 9110, 13.1.2): W/ и суффикс кодировки не важны.
+            tags = {tag.strip() for tag in if_none_match.split(',')}
+            tags = {tag[2:] if tag.startswith('W/') else tag for tag in tags}
+            return '*' in tags or not self.tags.isdisjoint(tags)
+        since = headers.get('if-modified-since')
+        if since and self.last_modified:
+            try:
+                return parsedate_to_datetime(since) >= parsedate_to_datetime(self.last_modified)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def respond(self, headers: dict) -> tuple:
+        """(status, content_type, body, extra_headers) для HttpServer."""
+        accepted = _accepted(headers.get('accept-encoding', ''))
+        coding   = next((c for c in ('br', 'gzip') if c in accepted and c in self.bodies), 'identity')
+        extra    = {'ETag': self.etags[coding], 'Cache-Control': self._cache_control()}
+        if len(self.bodies) > 1:
+            extra['Vary'] = 'Accept-Encoding'
+        if coding != 'identity':
+            extra['Content-Encoding'] = coding
+        if self.last_modified:
+            extra['Last-Modified'] = self.last_modified
+        if self.status == 200 and self._not_modified(headers):
+            extra.pop('Content-Encoding', None)
+            return 304, self.ctype, b'', extra
+        return self.status, self.ctype, self.bodies[coding], extra
@@ -1,13 +1,44 @@
 """
 Веб-сервер для QR-Находка
 Показывает страницу при сканировании QR-кода
+
+Асинхронный HTTP/1.1 с keep-alive (тот же HttpServer, что принимает webhook
+бота), база — через AsyncDatabase: существование и срок QR почти всегда
+решаются фильтром qr_id и индексом сканирований без похода в SQLite.
+Несколько процессов (WEB_WORKERS) слушают один порт через SO_REUSEPORT.
+
+Страница QR рендерится один раз на состояние кода (действует до такого-то
+срока / не найден) и дальше отдаётся из памяти уже сжатой, с ETag и
+Cache-Control — повторные сканы получают 304 или ответ CDN. Состояние
+берётся из индекса сканирований, поэтому выпуск, удаление и истечение QR
+сами меняют ключ кэша; изменения из бота процесс подхватывает из журнала
+qr_changes раз в SCAN_INDEX_SYNC_INTERVAL. Статика отдаётся по адресам с хэшем содержимого
+(style.<hash>.css) с immutable-кэшированием.
+
+Запуск: python -m web.server [--host HOST] [--port PORT] [--workers N]
 """
-from flask import Flask, render_template, jsonify, request, redirect, url_for
-from flask_cors import CORS
+import argparse
+import asyncio
+import html
+import json
 import logging
+import multiprocessing
+import signal
+from pathlib import Path
+from string import Template
+from typing import Optional
+from urllib.parse import unquote
 
-from config.config import WEB_HOST, WEB_PORT, DATABASE_PATH, BOT_USERNAME, ITEM_TYPES
-from database.models import Database
+from bot.webhook import HttpServer
+from config.config import (
+    WEB_HOST, WEB_PORT, WEB_WORKERS, WEB_PAGE_MAX_AGE, WEB_PAGE_CACHE_MAX,
+    DATABASE_PATH, BOT_USERNAME, SCAN_INDEX_SYNC_INTERVAL, STATS_CACHE_TTL,
+)
+from database.async_db import AsyncDatabase
+from database.models import Database, format_ts
+from database.qr_ids import is_well_formed
+from utils.cache import MISS, TTLCache
+from web.pages import IMMUTABLE, Page
 
 
 logging.basicConfig(
@@ -17,95 +48,242 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-app = Flask(__name__, 
-            template_folder='../templates',
-            static_folder='../static')
-CORS(app)
-
-
-db = Database(DATABASE_PATH)
-
-
-@app.route('/')
-def index():
-    """Главная страница"""
-    stats = db.get_statistics()
-    return render_template('index.html', stats=stats, bot_username=BOT_USERNAME)
-
-
-@app.route('/found/<qr_id>')
-def found_item(qr_id):
-    """Страница найденной вещи"""
-    qr_id = qr_id.upper()
-    
-    
-    item = db.get_item_by_qr(qr_id)
-    
-    if not item:
-        return render_template('not_found.html', qr_id=qr_id, bot_username=BOT_USERNAME)
-    
-    
-    emoji = ITEM_TYPES.get(item['item_type'], '📦')
-    
-    
-    bot_link = f"https://t.me/{BOT_USERNAME}?start=found_{qr_id}"
-    
-    return render_template('found.html', 
-                         item=item, 
-                         emoji=emoji,
-                         bot_link=bot_link,
-                         qr_id=qr_id)
-
-
-@app.route('/api/item/<qr_id>')
-def get_item(qr_id):
-    """API для получения информации о вещи"""
-    qr_id = qr_id.upper()
-    item = db.get_item_by_qr(qr_id)
-    
-    if not item:
-        return jsonify({'error': 'Item not found'}), 404
-    
-    return jsonify({
-        'qr_id': item['qr_id'],
-        'name': item['name'],
-        'type': item['item_type'],
-        'emoji': ITEM_TYPES.get(item['item_type'], '📦'),
-        'bot_username': BOT_USERNAME
-    })
-
-
-@app.route('/api/stats')
-def get_stats():
-    """API для получения статистики"""
-    stats = db.get_statistics()
-    return jsonify(stats)
-
-
-@app.route('/qr/<qr_id>')
-def qr_redirect(qr_id):
-    """Редирект для коротких ссылок"""
-    return redirect(url_for('found_item', qr_id=qr_id))
-
-
-@app.errorhandler(404)
-def not_found(error):
-    """Обработка 404 ошибки"""
-    return render_template('404.html'), 404
-
-
-@app.errorhandler(500)
-def internal_error(error):
-    """Обработка 500 ошибки"""
-    logger.error(f"Internal error: {error}")
-    return render_template('500.html'), 500
-
-
-def run_web_server():
+STATIC_DIR = Path(__file__).resolve().parent / 'static'
+
+HTML = 'text/html; charset=utf-8'
+JSON = 'application/json; charset=utf-8'
+TEXT = 'text/plain; charset=utf-8'
+
+STATIC_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js':  'application/javascript; charset=utf-8',
+    '.png': 'image/png',
+    '.svg': 'image/svg+xml',
+    '.ico': 'image/x-icon',
+}
+
+MAX_QR_ID_LENGTH  = 32
+NOT_FOUND_MAX_AGE = 30          # сек: код могут выпустить позже
+STATIC_MAX_AGE    = 3600        # сек, для адресов без хэша
+REDIRECT_MAX_AGE  = 86400       # сек, /qr/<id> -> /found/<id> не меняется
+
+
+def _json(status: int, data: dict, max_age: int, expires_ts: Optional[float] = None) -> Page:
+    return Page(status, JSON, json.dumps(data, ensure_ascii=False).encode(), max_age, expires_ts)
+
+
+class ScanSite:
+    """Маршруты сайта: страницы сканирования, API и статика."""
+
+    def __init__(self, db: AsyncDatabase, bot_username: str = BOT_USERNAME,
+                 page_cache_max: int = WEB_PAGE_CACHE_MAX, page_max_age: int = WEB_PAGE_MAX_AGE):
+        self.db           = db
+        self.bot_username = bot_username
+        self.page_max_age = page_max_age
+        # Ключ — (qr_id, expires_at) действующего кода; срок жизни записи
+        # только ограничивает память, актуальность обеспечивает ключ.
+        self.pages        = TTLCache(page_cache_max, ttl=3600)
+        # Главная и /api/stats показывают статистику — живут столько же, сколько её снимок.
+        self.summaries    = TTLCache(2, ttl=STATS_CACHE_TTL)
+        self.static       = {}
+        self.templates    = {}
+        self._load_static()
+
+    def _load_static(self):
+        # Статики немного — держим в памяти, путь ищется в словаре (без обхода ФС).
+        renamed = {}
+        for path in sorted(STATIC_DIR.rglob('*')):
+            if path.suffix not in STATIC_TYPES:
+                continue
+            url   = '/static/' + path.relative_to(STATIC_DIR).as_posix()
+            data  = path.read_bytes()
+            mtime = path.stat().st_mtime
+            plain = Page(200, STATIC_TYPES[path.suffix], data, STATIC_MAX_AGE, last_modified=mtime)
+            fixed = url[:-len(path.suffix)] + f'.{plain.digest[:10]}{path.suffix}'
+            self.static[url]   = plain
+            self.static[fixed] = Page(200, STATIC_TYPES[path.suffix], data, 0,
+                                      cache_control=IMMUTABLE, last_modified=mtime)
+            renamed[url] = fixed
+
+        for path in (STATIC_DIR / 'html').glob('*.html'):
+            text = path.read_text(encoding='utf-8')
+            for url, fixed in renamed.items():
+                text = text.replace(url, fixed)
+            self.templates[path.stem] = Template(text)
+
+    def bot_link(self, qr_id: str) -> str:
+        return f"https://t.me/{self.bot_username}?start=found_{qr_id}"
+
+    def _render(self, name: str, **values) -> bytes:
+        values = {key: html.escape(str(value)) for key, value in values.items()}
+        return self.templates[name].safe_substitute(bot_username=self.bot_username, **values).encode()
+
+    async def handle(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if method not in ('GET', 'HEAD'):
+            return 405, TEXT, b''
+        path = unquote(path.split('?', 1)[0])
+
+        if path == '/healthz':
+            return 200, TEXT, b'ok'
+        if path.startswith('/qr/') and len(path) > 4:
+            # qr_id уходит в заголовок Location — только выданный формат.
+            qr_id = path[4:].upper()
+            if not is_well_formed(qr_id):
+                return 404, TEXT, 'Страница не найдена'.encode()
+            return 302, TEXT, b'', {
+                'Location':      f'/found/{qr_id}',
+                'Cache-Control': f'public, max-age={REDIRECT_MAX_AGE}',
+            }
+        page = self.static.get(path)
+        if page is None:
+            page = await self.route(path)
+        if page is None:
+            return 404, TEXT, 'Страница не найдена'.encode()
+        return page.respond(headers)
+
+    async def route(self, path: str) -> Optional[Page]:
+        if path == '/':
+            return await self.index()
+        if path == '/api/stats':
+            return await self.api_stats()
+
+        prefix, _, qr_id = path.rpartition('/')
+        qr_id = qr_id.upper()[:MAX_QR_ID_LENGTH]
+        if not qr_id:
+            return None
+        if prefix == '/found':
+            return await self.found(qr_id)
+        if prefix == '/api/item':
+            return await self.api_item(qr_id)
+        return None
+
+    async def index(self) -> Page:
+        """Главная страница"""
+        page = self.summaries.get('index')
+        if page is MISS:
+            stats = await self.db.get_statistics()
+            page  = Page(200, HTML, self._render('index', **stats), self.page_max_age)
+            self.summaries.put('index', page)
+        return page
+
+    async def api_stats(self) -> Page:
+        """API статистики"""
+        page = self.summaries.get('stats')
+        if page is MISS:
+            page = _json(200, await self.db.get_statistics(), self.page_max_age)
+            self.summaries.put('stats', page)
+        return page
+
+    async def found(self, qr_id: str) -> Page:
+        """Страница найденной вещи"""
+        record = await self.db.lookup_qr(qr_id)
+        if record is None or record.is_expired():
+            # Несуществующие коды не кэшируем и не сжимаем: их поток не должен
+            # ни вытеснять настоящие страницы, ни занимать процессор.
+            return Page(404, HTML, self._render('not_found', qr_id=qr_id), NOT_FOUND_MAX_AGE,
+                        compress=False)
+
+        key  = (qr_id, record.expires_at)
+        page = self.pages.get(key)
+        if page is MISS:
+            page = Page(
+                200, HTML, self._render('found', qr_id=qr_id, bot_link=self.bot_link(qr_id)),
+                self.page_max_age, record.expires_at,
+            )
+            self.pages.put(key, page)
+        return page
+
+    async def api_item(self, qr_id: str) -> Page:
+        """API для получения информации о QR"""
+        record = await self.db.lookup_qr(qr_id)
+        if record is None:
+            return _json(404, {'error': 'Item not found'}, NOT_FOUND_MAX_AGE)
+        return _json(200, {
+            'qr_id':        qr_id,
+            'active':       not record.is_expired(),
+            'expires_at':   format_ts(record.expires_at, '%Y-%m-%d %H:%M:%S') or None,
+            'bot_link':     self.bot_link(qr_id),
+            'bot_username': self.bot_username,
+        }, self.page_max_age, None if record.is_expired() else record.expires_at)
+
+
+async def serve(stop: asyncio.Event, host: str = WEB_HOST, port: int = WEB_PORT,
+                db_path=DATABASE_PATH, reuse_port: bool = False) -> None:
+    """Один процесс веб-сервера — до установки stop."""
+    sync_db = Database(db_path)
+    sync_db.build_qr_filter()
+    sync_db.warm_scan_index()
+    db     = AsyncDatabase(sync_db)
+    server = HttpServer(ScanSite(db).handle, host, port, reuse_port)
+    await server.start()
+    logger.info(f"Веб-процесс слушает {host}:{server.port}")
+    sync = None
+    if SCAN_INDEX_SYNC_INTERVAL > 0:
+        sync = asyncio.create_task(_sync_scan_index(db, SCAN_INDEX_SYNC_INTERVAL), name='scan-sync')
+    try:
+        await stop.wait()
+    finally:
+        if sync is not None:
+            sync.cancel()
+            await asyncio.gather(sync, return_exceptions=True)
+        await server.stop()
+        db.close()
+
+
+async def _sync_scan_index(db: AsyncDatabase, interval: float):
+    """Сбрасывать в индексе сканирований коды, изменённые ботом."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await db.sync_scan_index()
+        except Exception as e:
+            logger.error(f"Ошибка чтения журнала qr_changes: {e}")
+
+
+def _run_worker(host: str, port: int, db_path, reuse_port: bool):
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await serve(stop, host, port, db_path, reuse_port)
+    asyncio.run(main())
+
+
+def run_web_server(host: str = WEB_HOST, port: int = WEB_PORT,
+                   workers: int = WEB_WORKERS, db_path=DATABASE_PATH):
     """Запуск веб-сервера"""
-    logger.info(f"🌐 Веб-сервер запущен на http://{WEB_HOST}:{WEB_PORT}")
-    app.run(host=WEB_HOST, port=WEB_PORT, debug=False)
+    logger.info(f"🌐 Веб-сервер запущен на http://{host}:{port} ({workers} процессов)")
+    if workers <= 1:
+        _run_worker(host, port, db_path, False)
+        return
+
+    # Миграции — один раз, до запуска воркеров.
+    Database(db_path).close()
+    procs = [
+        multiprocessing.Process(target=_run_worker, args=(host, port, db_path, True), name=f'web-{i}')
+        for i in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    signal.signal(signal.SIGTERM, lambda *_: [proc.terminate() for proc in procs])
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in procs:
+            proc.join()
 
 
 if __name__ == '__main__':
-    run_web_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Страница сканирования QR-Находка')
+    parser.add_argument('--host',    default=WEB_HOST)
+    parser.add_argument('--port',    type=int, default=WEB_PORT)
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS)
+    args = parser.parse_args()
+    run_web_server(args.host, args.port, args.workers)